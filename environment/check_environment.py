@@ -51,6 +51,7 @@ def main():
     # Core Python dependencies
     ok &= check_import("numpy")
     ok &= check_import("pandas")
+    ok &= check_import("pyarrow")
     ok &= check_import("scipy")
     ok &= check_import("Bio")
     ok &= check_import("rdkit")
@@ -62,6 +63,7 @@ def main():
     # Optional Python tools (reported, not enforced)
     check_import("pymol")
     check_import("posebusters")
+    check_import("meeko")
 
     print("\n--- External dependencies ---")
     check_binary("vina")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Throughput benchmark of the CompoundUniqifier on synthetic catalogues.
+
+Builds a Chemspace/Molport-like CSV (catalogue ids, SMILES with repeated
+compounds, equivalent SMILES spellings and a few unparsable entries), runs
+compounduniqifier.uniqify with the given process counts and reports rows per
+second. Up to --naive_max_rows it also runs the in-memory version (read the
+whole CSV, one process, drop_duplicates) and checks that both write the same
+file. With --reference_rows it then times the -r reference join against a
+reference of that many InChIKeys (half of the catalogue's compounds, padded
+with random keys), once building the key index and once reusing it, and
+checks the result against the filtered deduplicated output.
+"""
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from compounduniqifier import uniqify, KEY_COLUMNS
+from vs_common.inchikey import smiles_to_inchi
+
+FRAGMENTS = [
+    "C", "CC", "N", "O", "S", "C(=O)", "C(F)", "C(Cl)", "C(C)(C)", "c1ccccc1", "c1ccncc1",
+    "C1CC1", "C1CCOC1", "N(C)", "C(=O)N", "OC", "C#C", "C=C", "c1ccc(F)cc1", "C(O)",
+]
+
+
+def synthetic_catalogue(path, n_rows, n_compounds, invalid_fraction, rng):
+    """CSV with n_rows rows drawn from about n_compounds fragment SMILES."""
+    parts = rng.integers(0, len(FRAGMENTS), size=(n_compounds, 4))
+    pool = np.array(["".join(FRAGMENTS[i] for i in row) for row in parts], dtype=object)
+    smiles = pool[rng.integers(0, n_compounds, n_rows)]
+    smiles[rng.random(n_rows) < invalid_fraction] = "C1CC(N"
+    pd.DataFrame({
+        "ID": [f"CAT-{i:09d}" for i in range(n_rows)],
+        "SMILES": smiles,
+        "Supplier": rng.choice(np.array(["Chemspace", "Molport"], dtype=object), n_rows),
+        "Price": rng.integers(10, 500, n_rows).astype(str),
+    }).to_csv(path, index=False)
+
+
+def naive_uniqify(input_file, output_file):
+    from rdkit import RDLogger
+    RDLogger.DisableLog("rdApp.*")
+    df = pd.read_csv(input_file, dtype=str, keep_default_na=False)
+    keys = pd.DataFrame([smiles_to_inchi(s) for s in df["SMILES"]], columns=KEY_COLUMNS, index=df.index)
+    df = pd.concat([df, keys], axis=1).dropna(subset=["InChIKey"]).drop_duplicates("InChIKey")
+    df.to_csv(output_file, index=False)
+
+
+def synthetic_reference(path, uniqified_file, n_keys, rng):
+    """Reference CSV with half of the uniqified InChIKeys and random keys up to n_keys."""
+    keys = pd.read_csv(uniqified_file, usecols=["InChIKey"], dtype=str)["InChIKey"]
+    keys = keys.sample(frac=0.5, random_state=1).to_numpy()[:n_keys]
+    letters = rng.integers(65, 91, size=(max(0, n_keys - len(keys)), 25), dtype=np.uint8)
+    padding = pd.Series(letters.view("S25").ravel().astype(str), dtype=object)
+    padding = padding.str[:14] + "-" + padding.str[14:24] + "-" + padding.str[24:]
+    pd.DataFrame({"InChIKey": np.concatenate([keys, padding.to_numpy()])}).to_csv(path, index=False)
+    return set(keys)
+
+
+def same_output(path_a, path_b):
+    with open(path_a) as a, open(path_b) as b:
+        return a.read() == b.read()
+
+
+def run(n_rows, args, rng, workdir):
+    input_file = os.path.join(workdir, f"catalogue_{n_rows}.csv")
+    synthetic_catalogue(input_file, n_rows, max(1, int(n_rows * args.unique_fraction)), args.invalid_fraction, rng)
+    size_mb = os.path.getsize(input_file) / 2 ** 20
+    print(f"\n{n_rows} rows ({size_mb:.1f} MB)")
+
+    outputs = []
+    for processes in args.processes:
+        output_file = os.path.join(workdir, f"uniqified_{n_rows}_{processes}.csv")
+        options = uniqifier_options(args, processes, workdir)
+        start = time.perf_counter()
+        _, n_written = uniqify(input_file, output_file, options)
+        elapsed = time.perf_counter() - start
+        print(f"  {f'{processes} processes':<16} {elapsed:9.3f} s  {n_rows / elapsed:10.0f} rows/s  {n_written} unique")
+        outputs.append(output_file)
+
+    if args.reference_rows:
+        run_reference_join(input_file, outputs[0], n_rows, args, rng, workdir)
+
+    if n_rows > args.naive_max_rows:
+        print(f"  {'in-memory':<16} skipped (more than {args.naive_max_rows} rows)")
+        return
+    naive_file = os.path.join(workdir, f"naive_{n_rows}.csv")
+    start = time.perf_counter()
+    naive_uniqify(input_file, naive_file)
+    elapsed = time.perf_counter() - start
+    identical = all(same_output(naive_file, output) for output in outputs)
+    print(f"  {'in-memory':<16} {elapsed:9.3f} s  {n_rows / elapsed:10.0f} rows/s  identical output: {identical}")
+
+
+def uniqifier_options(args, processes, workdir, reference=None):
+    return argparse.Namespace(
+        smiles_column="SMILES", processes=processes, chunk_size=args.chunk_size, task_size=args.task_size,
+        partitions=args.partitions, partition_mb=256, tmp_dir=workdir, reference=reference,
+        reference_index=None, bloom_bits=args.bloom_bits
+    )
+
+
+def run_reference_join(input_file, uniqified_file, n_rows, args, rng, workdir):
+    reference_file = os.path.join(workdir, f"reference_{n_rows}.csv")
+    kept = synthetic_reference(reference_file, uniqified_file, args.reference_rows, rng)
+    expected = pd.read_csv(uniqified_file, dtype=str, keep_default_na=False)
+    expected = expected[expected["InChIKey"].isin(kept)].reset_index(drop=True)
+
+    output_file = os.path.join(workdir, f"joined_{n_rows}.csv")
+    options = uniqifier_options(args, args.processes[-1], workdir, reference_file)
+    for label in ("-r, new index", "-r, cached index"):
+        start = time.perf_counter()
+        _, n_written = uniqify(input_file, output_file, options)
+        elapsed = time.perf_counter() - start
+        joined = pd.read_csv(output_file, dtype=str, keep_default_na=False)
+        print(f"  {label:<16} {elapsed:9.3f} s  {n_rows / elapsed:10.0f} rows/s  {n_written} kept  "
+              f"correct: {joined.equals(expected)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CompoundUniqifier")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="Catalogue sizes to test")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, os.cpu_count()],
+                        help="Process counts to test")
+    parser.add_argument("--unique_fraction", type=float, default=0.5,
+                        help="Distinct SMILES as a fraction of the rows")
+    parser.add_argument("--invalid_fraction", type=float, default=0.001, help="Fraction of unparsable SMILES")
+    parser.add_argument("--chunk_size", type=int, default=200000)
+    parser.add_argument("--task_size", type=int, default=5000)
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--reference_rows", type=int, default=0,
+                        help="Also time the -r join against a reference of this many InChIKeys")
+    parser.add_argument("--bloom_bits", type=int, default=10, help="Bloom filter bits per reference key")
+    parser.add_argument("--naive_max_rows", type=int, default=100000,
+                        help="Only run the in-memory version up to this many rows")
+    parser.add_argument("--tmp_dir", default=None, help="Directory for the synthetic catalogues")
+    parser.add_argument("--seed", type=int, default=1698)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as workdir:
+        for n_rows in args.rows:
+            run(n_rows, args, rng, workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""CompoundUniqifier: SMILES -> InChI / InChIKey and deduplication of compound catalogues.
+
+Merged Chemspace/Molport catalogues have tens to hundreds of millions of rows,
+so nothing here holds the whole catalogue in memory:
+
+1. The input CSV is read in chunks and the InChI and InChIKey of every chunk
+   are computed on a process pool while the next chunk is read. The keys are
+   appended to a spill file in input order, and (row, InChIKey) pairs go to
+   hash partitions on disk, so all rows with the same key land in the same
+   partition.
+2. Each partition is deduplicated on its own and marks the first row of every
+   InChIKey in a keep mask (one byte per input row).
+3. The input and the spill file are read again in lockstep and the marked rows
+   are written with their InChI and InChIKey, as CSV or Parquet depending on
+   the output extension.
+
+The output is the input in its original order without repeated InChIKeys,
+i.e. what drop_duplicates("InChIKey") would give on the whole table. Rows
+whose SMILES cannot be parsed are dropped.
+
+With -r only compounds whose InChIKey is in the reference dataset are kept.
+The reference InChIKeys are written once to a compact on-disk index
+(vs_common/key_index.py: sorted keys plus a Bloom filter, reused while the
+reference file is unchanged), and every input chunk is tested against it in
+pass 1, so neither side of the join has to fit in memory and rows that are
+not in the reference never reach the partitions.
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from vs_common.inchikey import smiles_to_inchi
+from vs_common.key_index import load_key_index
+
+KEY_COLUMNS = ["InChI", "InChIKey"]
+
+logger = logging.getLogger("compounduniqifier")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="CompoundUniqifier")
+    parser.add_argument("-i", "--input", required=True, help="Input CSV with a SMILES column")
+    parser.add_argument("-o", "--output", required=True, help="Output file (.csv or .parquet)")
+    parser.add_argument("-r", "--reference", default=None,
+                        help="Reference CSV; only compounds whose InChIKey is in it are kept")
+    parser.add_argument("--reference_index", default=None,
+                        help="Key index of the reference (default: <reference>.keyidx, rebuilt when the reference changes)")
+    parser.add_argument("--bloom_bits", type=int, default=10,
+                        help="Bloom filter bits per reference key in a new key index (0: sorted keys only)")
+    parser.add_argument("--smiles_column", default="SMILES", help="Name of the SMILES column (case-insensitive)")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Processes used to compute InChI/InChIKey (default: one per CPU)")
+    parser.add_argument("--chunk_size", type=int, default=200000, help="Rows read from the input at a time")
+    parser.add_argument("--task_size", type=int, default=5000, help="SMILES per process pool task")
+    parser.add_argument("--partitions", type=int, default=None,
+                        help="Number of on-disk key partitions (default: from the input size and --partition_mb)")
+    parser.add_argument("--partition_mb", type=int, default=256,
+                        help="Input megabytes per key partition when --partitions is not set")
+    parser.add_argument("--tmp_dir", default=None, help="Directory for the spill and partition files")
+    return parser.parse_args()
+
+
+def inchi_chunk(smiles):
+    from rdkit import RDLogger
+    RDLogger.DisableLog("rdApp.*")
+    return [smiles_to_inchi(s) for s in smiles]
+
+
+def read_chunks(path, chunk_size, usecols=None):
+    """The CSV in chunks of strings, so values are written back exactly as read."""
+    return pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False, usecols=usecols)
+
+
+def find_column(path, name):
+    columns = pd.read_csv(path, nrows=0).columns
+    for column in columns:
+        if column.lower() == name.lower():
+            return column
+    raise ValueError(f"{path} has no {name} column (columns: {', '.join(columns)})")
+
+
+def partition_of(keys, n_partitions):
+    """Partition index of every key; stable across runs and processes."""
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy() % np.uint64(n_partitions)
+
+
+class KeyPool:
+    """InChI/InChIKey of SMILES chunks on a process pool, finished in submission order.
+
+    Up to `depth` chunks are in flight, so the pool works on one chunk while
+    the caller reads the next one and writes the previous one.
+    """
+
+    def __init__(self, processes=None, task_size=5000, depth=2):
+        self.task_size = task_size
+        self.depth = depth
+        self._executor = ProcessPoolExecutor(max_workers=processes)
+        self._pending = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._executor.shutdown(cancel_futures=True)
+
+    def submit(self, smiles, payload=None):
+        """Queue a list of SMILES; yields (payload, [(inchi, key), ...]) of the chunks that are done."""
+        futures = [
+            self._executor.submit(inchi_chunk, smiles[i:i + self.task_size])
+            for i in range(0, len(smiles), self.task_size)
+        ]
+        self._pending.append((payload, futures))
+        while len(self._pending) > self.depth:
+            yield self._finish()
+
+    def drain(self):
+        while self._pending:
+            yield self._finish()
+
+    def _finish(self):
+        payload, futures = self._pending.popleft()
+        return payload, [pair for future in futures for pair in future.result()]
+
+
+def compute_keys(input_file, smiles_column, workdir, n_partitions, args, reference=None):
+    """Pass 1: spill the InChI/InChIKey of every row and partition (row, InChIKey) by key.
+
+    With a reference KeyIndex only rows whose InChIKey is in it are partitioned.
+    Returns (rows, rows with an unparsable SMILES, rows not in the reference).
+    """
+    spill_file = os.path.join(workdir, "keys.csv")
+    partition_files = [open(os.path.join(workdir, f"part_{p:04d}.csv"), "w") for p in range(n_partitions)]
+    pd.DataFrame(columns=KEY_COLUMNS).to_csv(spill_file, index=False)
+    n_rows = n_invalid = n_unmatched = 0
+
+    def write(offset, pairs):
+        nonlocal n_invalid, n_unmatched
+        keys = pd.DataFrame(pairs, columns=KEY_COLUMNS)
+        keys.to_csv(spill_file, mode="a", header=False, index=False)
+
+        valid = keys["InChIKey"].notna().to_numpy()
+        n_invalid += int((~valid).sum())
+        if reference is not None:
+            matched = reference.contains(keys["InChIKey"])
+            n_unmatched += int((valid & ~matched).sum())
+            valid = valid & matched
+        rows = pd.DataFrame({"row": np.flatnonzero(valid) + offset, "InChIKey": keys["InChIKey"].to_numpy()[valid]})
+        for p, part in rows.groupby(partition_of(rows["InChIKey"], n_partitions)):
+            part.to_csv(partition_files[p], header=False, index=False)
+
+    try:
+        with KeyPool(args.processes, args.task_size) as pool:
+            for chunk in read_chunks(input_file, args.chunk_size, usecols=[smiles_column]):
+                for offset, pairs in pool.submit(chunk[smiles_column].tolist(), n_rows):
+                    write(offset, pairs)
+                n_rows += len(chunk)
+                logger.info(f"Read {n_rows} rows")
+            for offset, pairs in pool.drain():
+                write(offset, pairs)
+    finally:
+        for f in partition_files:
+            f.close()
+    return n_rows, n_invalid, n_unmatched
+
+
+def first_occurrences(workdir, n_partitions, n_rows):
+    """Pass 2: keep mask with the first row of every InChIKey set, one partition at a time."""
+    keep = np.zeros(n_rows, dtype=bool)
+    for p in range(n_partitions):
+        path = os.path.join(workdir, f"part_{p:04d}.csv")
+        if os.path.getsize(path) == 0:
+            continue
+        part = pd.read_csv(path, header=None, names=["row", "InChIKey"], dtype={"row": np.int64, "InChIKey": str})
+        first = part.sort_values("row", kind="stable").drop_duplicates("InChIKey")["row"].to_numpy()
+        keep[first] = True
+        os.remove(path)
+    return keep
+
+
+def reference_key_chunks(reference_file, column, from_smiles, args):
+    """Chunks of reference InChIKeys: the InChIKey column, or keys computed from the SMILES column."""
+    if not from_smiles:
+        for chunk in read_chunks(reference_file, args.chunk_size, usecols=[column]):
+            yield chunk[column]
+        return
+
+    with KeyPool(args.processes, args.task_size) as pool:
+        for chunk in read_chunks(reference_file, args.chunk_size, usecols=[column]):
+            for _, pairs in pool.submit(chunk[column].tolist()):
+                yield [key for _, key in pairs]
+        for _, pairs in pool.drain():
+            yield [key for _, key in pairs]
+
+
+def load_reference_index(reference_file, args):
+    """KeyIndex of the reference InChIKeys, built on first use and reused while the reference is unchanged."""
+    try:
+        column, from_smiles = find_column(reference_file, "InChIKey"), False
+    except ValueError:
+        column, from_smiles = find_column(reference_file, args.smiles_column), True
+    return load_key_index(
+        reference_file,
+        lambda: reference_key_chunks(reference_file, column, from_smiles, args),
+        source=f"{'smiles' if from_smiles else 'inchikey'}:{column}",
+        index_file=args.reference_index,
+        bloom_bits=args.bloom_bits,
+        tmp_dir=args.tmp_dir,
+    )
+
+
+class TableWriter:
+    """Appends chunks of string columns to a CSV file, or to a Parquet file if the name ends in .parquet."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.lower().endswith((".parquet", ".pq"))
+        self._writer = None
+        self._header = True
+        output_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(output_dir, exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(self, df):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._writer is None:
+                schema = pa.schema([(str(column), pa.string()) for column in df.columns])
+                self._writer = pq.ParquetWriter(self.path, schema)
+            self._writer.write_table(pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False))
+        else:
+            df.to_csv(self.path, mode="a", header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def write_output(input_file, workdir, keep, output_file, chunk_size):
+    """Pass 3: the kept rows of the input with their InChI and InChIKey, in input order."""
+    spill = read_chunks(os.path.join(workdir, "keys.csv"), chunk_size)
+    writer = TableWriter(output_file)
+    offset = n_written = 0
+    empty = None
+    try:
+        for chunk, keys in zip(read_chunks(input_file, chunk_size), spill):
+            if len(chunk) != len(keys):
+                raise RuntimeError(f"Spill file out of step with {input_file} at row {offset}")
+            mask = keep[offset:offset + len(chunk)]
+            offset += len(chunk)
+
+            rows = chunk.drop(columns=KEY_COLUMNS, errors="ignore")
+            rows = pd.concat([rows, keys.set_index(rows.index)], axis=1)[mask]
+            if len(rows):
+                writer.write(rows)
+            elif empty is None:
+                empty = rows
+            n_written += len(rows)
+        if n_written == 0:
+            if empty is None:
+                columns = pd.read_csv(input_file, nrows=0).columns.drop(KEY_COLUMNS, errors="ignore")
+                empty = pd.DataFrame(columns=[*columns, *KEY_COLUMNS])
+            writer.write(empty)
+    finally:
+        writer.close()
+    return n_written
+
+
+def uniqify(input_file, output_file, args):
+    smiles_column = find_column(input_file, args.smiles_column)
+    n_partitions = args.partitions or max(1, -(-os.path.getsize(input_file) // (args.partition_mb << 20)))
+    reference = None
+    if args.reference:
+        reference = load_reference_index(args.reference, args)
+        logger.info(f"{len(reference)} reference InChIKeys in {reference.index_file}")
+
+    workdir = tempfile.mkdtemp(prefix="compounduniqifier_", dir=args.tmp_dir)
+    try:
+        n_rows, n_invalid, n_unmatched = compute_keys(input_file, smiles_column, workdir, n_partitions, args, reference)
+        keep = first_occurrences(workdir, n_partitions, n_rows)
+        n_unique = int(keep.sum())
+        n_written = write_output(input_file, workdir, keep, output_file, args.chunk_size)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if reference is not None:
+        logger.info(f"{n_unmatched} rows not in the reference")
+    logger.info(f"{n_rows} rows, {n_invalid} unparsable SMILES, {n_unique} unique InChIKeys, "
+                f"{n_written} rows written to {output_file}")
+    return n_rows, n_written
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_arguments()
+    start_time = time.time()
+    n_rows, _ = uniqify(args.input, args.output, args)
+    elapsed = time.time() - start_time
+    print(f"File '{args.output}' created in {elapsed:.3f} seconds ({n_rows / max(elapsed, 1e-9):.0f} rows/s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Benchmark the ChEMBL one-row-per-compound widening on synthetic activity tables.
+
+Compares the original per-group pd.concat loop of saruniqifier_chembl.py with
+widen_groups (cumcount + one unstack) and checks that both write the same CSV.
+"""
+import io
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from saruniqifier_chembl import widen_groups
+
+KEY = 'InChI Key - Main'
+
+
+def synthetic_activities(n_rows, n_columns, mean_group, max_group, rng):
+    """Activity table with ChEMBL-like column types and geometric group sizes."""
+    sizes = np.minimum(rng.geometric(1.0 / mean_group, n_rows), max_group)
+    sizes = sizes[:np.searchsorted(np.cumsum(sizes), n_rows) + 1]
+    keys = np.repeat(np.array([f'{i:014d}' for i in range(len(sizes))], dtype=object), sizes)[:n_rows]
+    rng.shuffle(keys)
+
+    df = pd.DataFrame({
+        'Molecule Chembl Id': [f'CHEMBL{i}' for i in range(n_rows)],
+        KEY: keys,
+        'Standard Relation': rng.choice(np.array(['=', '<', '>'], dtype=object), n_rows),
+        'Standard Value': np.where(rng.random(n_rows) < 0.05, np.nan, rng.random(n_rows) * 1e4),
+        'Standard Units': rng.choice(np.array(['nM', 'uM', None], dtype=object), n_rows),
+        'Activity Comment': rng.choice(np.array([None, 'active', 'inactive'], dtype=object), n_rows),
+    })
+    for i in range(len(df.columns), n_columns):
+        df[f'Assay Field {i}'] = rng.integers(0, 100, n_rows)
+    df.loc[rng.random(n_rows) < 0.001, KEY] = np.nan
+    return df
+
+
+def legacy_widen(chembl):
+    groups = chembl.groupby(KEY)
+    new_rows = []
+
+    for _, group in groups:
+        new_row = group.iloc[0].copy()
+        for i in range(1, len(group)):
+            row = group.iloc[i]
+            row.index = [f'{col}_{i}' for col in row.index]
+            new_row = pd.concat([new_row, row])
+        new_rows.append(new_row)
+
+    new_chembl = pd.DataFrame(new_rows)
+    new_chembl.reset_index(drop=True, inplace=True)
+    return new_chembl
+
+
+def to_csv_text(df):
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run(n_rows, args, rng):
+    df = synthetic_activities(n_rows, args.columns, args.mean_group, args.max_group, rng)
+    print(f"\n{n_rows} activities, {df[KEY].nunique()} compounds, largest group {df[KEY].value_counts().max()}")
+
+    elapsed, wide = timed(widen_groups, df, KEY)
+    print(f"  {'cumcount + unstack':<20} {elapsed:9.3f} s   {wide.shape[0]} rows x {wide.shape[1]} columns")
+
+    if n_rows > args.legacy_max_rows:
+        print(f"  {'legacy pd.concat':<20} skipped (more than {args.legacy_max_rows} rows)")
+        return
+    elapsed, legacy = timed(legacy_widen, df)
+    identical = to_csv_text(legacy) == to_csv_text(wide)
+    print(f"  {'legacy pd.concat':<20} {elapsed:9.3f} s   identical CSV: {identical}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ChEMBL SARUniqifier row widening")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="Activity table sizes to test")
+    parser.add_argument("--columns", type=int, default=12, help="Columns per activity")
+    parser.add_argument("--mean_group", type=int, default=5, help="Mean number of activities per compound")
+    parser.add_argument("--max_group", type=int, default=40, help="Largest number of activities per compound")
+    parser.add_argument("--legacy_max_rows", type=int, default=100000,
+                        help="Only run the original loop up to this many rows")
+    parser.add_argument("--seed", type=int, default=1698)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for n_rows in args.rows:
+        run(n_rows, args, rng)
+
+
+if __name__ == "__main__":
+    main()
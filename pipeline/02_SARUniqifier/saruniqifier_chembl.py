@@ -1,35 +1,70 @@
 #!/usr/bin/env python3
+import os
+import sys
 import time
+import logging
 import argparse
 import pandas as pd
-from rdkit import Chem
-from chembl_webresource_client.new_client import new_client
 
-def smiles_to_inchikey(smiles):
-    mol = Chem.MolFromSmiles(smiles)
-    if mol:
-        return Chem.inchi.MolToInchiKey(mol)
-    return None
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from vs_common.inchikey import inchikey_column
+from vs_common.chembl_fetch import FIELDS, RecordedActivities, fetch_activities
 
 def rename_columns(col_name):
     return col_name.replace('_', ' ').title()
 
+def widen_groups(df, key):
+    """One row per value of `key`: the columns of its first row, then `<col>_<i>` for the i-th further row.
+
+    Rows keep their order within a group and groups are sorted by key; rows
+    without a key are dropped. All rows are placed with one unstack instead
+    of widening each group row by row, and the column dtypes are inferred
+    as the DataFrame of widened rows used to do (e.g. an integer column with
+    empty cells becomes float).
+    """
+    df = df[df[key].notna()]
+    if df.empty:
+        return pd.DataFrame()
+    position = df.groupby(key, sort=False).cumcount().to_numpy()
+    wide = df.astype(object).set_index([df[key].to_numpy(), position]).unstack()
+    columns = [(col, i) for i in range(position.max() + 1) for col in df.columns]
+    wide = wide.reindex(columns=columns)
+    wide.columns = [col if i == 0 else f'{col}_{i}' for col, i in columns]
+    return wide.reset_index(drop=True).infer_objects()
+
 def main():
     parser = argparse.ArgumentParser(description="ChEMBL SARUniqifier")
     parser.add_argument("-t", "--target_chembl_id", required=True, help="ChEMBL target ID")
     parser.add_argument("-o", "--output_file", default="chembl.csv", help="Output CSV file")
+    parser.add_argument("--inchikey_cache", default="inchikey_cache.sqlite",
+                        help="SQLite cache of SMILES -> InChIKey shared between runs ('' to disable)")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Processes used to compute InChIKeys (default: one per CPU)")
+    parser.add_argument("--cache", default="chembl_cache.sqlite",
+                        help="SQLite cache of downloaded activity pages (default: chembl_cache.sqlite)")
+    parser.add_argument("--page_size", type=int, default=1000, help="Activities per request (default: 1000)")
+    parser.add_argument("--offline", action="store_true", help="Only use activities already in the cache")
+    parser.add_argument("--refresh", action="store_true", help="Download again even if the target is cached")
+    parser.add_argument("--all_fields", action="store_true",
+                        help="Download every activity field, not only the ones kept in the output")
+    parser.add_argument("--recorded", help="JSON file of recorded activities served instead of the ChEMBL web services")
     args = parser.parse_args()
 
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
     start_time = time.time()
 
-    activities = new_client.activity.filter(target_chembl_id__in=[args.target_chembl_id])
+    activities = fetch_activities(
+        args.target_chembl_id, args.cache,
+        client=RecordedActivities(args.recorded) if args.recorded else None,
+        fields=None if args.all_fields else FIELDS,
+        page_size=args.page_size, offline=args.offline, refresh=args.refresh
+    )
     chembl = pd.DataFrame(activities)
     chembl.columns = [rename_columns(c) for c in chembl.columns]
     chembl.dropna(subset=['Canonical Smiles'], inplace=True)
     chembl.reset_index(drop=True, inplace=True)
     chembl['Standard Relation'].fillna('=', inplace=True)
-    chembl['InChIKey'] = chembl['Canonical Smiles'].apply(smiles_to_inchikey)
-    chembl.insert(1, 'InChI Key - Main', chembl['InChIKey'].str[:14])
+    chembl['InChIKey'] = inchikey_column(chembl['Canonical Smiles'], args.inchikey_cache, args.processes)
     chembl['References'] = (
         chembl['Src Id'].astype(str) + ' (' +
         chembl['Document Year'].astype(str) + ') | ' +
@@ -45,21 +80,11 @@ def main():
         'Standard Upper Value','Target Chembl Id','Target Organism','Target Pref Name',
         'Target Tax Id','Text Value','Toid','Type','Upper Value'
     ]
-    chembl.drop(columns=drop_cols, inplace=True)
-
-    groups = chembl.groupby('InChI Key - Main')
-    new_rows = []
-
-    for _, group in groups:
-        new_row = group.iloc[0].copy()
-        for i in range(1, len(group)):
-            row = group.iloc[i]
-            row.index = [f'{col}_{i}' for col in row.index]
-            new_row = pd.concat([new_row, row])
-        new_rows.append(new_row)
+    # Columns that were not downloaded (see --all_fields) are simply not there
+    chembl.drop(columns=drop_cols, inplace=True, errors='ignore')
+    chembl.insert(0, 'InChI Key - Main', chembl['InChIKey'].str[:14])
 
-    new_chembl = pd.DataFrame(new_rows)
-    new_chembl.reset_index(drop=True, inplace=True)
+    new_chembl = widen_groups(chembl, 'InChI Key - Main')
     new_chembl.to_csv(args.output_file, index=False)
 
     print(f"File '{args.output_file}' created for ChEMBL target {args.target_chembl_id} in {time.time() - start_time:.3f} seconds.")
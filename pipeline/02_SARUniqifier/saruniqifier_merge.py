@@ -1,17 +1,133 @@
 #!/usr/bin/env python3
+import os
+import re
+import csv
+import shutil
 import argparse
+import tempfile
+import numpy as np
 import pandas as pd
 
+KEY = 'InChI Key - Main'
+
+
+def selected_columns(path, columns=None):
+    """Header columns of a CSV to read: all of them, or the key plus the given base
+    columns with their per-activity copies (e.g. "Standard Value", "Standard Value_1",
+    and "Unit0", "Unit1" in the Reaxys layout)."""
+    header = list(pd.read_csv(path, nrows=0).columns)
+    if not columns:
+        return header
+    patterns = [re.compile(rf"{re.escape(column)}(_?\d+)?") for column in columns]
+    return [column for column in header if column == KEY or any(p.fullmatch(column) for p in patterns)]
+
+
+def read_text(path, usecols, **kwargs):
+    """Read a CSV with every column as text (object dtype), so values are written back as
+    they were read and no column changes type between partitions. Only empty fields are
+    missing."""
+    return pd.read_csv(path, usecols=usecols, dtype=object, keep_default_na=False, na_values=[''], **kwargs)
+
+
+def append_rows(path, columns, rows):
+    """Append rows of text to a CSV file, with the header if the file is new.
+
+    csv.writer on an object array avoids the per-call overhead of to_csv, which
+    dominates when a chunk is split over many small partitions.
+    """
+    new = not os.path.exists(path)
+    with open(path, 'a', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        if new:
+            writer.writerow(columns)
+        writer.writerows(rows.tolist())
+
+
+def partition_file(workdir, side, prefix):
+    # Empty keys are read as missing, so '' only stands for the rows without a key.
+    return os.path.join(workdir, f"{side}_{prefix.encode().hex() if prefix else 'missing'}.csv")
+
+
+def partition_table(path, usecols, side, workdir, prefix_length, chunk_size):
+    """Stream a CSV into <workdir>/<side>_<prefix>.csv files by the first prefix_length
+    characters of the key; returns the prefixes found ('' for rows without a key)."""
+    prefixes = set()
+    for chunk in read_text(path, usecols, chunksize=chunk_size):
+        keys = chunk[KEY].str[:prefix_length].fillna('').to_numpy(dtype=object)
+        order = np.argsort(keys, kind='stable')
+        rows = chunk.to_numpy(dtype=object, na_value='')[order]
+        chunk_prefixes, starts = np.unique(keys[order], return_index=True)
+        for prefix, start, end in zip(chunk_prefixes, starts, [*starts[1:], len(order)]):
+            append_rows(partition_file(workdir, side, prefix), chunk.columns, rows[start:end])
+        prefixes.update(chunk_prefixes)
+    return prefixes
+
+
+def read_partition(workdir, side, prefix, usecols):
+    part_file = partition_file(workdir, side, prefix)
+    if not os.path.exists(part_file):
+        return pd.DataFrame(columns=usecols, dtype=object)
+    return read_text(part_file, None)
+
+
+def merge_out_of_core(reaxys_file, chembl_file, output_file, columns=None, prefix_length=1,
+                      chunk_size=50000, tmp_dir=None):
+    """Outer merge of the two tables on the key, one key-prefix partition at a time.
+
+    Both tables are streamed into partitions on disk, then each pair of partitions
+    is merged in memory and appended to the output, so memory is bounded by the
+    largest partition instead of the tables. Partitions are merged in prefix
+    order and rows without a key last, which is the row order of the in-memory
+    outer merge. Returns the number of rows written.
+    """
+    reaxys_columns = selected_columns(reaxys_file, columns)
+    chembl_columns = selected_columns(chembl_file, columns)
+    workdir = tempfile.mkdtemp(prefix='saruniqifier_merge_', dir=tmp_dir)
+    n_rows = 0
+    try:
+        prefixes = partition_table(reaxys_file, reaxys_columns, 'reaxys', workdir, prefix_length, chunk_size)
+        prefixes |= partition_table(chembl_file, chembl_columns, 'chembl', workdir, prefix_length, chunk_size)
+        order = sorted(prefixes - {''}) + [''] * ('' in prefixes)
+
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        for prefix in order or ['']:
+            merged = pd.merge(
+                read_partition(workdir, 'reaxys', prefix, reaxys_columns),
+                read_partition(workdir, 'chembl', prefix, chembl_columns),
+                on=KEY, how='outer'
+            )
+            append_rows(output_file, merged.columns, merged.to_numpy(dtype=object, na_value=''))
+            n_rows += len(merged)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return n_rows
+
+
 def main():
     parser = argparse.ArgumentParser(description="Merge Reaxys and ChEMBL SAR datasets")
     parser.add_argument("-r", "--reaxys_file", required=True, help="Input Reaxys CSV file")
     parser.add_argument("-c", "--chembl_file", required=True, help="Input ChEMBL CSV file")
     parser.add_argument("-o", "--output_file", default="merged_sar.csv", help="Output merged CSV file")
+    parser.add_argument("--columns", nargs="+", default=None,
+                        help="Only merge these base columns and their per-activity copies (default: all columns)")
+    parser.add_argument("--out_of_core", action="store_true",
+                        help="Merge partition by key prefix instead of loading both tables into memory")
+    parser.add_argument("--prefix_length", type=int, default=1,
+                        help="Key characters per partition with --out_of_core (1: up to 26 partitions, 2: up to 676)")
+    parser.add_argument("--chunk_size", type=int, default=50000, help="Rows read at a time with --out_of_core")
+    parser.add_argument("--tmp_dir", default=None, help="Directory for the partition files with --out_of_core")
     args = parser.parse_args()
 
-    reaxys_df = pd.read_csv(args.reaxys_file)
-    chembl_df = pd.read_csv(args.chembl_file)
-    merged_df = pd.merge(reaxys_df, chembl_df, on='InChI Key - Main', how='outer')
+    if args.out_of_core:
+        n_rows = merge_out_of_core(args.reaxys_file, args.chembl_file, args.output_file, args.columns,
+                                   args.prefix_length, args.chunk_size, args.tmp_dir)
+        print(f"File '{args.output_file}' created. Total rows: {n_rows}")
+        return
+
+    reaxys_df = pd.read_csv(args.reaxys_file, usecols=selected_columns(args.reaxys_file, args.columns))
+    chembl_df = pd.read_csv(args.chembl_file, usecols=selected_columns(args.chembl_file, args.columns))
+    merged_df = pd.merge(reaxys_df, chembl_df, on=KEY, how='outer')
     merged_df.to_csv(args.output_file, index=False)
     print(f"File '{args.output_file}' created. Total rows: {len(merged_df)}")
 
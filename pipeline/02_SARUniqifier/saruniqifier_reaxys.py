@@ -1,21 +1,21 @@
 #!/usr/bin/env python3
 import os
+import sys
 import time
 import argparse
 import pandas as pd
-from rdkit import Chem
 
-def smiles_to_inchikey(smiles):
-    if isinstance(smiles, str) and smiles.strip():
-        mol = Chem.MolFromSmiles(smiles)
-        if mol:
-            return Chem.inchi.MolToInchiKey(mol)
-    return None
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from vs_common.inchikey import inchikey_column
 
 def main():
     parser = argparse.ArgumentParser(description="Reaxys SARUniqifier")
     parser.add_argument("-i", "--input_dir", required=True, help="Directory with input Excel files")
     parser.add_argument("-o", "--output_file", default="reaxys.csv", help="Output CSV file")
+    parser.add_argument("--inchikey_cache", default="inchikey_cache.sqlite",
+                        help="SQLite cache of SMILES -> InChIKey shared between runs ('' to disable)")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Processes used to compute InChIKeys (default: one per CPU)")
     args = parser.parse_args()
 
     input_files = [os.path.join(args.input_dir, f) for f in os.listdir(args.input_dir) if f.endswith('.xlsx')]
@@ -37,7 +37,7 @@ def main():
     ]
     df = df[columns_of_interest].dropna(subset=['SMILES']).copy()
     df['Qualitative value'].fillna('=', inplace=True)
-    df['InChI Key'] = df['SMILES'].apply(smiles_to_inchikey)
+    df['InChI Key'] = inchikey_column(df['SMILES'], args.inchikey_cache, args.processes)
     df.insert(2, 'InChI Key - Main', df['InChI Key'].str[:14])
     df['key'] = df.groupby(['InChI Key - Main']).cumcount().astype(str)
 
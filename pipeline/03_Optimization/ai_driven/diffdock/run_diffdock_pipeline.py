@@ -1,14 +1,41 @@
-import subprocess
+import os
+import sys
+import argparse
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from vs_common.dag import Step, read_conf, add_arguments, run_pipeline
+
+# (name, script, conf, inputs, outputs, in_process); each step follows the previous one.
+# The scripts open their conf themselves, relative to the working directory; inputs
+# and outputs are the conf keys they read.
 pipeline_steps = [
-    ("1_generate_diffdock_csv.py", "diffdock_filepaths.conf.py"),
-    ("2_run_diffdock_inference.py", "diffdock_inference.conf.py"),
-    ("3_collect_diffdock_rank1.py", "diffdock_collect.conf.py"),
-    ("4_diffdock_rmsd_pymol.py", "diffdock_rmsd.conf.py"),
-    ("5_diffdock_rmsd_matrix_builder.py", "diffdock_rmsd_matrix.conf.py"),
-    ("6_diffdock_rmsd_heatmap.py", "diffdock_heatmap.conf.py"),
+    ("file_paths", "1_generate_diffdock_csv.py", "diffdock_filepaths.conf",
+     ["input_directory"], ["output_csv"], False),
+    ("inference", "2_run_diffdock_inference.py", "config/diffdock_inference.conf",
+     ["protein_ligand_csv"], ["out_dir"], False),
+    ("collect", "3_collect_diffdock_rank1.py", "config/diffdock_collect.conf",
+     ["base_dir"], ["dest_dir"], False),
+    ("rmsd", "4_diffdock_rmsd_pymol.py", "config/diffdock_rmsd.conf",
+     ["paths.ref_dir", "paths.pose_dir"], ["paths.output_file"], True),
+    ("rmsd_matrix", "5_diffdock_rmsd_matrix_builder.py", "config/diffdock_rmsd_matrix.conf",
+     ["csv_file"], ["output_file"], True),
+    ("heatmap", "6_diffdock_rmsd_heatmap.py", "config/diffdock_heatmap.conf.py",
+     ["rmsd_matrix_file"], ["heatmap_output_file"], True),
 ]
 
-for script, conf_file in pipeline_steps:
-    print(f"Running {script} with {conf_file}")
-    subprocess.run(["python3", script], check=True)
\ No newline at end of file
+
+def conf_path(values, key):
+    # "section.key" in an INI conf, or the bare key when the conf has no sections
+    return values.get(key, values.get(key.rsplit(".", 1)[-1]))
+
+
+steps = []
+for i, (name, script, conf_file, inputs, outputs, in_process) in enumerate(pipeline_steps):
+    values = read_conf(conf_file)
+    steps.append(Step(name, script, inputs=[conf_file] + [conf_path(values, key) for key in inputs],
+                      outputs=[conf_path(values, key) for key in outputs],
+                      after=[pipeline_steps[i - 1][0]] if i else [], in_process=in_process))
+
+parser = argparse.ArgumentParser(description="DiffDock cross-docking pipeline")
+add_arguments(parser)
+sys.exit(run_pipeline(steps, parser.parse_args()))
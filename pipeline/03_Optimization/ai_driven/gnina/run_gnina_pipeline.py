@@ -1,27 +1,39 @@
-import subprocess
 import os
+import sys
+import argparse
 
-base_dir = os.path.dirname(__file__)
+base_dir = os.path.dirname(os.path.abspath(__file__))
 scripts_dir = os.path.join(base_dir, "scripts")
 config_dir = os.path.join(base_dir, "config")
 
+sys.path.insert(0, os.path.abspath(os.path.join(base_dir, "..", "..", "..")))
+from vs_common.dag import Step, read_conf, add_arguments, run_pipeline
+
+# (name, script, conf, inputs, outputs, in_process); each step follows the previous one.
+# The scripts read config/<conf> next to scripts/; inputs and outputs are conf keys.
 pipeline_steps = [
-    ("1_gnina_crossdock.py", "gnina_crossdock.conf"),
-    ("2_extract_first_pose.py", "gnina_extract_first_pose.conf"),
-    ("3_gnina_rmsd.py", "gnina_rmsd.conf"),
-    ("4_gnina_rmsd_matrix.py", "gnina_rmsd_matrix.conf"),
-    ("6_gnina_rmsd_heatmap.py", "gnina_heatmap.conf")
+    ("crossdock", "1_gnina_crossdock.py", "gnina_crossdock.conf",
+     ["ligands_folder", "proteins_folder"], ["output_folder"], False),
+    ("first_pose", "2_extract_first_pose.py", "gnina_extract_first_pose.conf",
+     ["input_dir"], ["output_dir"], False),
+    ("rmsd", "3_gnina_rmsd_pymol.py", "gnina_rmsd.conf", ["ref_dir", "pose_dir"], ["output_file"], True),
+    ("rmsd_matrix", "4_gnina_rmsd_matrix_builder.py", "gnina_rmsd_matrix.conf",
+     ["input_csv"], ["output_csv"], True),
+    ("heatmap", "5_gnina_rmsd_heatmap.py", "gnina_heatmap.conf", ["input_csv"], ["output_png"], True),
 ]
 
-for script_name, conf_name in pipeline_steps:
-    script_path = os.path.join(scripts_dir, script_name)
+steps = []
+for i, (name, script_name, conf_name, inputs, outputs, in_process) in enumerate(pipeline_steps):
     conf_path = os.path.join(config_dir, conf_name)
+    conf = read_conf(conf_path)
+    steps.append(Step(name, os.path.join(scripts_dir, script_name),
+                      inputs=[conf_path] + [conf.get(key) for key in inputs],
+                      outputs=[conf.get(key) for key in outputs],
+                      after=[pipeline_steps[i - 1][0]] if i else [], in_process=in_process))
 
-    print(f"Running {script_name} with {conf_name}")
-    try:
-        subprocess.run(["python3", script_path], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running {script_name}: {e}")
-        break
-
-print("GNINA pipeline completed!")
+parser = argparse.ArgumentParser(description="GNINA cross-docking pipeline")
+add_arguments(parser)
+if run_pipeline(steps, parser.parse_args()) == 0:
+    print("GNINA pipeline completed!")
+else:
+    sys.exit(1)
@@ -1,10 +1,14 @@
 import os
+import sys
 import pandas as pd
 import logging
 import time
-from pymol import cmd
 import importlib.util
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "..")))
+from vs_common.rmsd import calculate_rmsd
+from vs_common.pairing import pair_directory, plain_reference_id, prepared_pose_name, log_pairing
+
 config_path = os.path.join(os.path.dirname(__file__), "../config/gnina_rmsd.conf")
 spec = importlib.util.spec_from_file_location("conf", config_path)
 conf = importlib.util.module_from_spec(spec)
@@ -20,55 +24,34 @@ logging.basicConfig(
 )
 
 def match_reference_to_poses(ref_dir, pose_dir):
-    ref_files = [f for f in os.listdir(ref_dir) if f.endswith('.sdf')]
-    pose_files = [f for f in os.listdir(pose_dir) if f.endswith('.sdf')]
-    matches = {"Reference_Ligand": [], "Matching_Poses": []}
-
-    for ref_file in ref_files:
-        ref_core_id = ref_file.replace('.sdf', '')
-        matching_poses = []
-        for pose in pose_files:
-            if '_-_prepared_' in pose:
-                pose_core_id = pose.split('_-_prepared_')[-1].replace('.sdf', '')
-            else:
-                pose_core_id = ""
-            if ref_core_id == pose_core_id:
-                matching_poses.append(pose)
-        matches["Reference_Ligand"].append(ref_file)
-        matches["Matching_Poses"].append(", ".join(matching_poses) if matching_poses else "No Match")
-    return pd.DataFrame(matches)
+    pairing = pair_directory(ref_dir, pose_dir, '.sdf', '.sdf', plain_reference_id, prepared_pose_name)
+    log_pairing(pairing)
+    return pairing.pairs
 
 def calculate_rmsd_and_save(ref_dir, pose_dir, output_file):
     start_time = time.time()
-    matches_df = match_reference_to_poses(ref_dir, pose_dir)
+    pairs = match_reference_to_poses(ref_dir, pose_dir)
     results = []
 
     logging.info("Starting RMSD calculations.")
-    for _, row in matches_df.iterrows():
-        ref_ligand = row['Reference_Ligand']
-        pose_files = row['Matching_Poses'].split(", ") if row['Matching_Poses'] != "No Match" else []
-
-        if not pose_files:
-            logging.warning(f"No matching poses found for reference ligand: {ref_ligand}")
-            continue
-
-        for pose_file in pose_files:
-            reference_path = os.path.join(ref_dir, ref_ligand)
-            pose_path = os.path.join(pose_dir, pose_file)
-            try:
-                cmd.load(reference_path, "reference")
-                cmd.load(pose_path, "pose")
-                rmsd = cmd.rms_cur("pose", "reference", matchmaker=4)
-                cmd.delete("reference")
-                cmd.delete("pose")
-                logging.info(f"RMSD calculated: Reference={ref_ligand}, Pose={pose_file}, RMSD={rmsd}")
-                results.append({"Reference_Ligand": ref_ligand, "Pose_File": pose_file, "RMSD": rmsd})
-            except Exception as e:
-                logging.error(f"Error calculating RMSD: Reference={ref_ligand}, Pose={pose_file}, Error={e}")
-                results.append({"Reference_Ligand": ref_ligand, "Pose_File": pose_file, "RMSD": f"Error: {e}"})
+    rmsds = calculate_rmsd(
+        [(os.path.join(ref_dir, ref_ligand), os.path.join(pose_dir, pose_file)) for ref_ligand, pose_file in pairs],
+        method=getattr(conf, "rmsd_method", "index"),
+        processes=getattr(conf, "processes", None)
+    )
+
+    for ref_ligand, pose_file in pairs:
+        rmsd = rmsds[(os.path.join(ref_dir, ref_ligand), os.path.join(pose_dir, pose_file))]
+        if isinstance(rmsd, Exception):
+            logging.error(f"Error calculating RMSD: Reference={ref_ligand}, Pose={pose_file}, Error={rmsd}")
+            results.append({"Reference_Ligand": ref_ligand, "Pose_File": pose_file, "RMSD": f"Error: {rmsd}"})
+        else:
+            logging.info(f"RMSD calculated: Reference={ref_ligand}, Pose={pose_file}, RMSD={rmsd}")
+            results.append({"Reference_Ligand": ref_ligand, "Pose_File": pose_file, "RMSD": rmsd})
 
     pd.DataFrame(results).to_csv(output_file, index=False)
     logging.info(f"Total RMSD calculation time: {time.time() - start_time:.2f} seconds.")
     logging.info("RMSD calculations completed.")
 
-calculate_rmsd_and_save(conf.ref_dir, conf.pose_dir, conf.output_file)
+if __name__ == "__main__":
+    calculate_rmsd_and_save(conf.ref_dir, conf.pose_dir, conf.output_file)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""Compare the shared RMSD engine with the PyMOL rms_cur loop.
+
+Builds a cross-docking style matrix of references x poses (each .pdb
+reference ligand has --poses rotated and shifted copies of itself, written
+alternately as .pdb and .sdf, so PyMOL's atom sorting is exercised), scores
+every pair with vs_common.rmsd and, if PyMOL is importable, with the old
+cmd.load / rms_cur(matchmaker=4) loop, and reports the wall time of both and
+the largest difference between them. Two of every three references use
+chemical component style atom names (C10, H2A or H21, HN1) instead of
+RDKit's, so the sort order of lettered and multi-digit names is compared too.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from vs_common.rmsd import METHODS, calculate_rmsd
+
+SMILES = [
+    "CC(=O)Nc1ccc(O)cc1",
+    "CC(C)Cc1ccc(C(C)C(=O)O)cc1",
+    "O=C(O)c1ccccc1OC(C)=O",
+    "CN1CCC[C@H]1c1cccnc1",
+    "Cn1cnc2c1c(=O)n(C)c(=O)n2C",
+    "CC(C)NCC(O)COc1cccc2ccccc12",
+    "COc1ccc2[nH]cc(CCNC(C)=O)c2c1",
+    "CN(C)CCCN1c2ccccc2CCc2ccccc21",
+    "O=C(c1ccccc1)c1ccc(O)cc1",
+    "Clc1ccc(C(c2ccccc2)n2ccnc2)cc1",
+]
+
+
+def random_rotation(rng, max_angle):
+    """Rotation matrix about a random axis by up to max_angle radians."""
+    axis = rng.normal(size=3)
+    axis /= np.linalg.norm(axis)
+    angle = rng.uniform(0, max_angle)
+    k = np.array([[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]])
+    return np.eye(3) + np.sin(angle) * k + (1 - np.cos(angle)) * k @ k
+
+
+def set_component_names(mol, numbered):
+    """Name atoms like PDB chemical components: C1 ... C10, N1, then H2A, H2B
+    (or H21, H22 if numbered) for the hydrogens of C2 and HN1, HO1 for those
+    of N1 and O1."""
+    from rdkit import Chem
+
+    counts = {}
+    names = {}
+    for atom in mol.GetAtoms():
+        if atom.GetAtomicNum() > 1:
+            element = atom.GetSymbol().upper()
+            counts[element] = counts.get(element, 0) + 1
+            names[atom.GetIdx()] = f"{element}{counts[element]}"
+    for atom in mol.GetAtoms():
+        if atom.GetAtomicNum() == 1:
+            continue
+        element, number = atom.GetSymbol().upper(), names[atom.GetIdx()][len(atom.GetSymbol()):]
+        hydrogens = [n.GetIdx() for n in atom.GetNeighbors() if n.GetAtomicNum() == 1]
+        for k, idx in enumerate(hydrogens):
+            suffix = "" if len(hydrogens) == 1 else str(k + 1) if numbered else "ABC"[k]
+            names[idx] = f"H{'' if element == 'C' else element}{number}{suffix}"
+
+    for atom in mol.GetAtoms():
+        name = names[atom.GetIdx()]
+        field = f" {name:<3}" if len(name) < 4 and len(atom.GetSymbol()) == 1 else f"{name:<4}"
+        atom.SetMonomerInfo(Chem.AtomPDBResidueInfo(field, residueName="LIG", residueNumber=1, isHeteroAtom=True))
+
+
+def generate_matrix(n_refs, n_poses, workdir, seed=0):
+    from rdkit import Chem
+    from rdkit.Chem import AllChem
+
+    rng = np.random.default_rng(seed)
+    ref_dir = os.path.join(workdir, "references")
+    pose_dir = os.path.join(workdir, "poses")
+    os.makedirs(ref_dir)
+    os.makedirs(pose_dir)
+
+    pairs = []
+    for i in range(n_refs):
+        mol = Chem.AddHs(Chem.MolFromSmiles(SMILES[i % len(SMILES)]))
+        AllChem.EmbedMolecule(mol, randomSeed=i)
+        if i % 3:
+            set_component_names(mol, numbered=i % 3 == 2)
+        ref_file = os.path.join(ref_dir, f"LIG{i:04d}_-_prepared.pdb")
+        Chem.MolToPDBFile(mol, ref_file)
+
+        ref_coords = mol.GetConformer().GetPositions()
+        center = ref_coords.mean(axis=0)
+        for j in range(n_poses):
+            # Rotated and shifted copies, roughly 0.3 to 5 A from the reference
+            coords = (ref_coords - center) @ random_rotation(rng, 1.2).T + center
+            coords += rng.normal(scale=0.5, size=3)
+            pose = Chem.Mol(mol)
+            pose_conf = pose.GetConformer()
+            for k, xyz in enumerate(coords):
+                pose_conf.SetAtomPosition(k, xyz.tolist())
+
+            ext = ".sdf" if j % 2 else ".pdb"
+            pose_file = os.path.join(pose_dir, f"REC{j:04d}_LIG{i:04d}_pose1{ext}")
+            if ext == ".sdf":
+                writer = Chem.SDWriter(pose_file)
+                writer.write(pose)
+                writer.close()
+            else:
+                Chem.MolToPDBFile(pose, pose_file)
+            pairs.append((ref_file, pose_file))
+    return pairs
+
+
+def pymol_rmsd(pairs):
+    from pymol import cmd
+
+    results = {}
+    for ref, pose in pairs:
+        cmd.load(ref, "ref")
+        cmd.load(pose, "pose")
+        results[(ref, pose)] = cmd.rms_cur("pose", "ref", matchmaker=4)
+        cmd.delete("ref")
+        cmd.delete("pose")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RMSD engine against PyMOL rms_cur")
+    parser.add_argument("--refs", type=int, default=100, help="Number of reference ligands")
+    parser.add_argument("--poses", type=int, default=100, help="Poses per reference")
+    parser.add_argument("--method", default="index", choices=METHODS)
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--pymol_limit", type=int, default=0,
+                        help="Only time PyMOL on the first N pairs (0 = all pairs)")
+    parser.add_argument("--no_pymol", action="store_true", help="Skip the PyMOL comparison")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        pairs = generate_matrix(args.refs, args.poses, workdir)
+        print(f"{args.refs} references x {args.poses} poses = {len(pairs)} pairs, "
+              f"method {args.method}, {args.processes} processes")
+
+        start = time.perf_counter()
+        results = calculate_rmsd(pairs, method=args.method, processes=args.processes)
+        engine_time = time.perf_counter() - start
+        errors = sum(1 for value in results.values() if isinstance(value, Exception))
+        print(f"  engine  {engine_time:8.2f} s  {len(pairs) / engine_time:10.1f} pairs/s  {errors} errors")
+
+        if args.no_pymol:
+            return
+        try:
+            import pymol  # noqa: F401
+        except ImportError:
+            print("  PyMOL is not importable, skipping the comparison")
+            return
+
+        subset = pairs[:args.pymol_limit] if args.pymol_limit else pairs
+        start = time.perf_counter()
+        reference = pymol_rmsd(subset)
+        pymol_time = time.perf_counter() - start
+        rate = len(subset) / pymol_time
+        print(f"  pymol   {pymol_time:8.2f} s  {rate:10.1f} pairs/s  ({len(subset)} pairs)")
+        print(f"  speedup {len(pairs) / engine_time / rate:8.1f}x")
+
+        diffs = [abs(results[pair] - value) for pair, value in reference.items()
+                 if not isinstance(results[pair], Exception)]
+        if diffs:
+            print(f"  max |engine - pymol| = {max(diffs):.2e} A over {len(diffs)} pairs")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,36 @@
-import subprocess
+import os
 import sys
+import argparse
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from vs_common.dag import Step, read_conf, add_arguments, run_pipeline
+
+# (name, script, conf, inputs, outputs, in_process); each step follows the previous one.
+# The scripts read their conf from the working directory; inputs and outputs are
+# conf keys, except for step 1, whose directories are fixed in the script.
 steps = [
-    ("1_run_flexx_crossdocking.py", "flexx_crossdock.conf"),
-    ("2_split_flexx_sdf.py", "flexx_split.conf"),
-    ("3_flexx_rmsd_pymol.py", "flexx_rmsd.conf"),
-    ("4_flexx_rmsd_matrix_builder.py", "flexx_rmsd_matrix.conf"),
-    ("5_flexx_rmsd_heatmap.py", "flexx_heatmap.conf"),
+    ("crossdock", "1_run_flexx_crossdocking.py", "flexx_crossdock.conf",
+     ["=ligands", "=proteins"], ["=results"], False),
+    ("split", "2_split_flexx_sdf.py", "flexx_split.conf", ["input_sdf_dir"], [], False),
+    ("rmsd", "3_flexx_rmsd_pymol.py", "flexx_rmsd.conf", ["ref_dir", "pose_dir"], ["output_csv"], True),
+    ("rmsd_matrix", "4_flexx_rmsd_matrix_builder.py", "flexx_rmsd_matrix.conf",
+     ["input_csv"], ["output_xlsx"], True),
+    ("heatmap", "5_flexx_rmsd_heatmap.py", "flexx_heatmap.conf", ["input_matrix"], ["output_png"], True),
 ]
 
-for script, conf in steps:
-    cmd = ["python", script, conf]
-    result = subprocess.run(cmd)
-    if result.returncode != 0:
-        sys.exit(f"Pipeline stopped at {script}")
+
+def paths(values, keys):
+    return [key[1:] if key.startswith("=") else values.get(key) for key in keys]
+
+
+pipeline = []
+for i, (name, script, conf, inputs, outputs, in_process) in enumerate(steps):
+    values = read_conf(conf)
+    pipeline.append(Step(name, script, [conf], inputs=[conf] + paths(values, inputs),
+                         outputs=paths(values, outputs), after=[steps[i - 1][0]] if i else [],
+                         in_process=in_process))
+
+parser = argparse.ArgumentParser(description="FlexX cross-docking pipeline")
+add_arguments(parser)
+if run_pipeline(pipeline, parser.parse_args()) != 0:
+    sys.exit("Pipeline stopped: a step failed")
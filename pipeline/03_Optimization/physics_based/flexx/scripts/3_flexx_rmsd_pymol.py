@@ -1,9 +1,13 @@
 import os
+import sys
 import json
 import pandas as pd
 import logging
 import time
-from pymol import cmd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "..")))
+from vs_common.rmsd import calculate_rmsd
+from vs_common.pairing import pair_directory, split_pose_name, log_pairing
 
 logging.basicConfig(
     filename="flexx_rmsd.log",
@@ -12,32 +16,30 @@ logging.basicConfig(
 )
 
 def match_refs(cfg):
-    refs = [f for f in os.listdir(cfg["ref_dir"]) if f.endswith(cfg["ref_ext"])]
-    poses = [f for f in os.listdir(cfg["pose_dir"]) if f.endswith(cfg["pose_ext"])]
-
-    out = []
-    for r in refs:
-        core = r.replace(cfg["ref_strip"], "").replace(cfg["ref_ext"], "")
-        for p in poses:
-            pid = p.split(cfg["pose_split"])[-1].rsplit(cfg["pose_trim"], 1)[0]
-            if core in pid:
-                out.append((r, p))
-    return out
+    pairing = pair_directory(
+        cfg["ref_dir"], cfg["pose_dir"], cfg["ref_ext"], cfg["pose_ext"],
+        lambda r: r.replace(cfg["ref_strip"], "").replace(cfg["ref_ext"], ""),
+        lambda p: split_pose_name(p, cfg["pose_split"], cfg["pose_trim"], cfg["pose_ext"])
+    )
+    log_pairing(pairing)
+    return pairing.pairs
 
 def run_rmsd(cfg):
     results = []
     start = time.time()
 
-    for ref, pose in match_refs(cfg):
-        try:
-            cmd.load(os.path.join(cfg["ref_dir"], ref), "ref")
-            cmd.load(os.path.join(cfg["pose_dir"], pose), "pose")
-            rmsd = cmd.rms_cur("pose", "ref", matchmaker=4)
-            cmd.delete("ref")
-            cmd.delete("pose")
-            results.append({"Reference": ref, "Pose": pose, "RMSD": rmsd})
-        except Exception as e:
-            results.append({"Reference": ref, "Pose": pose, "RMSD": f"ERR:{e}"})
+    pairs = match_refs(cfg)
+    rmsds = calculate_rmsd(
+        [(os.path.join(cfg["ref_dir"], ref), os.path.join(cfg["pose_dir"], pose)) for ref, pose in pairs],
+        method=cfg.get("rmsd_method", "index"),
+        processes=cfg.get("processes")
+    )
+
+    for ref, pose in pairs:
+        rmsd = rmsds[(os.path.join(cfg["ref_dir"], ref), os.path.join(cfg["pose_dir"], pose))]
+        if isinstance(rmsd, Exception):
+            rmsd = f"ERR:{rmsd}"
+        results.append({"Reference": ref, "Pose": pose, "RMSD": rmsd})
 
     pd.DataFrame(results).to_csv(cfg["output_csv"], index=False)
     logging.info(f"Finished in {time.time() - start:.2f}s")
@@ -1,45 +1,47 @@
 #!/usr/bin/env python3
 
-import subprocess
+import os
 import sys
+import argparse
 from pathlib import Path
 
-# (script, config)
-PIPELINE_STEPS = [
-    ("1_glide_prepare_receptors.py", "glide_receptor.conf"),
-    ("2_glide_prepare_ligands.py", "glide_ligand.conf"),
-    ("3_glide_generate_grid_inputs.py", "glide_grid.conf"),
-    ("4_glide_run_grids.py", "glide_run.conf"),
-    ("5_glide_crossdocking_runner.py", "glide_crossdock.conf"),
-    ("6_glide_convert_and_collect_poses.py", "glide_pose.conf"),
-    ("7_glide_rmsd_pymol.py", "glide_rmsd.conf"),
-    ("8_glide_rmsd_matrix_builder.py", "rmsd_matrix.conf"),
-    ("9_glide_rmsd_heatmap.py", "heatmap.conf"),
-]
-
-
-def run_step(script, config):
-    cmd = ["python", script, str(Path("../config") / config)]
-
-    print(f"\n>>> Running: {' '.join(cmd)}")
-
-    try:
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError:
-        print(f"\nERROR: Step failed -> {script}")
-        sys.exit(1)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from vs_common.dag import Step, read_conf, add_arguments, run_pipeline
 
+PIPELINE_DIR = Path(__file__).resolve().parent
+SCRIPTS_DIR = PIPELINE_DIR / "scripts"
+CONFIG_DIR = PIPELINE_DIR / "config"
 
-def main():
-    scripts_dir = Path.cwd()
-    config_dir = scripts_dir.parent / "config"
+# (name, script, config, inputs, outputs, after, in_process); inputs and outputs are config keys.
+# Receptor and ligand preparation are independent, and ligand preparation also runs
+# alongside the grid steps; cross-docking waits for both branches.
+PIPELINE_STEPS = [
+    ("receptors", "1_glide_prepare_receptors.py", "glide_receptor.conf",
+     ["receptors.input_dir"], ["receptors.output_dir"], [], False),
+    ("ligands", "2_glide_prepare_ligands.py", "glide_ligand.conf",
+     ["ligands.input_dir"], ["ligands.output_dir"], [], False),
+    ("grid_inputs", "3_glide_generate_grid_inputs.py", "glide_grid.conf",
+     ["grid.receptor_dir"], ["grid.output_dir"], ["receptors"], False),
+    ("grids", "4_glide_run_grids.py", "glide_run.conf",
+     ["glide.input_dir"], ["glide.output_dir"], ["grid_inputs"], False),
+    ("crossdock", "5_glide_crossdocking_runner.py", "glide_crossdock.conf",
+     ["glide.input_dir"], ["glide.output_dir"], ["grids", "ligands"], False),
+    ("poses", "6_glide_convert_and_collect_poses.py", "glide_pose.conf",
+     ["input.maegz_dir"], ["output.ligand_dir", "output.rmsd_dir"], ["crossdock"], False),
+    ("rmsd", "7_glide_rmsd_pymol.py", "glide_rmsd.conf",
+     ["input.reference_dir", "input.pose_dir"], ["output.csv"], ["poses"], True),
+    ("rmsd_matrix", "8_glide_rmsd_matrix_builder.py", "rmsd_matrix.conf",
+     ["input.rmsd_csv"], ["output.matrix_xlsx"], ["rmsd"], True),
+    ("heatmap", "9_glide_rmsd_heatmap.py", "heatmap.conf",
+     ["input.matrix_xlsx"], ["output.heatmap_png"], ["rmsd_matrix"], True),
+]
 
-    print("=== Glide Cross-Docking Pipeline ===")
-    print("Environment: vs-pipeline must be activated\n")
 
-    for script, config in PIPELINE_STEPS:
-        script_path = scripts_dir / script
-        config_path = config_dir / config
+def build_steps(workdir):
+    steps = []
+    for name, script, config, inputs, outputs, after, in_process in PIPELINE_STEPS:
+        script_path = SCRIPTS_DIR / script
+        config_path = CONFIG_DIR / config
 
         if not script_path.exists():
             print(f"ERROR: Missing script: {script}")
@@ -49,7 +51,29 @@ def main():
             print(f"ERROR: Missing config: {config}")
             sys.exit(1)
 
-        run_step(script, config)
+        conf = read_conf(str(config_path))
+        steps.append(Step(
+            name, script_path, [config_path],
+            inputs=[config_path] + [conf.get(key) for key in inputs],
+            outputs=[conf.get(key) for key in outputs],
+            after=after, cwd=workdir, in_process=in_process,
+        ))
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Glide cross-docking pipeline")
+    parser.add_argument("--workdir", default=os.getcwd(),
+                        help="Directory the relative paths of the configs refer to (default: current directory)")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    print("=== Glide Cross-Docking Pipeline ===")
+    print("Environment: vs-pipeline must be activated\n")
+
+    if run_pipeline(build_steps(args.workdir), args) != 0:
+        print("\nERROR: Glide pipeline failed")
+        sys.exit(1)
 
     print("\n=== Glide pipeline completed successfully ===")
 
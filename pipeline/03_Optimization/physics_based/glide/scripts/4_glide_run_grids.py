@@ -19,6 +19,8 @@ def run_glide_jobs(conf_file: str):
     script_dir = pathlib.Path(cfg["glide"]["input_dir"])
     glide_exec = cfg["glide"]["glide_exec"]
     host       = cfg["glide"]["host"]
+    # Glide writes the grid files into the directory it runs in
+    output_dir = pathlib.Path(cfg["glide"].get("output_dir", "."))
 
     if not script_dir.exists():
         logging.error(f"Input directory not found: {script_dir}")
@@ -30,15 +32,17 @@ def run_glide_jobs(conf_file: str):
         logging.error("No Glide input (.in) files found.")
         sys.exit(1)
 
+    output_dir.mkdir(parents=True, exist_ok=True)
+
     for script in scripts:
         cmd = [
             glide_exec,
-            str(script),
+            str(script.resolve()),
             "-HOST", host
         ]
 
         logging.info(f"Running Glide: {script.name}")
-        subprocess.run(cmd, check=False)
+        subprocess.run(cmd, cwd=output_dir, check=False)
 
 if __name__ == "__main__":
     if len(sys.argv) != 2:
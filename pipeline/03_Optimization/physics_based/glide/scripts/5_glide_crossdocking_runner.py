@@ -13,15 +13,15 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
-def run_glide(script_path: pathlib.Path, glide_exec: str, host: str):
+def run_glide(script_path: pathlib.Path, glide_exec: str, host: str, output_dir: pathlib.Path):
     cmd = [
         glide_exec,
-        str(script_path),
+        str(script_path.resolve()),
         "-HOST", host
     ]
 
     try:
-        subprocess.run(cmd, check=True)
+        subprocess.run(cmd, cwd=output_dir, check=True)
         return f"OK: {script_path.name}"
     except subprocess.CalledProcessError as e:
         return f"FAIL: {script_path.name} ({e})"
@@ -34,6 +34,8 @@ def main(conf_file: str):
     glide_exec  = cfg["glide"]["glide_exec"]
     host        = cfg["glide"]["host"]
     n_workers   = int(cfg["glide"]["threads"])
+    # Glide writes the docking outputs into the directory it runs in
+    output_dir  = pathlib.Path(cfg["glide"].get("output_dir", "."))
 
     scripts = sorted(script_dir.glob("*.in"))
 
@@ -41,11 +43,12 @@ def main(conf_file: str):
         logging.error("No Glide input (.in) files found.")
         sys.exit(1)
 
+    output_dir.mkdir(parents=True, exist_ok=True)
     logging.info(f"Running {len(scripts)} Glide jobs with {n_workers} workers")
 
     with ThreadPoolExecutor(max_workers=n_workers) as executor:
         futures = {
-            executor.submit(run_glide, s, glide_exec, host): s
+            executor.submit(run_glide, s, glide_exec, host, output_dir): s
             for s in scripts
         }
 
@@ -7,7 +7,10 @@ import logging
 import pathlib
 import configparser
 import pandas as pd
-from pymol import cmd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "..")))
+from vs_common.rmsd import calculate_rmsd as rmsd_engine
+from vs_common.pairing import pair_directory, prepared_reference_id, glide_pose_name, log_pairing
 
 
 def setup_logging(log_file):
@@ -19,57 +22,43 @@ def setup_logging(log_file):
 
 
 def match_reference_to_poses(ref_dir, pose_dir):
-    ref_files = [f for f in os.listdir(ref_dir) if f.endswith(".pdb")]
-    pose_files = [f for f in os.listdir(pose_dir) if f.endswith(".mae")]
-
-    matches = []
-
-    for ref in ref_files:
-        ref_id = ref.replace("_-_prepared", "").replace(".pdb", "")
-
-        for pose in pose_files:
-            pose_id = pose.replace("grid_", "").rsplit("_pv_ligand", 1)[0]
-            if ref_id in pose_id:
-                matches.append((ref, pose))
-
-    return matches
+    pairing = pair_directory(ref_dir, pose_dir, ".pdb", ".mae", prepared_reference_id, glide_pose_name)
+    log_pairing(pairing)
+    return pairing.pairs
 
 
-def calculate_rmsd(ref_dir, pose_dir, output_csv):
+def calculate_rmsd(ref_dir, pose_dir, output_csv, method="index", processes=None):
     start = time.time()
     results = []
 
     pairs = match_reference_to_poses(ref_dir, pose_dir)
     logging.info(f"Total RMSD pairs: {len(pairs)}")
 
-    for ref, pose in pairs:
-        ref_path = os.path.join(ref_dir, ref)
-        pose_path = os.path.join(pose_dir, pose)
-
-        try:
-            cmd.load(ref_path, "ref")
-            cmd.load(pose_path, "pose")
-
-            rmsd = cmd.rms_cur("pose", "ref", matchmaker=4)
+    rmsds = rmsd_engine(
+        [(os.path.join(ref_dir, ref), os.path.join(pose_dir, pose)) for ref, pose in pairs],
+        method=method,
+        processes=processes
+    )
 
-            cmd.delete("ref")
-            cmd.delete("pose")
+    for ref, pose in pairs:
+        rmsd = rmsds[(os.path.join(ref_dir, ref), os.path.join(pose_dir, pose))]
 
+        if isinstance(rmsd, Exception):
+            logging.error(f"RMSD FAILED | {ref} vs {pose} | {rmsd}")
             results.append({
                 "Reference_Ligand": ref,
                 "Pose_File": pose,
-                "RMSD": rmsd
+                "RMSD": "ERROR"
             })
+            continue
 
-            logging.info(f"RMSD OK | {ref} vs {pose} = {rmsd:.3f}")
+        results.append({
+            "Reference_Ligand": ref,
+            "Pose_File": pose,
+            "RMSD": rmsd
+        })
 
-        except Exception as e:
-            logging.error(f"RMSD FAILED | {ref} vs {pose} | {e}")
-            results.append({
-                "Reference_Ligand": ref,
-                "Pose_File": pose,
-                "RMSD": "ERROR"
-            })
+        logging.info(f"RMSD OK | {ref} vs {pose} = {rmsd:.3f}")
 
     pd.DataFrame(results).to_csv(output_csv, index=False)
     logging.info(f"Finished in {time.time() - start:.2f}s")
@@ -84,9 +73,12 @@ def main(conf_file):
     output_csv = cfg["output"]["csv"]
     log_file = cfg["output"]["log"]
 
+    method = cfg.get("rmsd", "method", fallback="index")
+    processes = cfg.getint("rmsd", "processes", fallback=None)
+
     setup_logging(log_file)
 
-    calculate_rmsd(ref_dir, pose_dir, output_csv)
+    calculate_rmsd(ref_dir, pose_dir, output_csv, method, processes)
 
 
 if __name__ == "__main__":
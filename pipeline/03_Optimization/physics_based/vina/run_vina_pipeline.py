@@ -1,16 +1,37 @@
-import subprocess
+import os
 import sys
+import argparse
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from vs_common.dag import Step, read_conf, add_arguments, run_pipeline
+
+# (name, script, config, inputs, outputs, after, in_process); inputs and outputs are config keys.
+# Receptor and ligand preparation are independent and run side by side.
 pipeline_steps = [
-    ("1_prepare_receptors_pdb_to_pdbqt.py", "configs/vina_receptor.conf.example"),
-    ("2_convert_ligands_mae_to_pdbqt.py", "configs/vina_ligand.conf.example"),
-    ("3_run_vina_crossdocking.py", "configs/vina_docking.conf.example"),
-    ("4_extract_vina_model1.py", "configs/model1_extraction.conf.example"),
-    ("5_vina_rmsd_pymol.py", "configs/vina_rmsd.conf.example"),
-    ("6_vina_rmsd_matrix_builder.py", "configs/rmsd_matrix.conf.example"),
-    ("7_vina_rmsd_heatmap.py", "configs/heatmap.conf.example")
+    ("receptors", "1_prepare_receptors_pdb_to_pdbqt.py", "configs/vina_receptor.conf.example",
+     ["PDB_DIR"], [], [], False),
+    ("ligands", "2_convert_ligands_mae_to_pdbqt.py", "configs/vina_ligand.conf.example",
+     ["LIGANDS_DIR"], ["PDBQT_OUTPUT_DIR"], [], False),
+    ("docking", "3_run_vina_crossdocking.py", "configs/vina_docking.conf.example",
+     ["PROTEIN_DIR", "LIGAND_DIR", "VINA_CONFIG"], ["OUTPUT_DIR"], ["receptors", "ligands"], False),
+    ("model1", "4_extract_vina_model1.py", "configs/model1_extraction.conf.example",
+     ["INPUT_DIR"], ["OUTPUT_DIR"], ["docking"], False),
+    ("rmsd", "5_vina_rmsd_pymol.py", "configs/vina_rmsd.conf.example",
+     ["REFERENCE_DIR", "POSE_DIR"], ["OUTPUT_CSV"], ["model1"], True),
+    ("rmsd_matrix", "6_vina_rmsd_matrix_builder.py", "configs/rmsd_matrix.conf.example",
+     ["INPUT_CSV"], ["OUTPUT_FILE"], ["rmsd"], True),
+    ("heatmap", "7_vina_rmsd_heatmap.py", "configs/heatmap.conf.example",
+     ["MATRIX_FILE"], ["OUTPUT_PNG"], ["rmsd_matrix"], True),
 ]
 
-for script, conf in pipeline_steps:
-    print(f"Running {script} with {conf}...")
-    subprocess.run([sys.executable, f"scripts/{script}", conf], check=True)
+steps = []
+for name, script, conf, inputs, outputs, after, in_process in pipeline_steps:
+    values = read_conf(conf)
+    steps.append(Step(name, f"scripts/{script}", [conf],
+                      inputs=[conf] + [values.get(key) for key in inputs],
+                      outputs=[values.get(key) for key in outputs],
+                      after=after, in_process=in_process))
+
+parser = argparse.ArgumentParser(description="Vina cross-docking pipeline")
+add_arguments(parser)
+sys.exit(run_pipeline(steps, parser.parse_args()))
@@ -3,8 +3,12 @@ import logging
 import time
 from pathlib import Path
 from multiprocessing import Pool, cpu_count
+import os
 import sys
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "..")))
+from vs_common.ligand_prep import prepare_ligands
+
 def load_config(cfg_path):
     cfg = {}
     with open(cfg_path) as f:
@@ -23,12 +27,18 @@ def convert_mae_to_mol2(args):
     subprocess.run(cmd, check=True)
     logging.info(f"MAE→MOL2: {mae_file.name}")
 
-def convert_mol2_to_pdbqt(args):
-    mol2_file, pythonsh, prepare_script, pdbqt_dir = args
-    pdbqt_file = pdbqt_dir / (mol2_file.stem + ".pdbqt")
-    cmd = [pythonsh, prepare_script, "-l", str(mol2_file), "-o", str(pdbqt_file)]
-    subprocess.run(cmd, check=True)
-    logging.info(f"MOL2→PDBQT: {mol2_file.name}")
+def convert_to_pdbqt(args):
+    ligand_files, backend, pythonsh, prepare_script, pdbqt_dir = args
+    jobs = [(str(f), str(pdbqt_dir / (f.stem + ".pdbqt"))) for f in ligand_files]
+    failed = 0
+    for ligand_file, error in prepare_ligands(jobs, backend, pythonsh, prepare_script).items():
+        name = Path(ligand_file).name
+        if error is None:
+            logging.info(f"{Path(ligand_file).suffix[1:].upper()}→PDBQT: {name}")
+        else:
+            logging.error(f"PDBQT preparation failed for {name}: {error}")
+            failed += 1
+    return failed
 
 def main():
     if len(sys.argv) != 2:
@@ -43,30 +53,42 @@ def main():
     )
 
     ligands_dir = Path(cfg["LIGANDS_DIR"])
-    mol2_dir = Path(cfg["MOL2_OUTPUT_DIR"])
     pdbqt_dir = Path(cfg["PDBQT_OUTPUT_DIR"])
-    mol2_dir.mkdir(exist_ok=True)
     pdbqt_dir.mkdir(exist_ok=True)
+    backend = cfg.get("LIGAND_PREP_BACKEND", "mgltools")
+    n_procs = min(cpu_count(), int(cfg.get("N_PROCS", 8)))
 
     mae_files = list(ligands_dir.glob("*.mae"))
 
     start = time.time()
 
-    with Pool(min(cpu_count(), int(cfg.get("N_PROCS", 8)))) as pool:
-        pool.map(
-            convert_mae_to_mol2,
-            [(f, cfg["SCHRODINGER_RUN"], mol2_dir) for f in mae_files]
-        )
+    if backend == "meeko":
+        # Meeko reads the .mae files directly, no MOL2 intermediate needed
+        ligand_files = mae_files
+    else:
+        mol2_dir = Path(cfg["MOL2_OUTPUT_DIR"])
+        mol2_dir.mkdir(exist_ok=True)
+        with Pool(n_procs) as pool:
+            pool.map(
+                convert_mae_to_mol2,
+                [(f, cfg["SCHRODINGER_RUN"], mol2_dir) for f in mae_files]
+            )
+        ligand_files = list(mol2_dir.glob("*.mol2"))
 
-    mol2_files = list(mol2_dir.glob("*.mol2"))
+    chunk_size = int(cfg.get("CHUNK_SIZE", 50))
+    if ligand_files:
+        chunk_size = min(chunk_size, -(-len(ligand_files) // n_procs))
+    chunks = [ligand_files[i:i + chunk_size] for i in range(0, len(ligand_files), chunk_size)]
 
-    with Pool(min(cpu_count(), int(cfg.get("N_PROCS", 8)))) as pool:
-        pool.map(
-            convert_mol2_to_pdbqt,
-            [(f, cfg["MGLTOOLS_PYTHONSH"], cfg["PREPARE_LIGAND_SCRIPT"], pdbqt_dir)
-             for f in mol2_files]
-        )
+    with Pool(n_procs) as pool:
+        failed = sum(pool.map(
+            convert_to_pdbqt,
+            [(chunk, backend, cfg.get("MGLTOOLS_PYTHONSH"), cfg.get("PREPARE_LIGAND_SCRIPT"), pdbqt_dir)
+             for chunk in chunks]
+        ))
 
+    if failed:
+        logging.warning(f"{failed} ligands could not be converted to PDBQT")
     logging.info(f"Completed in {time.time() - start:.2f} seconds")
 
 if __name__ == "__main__":
@@ -3,7 +3,11 @@ import pandas as pd
 import logging
 import time
 import sys
-from pymol import cmd
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "..")))
+from vs_common.rmsd import calculate_rmsd
+from vs_common.pairing import pair_directory, prepared_reference_id, vina_pose_name, log_pairing
 
 logging.basicConfig(
     filename="vina_rmsd.log",
@@ -21,17 +25,9 @@ def load_config(cfg_path):
     return cfg
 
 def match_reference_to_poses(ref_dir, pose_dir):
-    ref_files = list(ref_dir.glob("*.pdb"))
-    pose_files = list(pose_dir.glob("*.pdbqt"))
-
-    matches = []
-    for ref in ref_files:
-        ref_id = ref.stem.replace("_-_prepared", "")
-        for pose in pose_files:
-            pose_id = pose.stem.replace("_-_prepared_protein", "").replace("_-_prepared", "")
-            if ref_id in pose_id:
-                matches.append((ref, pose))
-    return matches
+    pairing = pair_directory(ref_dir, pose_dir, ".pdb", ".pdbqt", prepared_reference_id, vina_pose_name)
+    log_pairing(pairing)
+    return [(ref_dir / ref, pose_dir / pose) for ref, pose in pairing.pairs]
 
 def main():
     if len(sys.argv) != 2:
@@ -49,23 +45,25 @@ def main():
     pairs = match_reference_to_poses(ref_dir, pose_dir)
     logging.info(f"Total matched pairs: {len(pairs)}")
 
-    for ref, pose in pairs:
-        try:
-            cmd.load(ref.as_posix(), "ref")
-            cmd.load(pose.as_posix(), "pose")
-            rmsd = cmd.rms_cur("pose", "ref", matchmaker=4)
-            cmd.delete("all")
+    rmsds = calculate_rmsd(
+        pairs,
+        method=cfg.get("RMSD_METHOD", "index"),
+        processes=int(cfg["RMSD_PROCESSES"]) if cfg.get("RMSD_PROCESSES") else None
+    )
 
-            results.append({
-                "Reference": ref.name,
-                "Pose": pose.name,
-                "RMSD": rmsd
-            })
+    for ref, pose in pairs:
+        rmsd = rmsds[(ref, pose)]
+        if isinstance(rmsd, Exception):
+            logging.error(f"Failed RMSD for {pose.name}: {rmsd}")
+            continue
 
-            logging.info(f"{ref.name} vs {pose.name}: RMSD={rmsd:.3f}")
+        results.append({
+            "Reference": ref.name,
+            "Pose": pose.name,
+            "RMSD": rmsd
+        })
 
-        except Exception as e:
-            logging.error(f"Failed RMSD for {pose.name}: {e}")
+        logging.info(f"{ref.name} vs {pose.name}: RMSD={rmsd:.3f}")
 
     pd.DataFrame(results).to_csv(output_csv, index=False)
     logging.info(f"Finished in {time.time() - start:.2f} s")
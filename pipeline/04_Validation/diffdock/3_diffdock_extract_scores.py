@@ -1,30 +1,68 @@
 import os
-import re
+import sys
 import pandas as pd
 import yaml
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.sdf_tags import extract_sdf_tags, list_sdf_files, write_table
+from vs_common.results_store import ResultsStore, results_frame, ligand_from_file
+from vs_common.extraction_manifest import ExtractionManifest, pending_files
+
 with open("diffdock_scores.conf.example", "r") as f:
     config = yaml.safe_load(f)
 
 sdf_folder = config["sdf_folder"]
-output_csv = config["output_csv"]
-
-patterns = {
-    "minimizedAffinity": r"> <minimizedAffinity>\n(.*?)\n"
-}
-
-data = []
-
-for sdf_file in os.listdir(sdf_folder):
-    if sdf_file.endswith(".sdf"):
-        with open(os.path.join(sdf_folder, sdf_file), 'r') as file:
-            content = file.read()
-            file_data = {"File": sdf_file}
-            for key, pattern in patterns.items():
-                match = re.search(pattern, content)
-                file_data[key] = match.group(1) if match else None
-            data.append(file_data)
-
-df = pd.DataFrame(data)
-df.to_csv(output_csv, index=False)
-print(f"Extracted DiffDock & GNINA rescoring results saved to {output_csv}")
+output_csv = config.get("output_csv")
+processes = config.get("processes")
+store = ResultsStore(config["results_store"]) if config.get("results_store") else None
+run = config.get("run", "default")
+manifest = ExtractionManifest(config["manifest"]) if config.get("manifest") else None
+
+ENGINE = "diffdock"
+
+tags = ["minimizedAffinity"]
+
+if __name__ == "__main__":
+    sdf_files = [os.path.basename(path) for path in list_sdf_files(sdf_folder)]
+    # Only new or changed files when a manifest or results store is used
+    sdf_files = pending_files(sdf_folder, sdf_files, manifest, store, run, ENGINE)
+
+    columns, errors = extract_sdf_tags([os.path.join(sdf_folder, f) for f in sdf_files], tags, processes=processes)
+    for path, error in errors:
+        print(f"Could not read {path}: {error}")
+
+    if store:
+        added = store.append(results_frame(
+            run, ENGINE, [ligand_from_file(name) for name in columns["File"]],
+            columns["minimizedAffinity"], columns["File"],
+            receptor=config.get("receptor", ""), poses=columns["Pose"], title=columns["Title"],
+            **{tag: columns[tag] for tag in tags if tag != "minimizedAffinity"}
+        ))
+        print(f"Added {added} results to {config['results_store']} (run {run})")
+
+    if manifest:
+        # Files that could not be read are tried again on the next run
+        unreadable = {os.path.basename(path) for path, _ in errors}
+        manifest.record_all([f for f in sdf_files if f not in unreadable], zip(*columns.values()))
+        manifest.flush()
+        print(f"Parsed {len(sdf_files)} new or changed files")
+
+    if store:
+        stored = store.read(["source", "pose", "title", "score", *tags[1:]], run, ENGINE)
+        columns = {"File": stored["source"], "Pose": stored["pose"], "Title": stored["title"],
+                   "minimizedAffinity": stored["score"]}
+        columns.update({tag: stored[tag] for tag in tags[1:]})
+    elif manifest:
+        rows = manifest.rows()
+        columns = {name: [row[i] for row in rows] for i, name in enumerate(columns)}
+
+    df = pd.DataFrame(columns)
+
+    if output_csv:
+        write_table(df, output_csv)
+        print(f"Extracted DiffDock & GNINA rescoring results saved to {output_csv}")
+
+    if config.get("leaderboard_csv"):
+        # Best scores of everything extracted so far, e.g. during a running screen
+        df.nsmallest(config.get("top_n", 100), "minimizedAffinity").to_csv(config["leaderboard_csv"], index=False)
+        print(f"Top {config.get('top_n', 100)} hits saved to {config['leaderboard_csv']}")
@@ -1,20 +1,38 @@
+import os
+import sys
 import pandas as pd
 from sklearn.metrics import roc_curve, auc
 import matplotlib.pyplot as plt
 import yaml
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.results_store import ResultsStore
+
 with open("diffdock_roc.conf.example", "r") as f:
     config = yaml.safe_load(f)
 
-actives_file_path = config["actives_file"]
-decoys_file_path = config["decoys_file"]
+actives_file_path = config.get("actives_file")
+decoys_file_path = config.get("decoys_file")
 output_plot = config["output_plot"]
 expected_actives = config.get("n_actives")
 expected_decoys = config.get("n_decoys")
 
-actives = pd.read_csv(actives_file_path)
-decoys = pd.read_csv(decoys_file_path)
-decoys0 = pd.read_csv(decoys_file_path)
+if config.get("results_store"):
+    # Read only the file and score columns of the two runs from the results store
+    store = ResultsStore(config["results_store"])
+    columns = {'source': 'File', 'score': 'minimizedAffinity'}
+    actives = store.scores(config["actives_run"], 'diffdock')[list(columns)].rename(columns=columns)
+    decoys = store.scores(config["decoys_run"], 'diffdock')[list(columns)].rename(columns=columns)
+else:
+    actives = pd.read_csv(actives_file_path)
+    decoys = pd.read_csv(decoys_file_path)
+decoys0 = decoys.copy()
+
+# The score extraction reports every pose; each compound is scored by its first (top-ranked) pose
+if 'Pose' in actives.columns:
+    actives = actives[actives['Pose'] == 1].copy()
+    decoys = decoys[decoys['Pose'] == 1].copy()
+    decoys0 = decoys0[decoys0['Pose'] == 1]
 
 actives['is_active'] = 1
 decoys['is_active'] = 0
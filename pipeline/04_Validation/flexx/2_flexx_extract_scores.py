@@ -1,27 +1,64 @@
 import os
+import sys
 import pandas as pd
 import yaml
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.results_store import ResultsStore, results_frame, ligand_from_file
+from vs_common.extraction_manifest import ExtractionManifest, pending_files
+
 with open("flexx_extract_scores.conf.example", "r") as f:
     config = yaml.safe_load(f)
 
 sdf_dir = config["sdf_dir"]
-output_csv = config["output_csv"]
+output_csv = config.get("output_csv")
+store = ResultsStore(config["results_store"]) if config.get("results_store") else None
+run = config.get("run", "default")
+manifest = ExtractionManifest(config["manifest"]) if config.get("manifest") else None
+
+sdf_files = sorted(f for f in os.listdir(sdf_dir) if f.endswith(".sdf"))
+# Only new or changed files when a manifest or results store is used
+sdf_files = pending_files(sdf_dir, sdf_files, manifest, store, run, "flexx")
 
 data = []
 
-for sdf_file in os.listdir(sdf_dir):
-    if sdf_file.endswith(".sdf"):
-        file_path = os.path.join(sdf_dir, sdf_file)
-        with open(file_path, "r") as f:
-            content = f.read()
-            if "<BIOSOLVEIT.DOCKING_SCORE>" in content:
-                start_idx = content.find("<BIOSOLVEIT.DOCKING_SCORE>") + len("<BIOSOLVEIT.DOCKING_SCORE>")
-                end_idx = content.find("$$$$", start_idx)
-                score = content[start_idx:end_idx].strip()
-                data.append([sdf_file, float(score)])
+for sdf_file in sdf_files:
+    file_path = os.path.join(sdf_dir, sdf_file)
+    with open(file_path, "r") as f:
+        content = f.read()
+        if "<BIOSOLVEIT.DOCKING_SCORE>" in content:
+            start_idx = content.find("<BIOSOLVEIT.DOCKING_SCORE>") + len("<BIOSOLVEIT.DOCKING_SCORE>")
+            end_idx = content.find("$$$$", start_idx)
+            score = content[start_idx:end_idx].strip()
+            data.append([sdf_file, float(score)])
+
+if store:
+    added = store.append(results_frame(
+        run, "flexx",
+        [ligand_from_file(name) for name, _ in data],
+        [score for _, score in data],
+        [name for name, _ in data],
+        receptor=config.get("receptor", "")
+    ))
+    print(f"Added {added} results to {config['results_store']} (run {run})")
+
+if manifest:
+    manifest.record_all(sdf_files, data)
+    manifest.flush()
+    print(f"Parsed {len(sdf_files)} new or changed files")
+
+if store:
+    data = store.read(["source", "score"], run, "flexx").values.tolist()
+elif manifest:
+    data = manifest.rows()
 
 df = pd.DataFrame(data, columns=["File Name", "Results"])
-df.to_csv(output_csv, index=False)
 
-print(f"Docking scores extracted and saved to {output_csv}")
+if output_csv:
+    df.to_csv(output_csv, index=False)
+    print(f"Docking scores extracted and saved to {output_csv}")
+
+if config.get("leaderboard_csv"):
+    # Best scores of everything extracted so far, e.g. during a running screen
+    df.nsmallest(config.get("top_n", 100), "Results").to_csv(config["leaderboard_csv"], index=False)
+    print(f"Top {config.get('top_n', 100)} hits saved to {config['leaderboard_csv']}")
@@ -1,20 +1,32 @@
+import os
+import sys
 import pandas as pd
 from sklearn.metrics import roc_curve, auc
 import matplotlib.pyplot as plt
 import yaml
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.results_store import ResultsStore
+
 with open("flexx_roc.conf.example", "r") as f:
     config = yaml.safe_load(f)
 
-actives_file_path = config["actives_csv"]
-decoys_file_path = config["decoys_csv"]
+actives_file_path = config.get("actives_csv")
+decoys_file_path = config.get("decoys_csv")
 save_path = config["output_png"]
 n_actives = config.get("n_actives", None)
 n_decoys = config.get("n_decoys", None)
 
-actives = pd.read_csv(actives_file_path)
-decoys = pd.read_csv(decoys_file_path)
-decoys0 = pd.read_csv(decoys_file_path)
+if config.get("results_store"):
+    # Read only the file and score columns of the two runs from the results store
+    store = ResultsStore(config["results_store"])
+    columns = {'source': 'File Name', 'score': 'Results'}
+    actives = store.scores(config["actives_run"], 'flexx')[list(columns)].rename(columns=columns)
+    decoys = store.scores(config["decoys_run"], 'flexx')[list(columns)].rename(columns=columns)
+else:
+    actives = pd.read_csv(actives_file_path)
+    decoys = pd.read_csv(decoys_file_path)
+decoys0 = decoys.copy()
 
 actives['is_active'] = 1
 decoys['is_active'] = 0
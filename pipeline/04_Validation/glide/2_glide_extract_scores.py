@@ -1,29 +1,66 @@
 import os
 import re
+import sys
 import pandas as pd
 import yaml
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.results_store import ResultsStore, results_frame, ligand_from_file
+from vs_common.extraction_manifest import ExtractionManifest, pending_files
+
 with open("glide_scores.conf.example", "r") as f:
     config = yaml.safe_load(f)
 
 log_dir = config["log_dir"]
-output_csv = config["output_csv"]
+output_csv = config.get("output_csv")
+store = ResultsStore(config["results_store"]) if config.get("results_store") else None
+run = config.get("run", "default")
+manifest = ExtractionManifest(config["manifest"]) if config.get("manifest") else None
 
 score_pattern = re.compile(r"Best docking score:\s*(-\d+\.\d+)")
 
+log_files = sorted(f for f in os.listdir(log_dir) if f.endswith(".log"))
+# Only new or changed files when a manifest or results store is used
+log_files = pending_files(log_dir, log_files, manifest, store, run, "glide")
+
 results = []
 
-for log_file in os.listdir(log_dir):
-    if log_file.endswith(".log"):
-        log_file_path = os.path.join(log_dir, log_file)
-        with open(log_file_path, "r") as f:
-            content = f.read()
-            match = score_pattern.search(content)
-            if match:
-                best_score = float(match.group(1))
-                results.append([log_file, best_score])
+for log_file in log_files:
+    log_file_path = os.path.join(log_dir, log_file)
+    with open(log_file_path, "r") as f:
+        content = f.read()
+        match = score_pattern.search(content)
+        if match:
+            best_score = float(match.group(1))
+            results.append([log_file, best_score])
+
+if store:
+    added = store.append(results_frame(
+        run, "glide",
+        [ligand_from_file(name) for name, _ in results],
+        [score for _, score in results],
+        [name for name, _ in results],
+        receptor=config.get("receptor", "")
+    ))
+    print(f"Added {added} results to {config['results_store']} (run {run})")
+
+if manifest:
+    manifest.record_all(log_files, results)
+    manifest.flush()
+    print(f"Parsed {len(log_files)} new or changed files")
+
+if store:
+    results = store.read(["source", "score"], run, "glide").values.tolist()
+elif manifest:
+    results = manifest.rows()
 
 df = pd.DataFrame(results, columns=["File Name", "Results"])
-df.to_csv(output_csv, index=False)
 
-print(f"Best docking scores saved to {output_csv}")
+if output_csv:
+    df.to_csv(output_csv, index=False)
+    print(f"Best docking scores saved to {output_csv}")
+
+if config.get("leaderboard_csv"):
+    # Best scores of everything extracted so far, e.g. during a running screen
+    df.nsmallest(config.get("top_n", 100), "Results").to_csv(config["leaderboard_csv"], index=False)
+    print(f"Top {config.get('top_n', 100)} hits saved to {config['leaderboard_csv']}")
@@ -1,20 +1,32 @@
+import os
+import sys
 import pandas as pd
 from sklearn.metrics import roc_curve, auc
 import matplotlib.pyplot as plt
 import yaml
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.results_store import ResultsStore
+
 with open("glide_roc.conf.example", "r") as f:
     config = yaml.safe_load(f)
 
-actives_file_path = config["actives_file"]
-decoys_file_path = config["decoys_file"]
+actives_file_path = config.get("actives_file")
+decoys_file_path = config.get("decoys_file")
 output_figure = config["output_figure"]
 expected_actives = config.get("expected_actives", 50)
 expected_decoys = config.get("expected_decoys", 500)
 
-actives = pd.read_csv(actives_file_path)
-decoys = pd.read_csv(decoys_file_path)
-decoys0 = pd.read_csv(decoys_file_path)
+if config.get("results_store"):
+    # Read only the file and score columns of the two runs from the results store
+    store = ResultsStore(config["results_store"])
+    columns = {"source": "File Name", "score": "GlideScore"}
+    actives = store.scores(config["actives_run"], "glide")[list(columns)].rename(columns=columns)
+    decoys = store.scores(config["decoys_run"], "glide")[list(columns)].rename(columns=columns)
+else:
+    actives = pd.read_csv(actives_file_path)
+    decoys = pd.read_csv(decoys_file_path)
+decoys0 = decoys.copy()
 
 required_columns = {"File Name", "GlideScore"}
 if not required_columns.issubset(actives.columns) or not required_columns.issubset(decoys.columns):
@@ -1,26 +1,64 @@
 import os
+import sys
 import pandas as pd
 import yaml
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.results_store import ResultsStore, results_frame, ligand_from_file
+from vs_common.extraction_manifest import ExtractionManifest, pending_files
+
 with open("vina_scores.conf.example", "r") as f:
     config = yaml.safe_load(f)
 
 pdbqt_dir = config["pdbqt_dir"]
-output_csv = config["output_csv"]
+output_csv = config.get("output_csv")
+store = ResultsStore(config["results_store"]) if config.get("results_store") else None
+run = config.get("run", "default")
+manifest = ExtractionManifest(config["manifest"]) if config.get("manifest") else None
+
+pdbqt_files = sorted(f for f in os.listdir(pdbqt_dir) if f.endswith('.pdbqt'))
+# Only new or changed files when a manifest or results store is used
+pdbqt_files = pending_files(pdbqt_dir, pdbqt_files, manifest, store, run, "vina")
 
 data = []
 
-for pdbqt_file in os.listdir(pdbqt_dir):
-    if pdbqt_file.endswith('.pdbqt'):
-        file_path = os.path.join(pdbqt_dir, pdbqt_file)
-        
-        with open(file_path, 'r') as file:
-            for line in file:
-                if line.startswith("REMARK VINA RESULT:"):
-                    vina_result = float(line.split()[3])
-                    data.append([pdbqt_file, vina_result])
-                    break  # Move to next file after extracting result
+for pdbqt_file in pdbqt_files:
+    file_path = os.path.join(pdbqt_dir, pdbqt_file)
+
+    with open(file_path, 'r') as file:
+        for line in file:
+            if line.startswith("REMARK VINA RESULT:"):
+                vina_result = float(line.split()[3])
+                data.append([pdbqt_file, vina_result])
+                break  # Move to next file after extracting result
+
+if store:
+    added = store.append(results_frame(
+        run, "vina",
+        [ligand_from_file(name) for name, _ in data],
+        [score for _, score in data],
+        [name for name, _ in data],
+        receptor=config.get("receptor", "")
+    ))
+    print(f"Added {added} results to {config['results_store']} (run {run})")
+
+if manifest:
+    manifest.record_all(pdbqt_files, data)
+    manifest.flush()
+    print(f"Parsed {len(pdbqt_files)} new or changed files")
+
+if store:
+    data = store.read(["source", "score"], run, "vina").values.tolist()
+elif manifest:
+    data = manifest.rows()
 
 df = pd.DataFrame(data, columns=['File Name', 'Vina Result'])
-df.to_csv(output_csv, index=False)
-print(f"CSV file saved to {output_csv}")
+
+if output_csv:
+    df.to_csv(output_csv, index=False)
+    print(f"CSV file saved to {output_csv}")
+
+if config.get("leaderboard_csv"):
+    # Best scores of everything extracted so far, e.g. during a running screen
+    df.nsmallest(config.get("top_n", 100), 'Vina Result').to_csv(config["leaderboard_csv"], index=False)
+    print(f"Top {config.get('top_n', 100)} hits saved to {config['leaderboard_csv']}")
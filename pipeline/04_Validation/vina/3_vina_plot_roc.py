@@ -1,19 +1,31 @@
+import os
+import sys
 import pandas as pd
 from sklearn.metrics import roc_curve, auc
 import matplotlib.pyplot as plt
 import yaml
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.results_store import ResultsStore
+
 with open("vina_roc.conf.example", "r") as f:
     config = yaml.safe_load(f)
 
-actives_file_path = config["actives_file_path"]
-decoys_file_path = config["decoys_file_path"]
+actives_file_path = config.get("actives_file_path")
+decoys_file_path = config.get("decoys_file_path")
 save_path = config["save_path"]
 n_actives = config.get("n_actives")
 n_decoys = config.get("n_decoys")
 
-actives = pd.read_csv(actives_file_path)
-decoys = pd.read_csv(decoys_file_path)
+if config.get("results_store"):
+    # Read only the file and score columns of the two runs from the results store
+    store = ResultsStore(config["results_store"])
+    columns = {'source': 'File Name', 'score': 'Vina Result'}
+    actives = store.scores(config["actives_run"], 'vina')[list(columns)].rename(columns=columns)
+    decoys = store.scores(config["decoys_run"], 'vina')[list(columns)].rename(columns=columns)
+else:
+    actives = pd.read_csv(actives_file_path)
+    decoys = pd.read_csv(decoys_file_path)
 
 actives['is_active'] = 1
 decoys['is_active'] = 0
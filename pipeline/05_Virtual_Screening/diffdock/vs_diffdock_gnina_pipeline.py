@@ -1,16 +1,21 @@
 #!/usr/bin/env python3
 import os
+import sys
 import json
 import shutil
 import gzip
 import logging
-import re
+import tempfile
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
 import subprocess
-import pandas as pd
 import argparse
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.checkpoint_store import checkpoint_store_for_dir
+from vs_common.sdf_tags import TAG_RE, extract_sdf_tags, list_sdf_files, write_table
+from vs_common.leaderboard import leaderboard_from_config
+
 
 def setup_logger(log_file):
     logging.basicConfig(
@@ -60,24 +65,147 @@ def copy_and_rename_sdf(results_dir, copied_dir, logger, copy_threads):
     return copied_files
 
 
-def gnina_rescore(copied_files, protein_file, rescored_dir, gnina_exec, logger):
-    os.makedirs(rescored_dir, exist_ok=True)
+def sdf_records(text):
+    """Split SDF text into records, each ending with its "$$$$" line."""
+    records, lines = [], []
+    for line in text.splitlines(keepends=True):
+        lines.append(line)
+        if line.startswith("$$$$"):
+            records.append("".join(lines))
+            lines = []
+    if "".join(lines).strip():
+        records.append("".join(lines) + ("" if lines[-1].endswith("\n") else "\n") + "$$$$\n")
+    return records
+
+
+def titled_record(sdf_file):
+    """First record of an SDF file, with the ligand name (file stem) as its title."""
+    records = sdf_records(read_sdf_file(sdf_file))
+    if not records:
+        raise ValueError(f"No SDF record in {sdf_file}")
+    body = records[0].partition("\n")[2]
+    return f"{sdf_file.stem}\n{body}"
+
+
+def rescore_output_path(rescored_dir, name):
+    return Path(rescored_dir) / f"{name}_rescored.sdf.gz"
+
+
+def build_rescore_chunks(pending, chunk_size, workers):
+    """Split pending ligands into chunks, small enough that every worker gets one."""
+    if pending:
+        chunk_size = min(chunk_size, -(-len(pending) // workers))
+    return [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+
+
+def record_tag(record, tag):
+    """Value of the first `tag` data item of an SDF record, or None."""
+    for name, value in TAG_RE.findall(record):
+        if name == tag:
+            return value.strip()
+    return None
+
+
+def rescore_chunk(sdf_files, protein_file, rescored_dir, gnina_exec, threads, cpu_only, store, logger,
+                  leaderboard=None):
+    """Minimize a chunk of poses with one gnina call and split the output per ligand.
+
+    The poses are merged into one multi-record SDF, so gnina reads the
+    receptor once per chunk. Output records are matched back to ligands by
+    title; ligands without an output record are marked failed. The
+    minimizedAffinity of every rescored ligand is offered to the leaderboard.
+    """
+    batch_fd, batch_in = tempfile.mkstemp(prefix=".batch_", suffix=".sdf", dir=rescored_dir)
+    batch_out = batch_in[:-len(".sdf")] + "_out.sdf"
+    names = []
+    try:
+        with os.fdopen(batch_fd, "w") as f:
+            for sdf_file in sdf_files:
+                try:
+                    f.write(titled_record(sdf_file))
+                    names.append(sdf_file.stem)
+                except Exception as e:
+                    store.mark_failed(f"rescored_{sdf_file.stem}", e)
+                    logger.error(f"Error rescoring {sdf_file}: {e}")
+        if not names:
+            return 0
 
-    for sdf_file in copied_files:
-        out_file = Path(rescored_dir) / f"{sdf_file.stem}_rescored.sdf.gz"
         cmd = [
             gnina_exec,
             "-r", protein_file,
-            "-l", str(sdf_file),
+            "-l", batch_in,
             "--minimize",
             "--seed", "1",
-            "-o", str(out_file)
+            "-o", batch_out
         ]
+        if threads:
+            cmd += ["--cpu", str(threads)]
+        if cpu_only:
+            cmd.append("--no_gpu")
+
+        error = None
         try:
             subprocess.run(cmd, check=True)
-            logger.info(f"Rescored {sdf_file.name}")
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error rescoring {sdf_file}: {e}")
+        except (subprocess.CalledProcessError, OSError) as e:
+            error = e
+            logger.error(f"Error rescoring a chunk of {len(names)} ligands: {e}")
+
+        outputs = {}
+        for record in sdf_records(read_sdf_file(Path(batch_out))):
+            outputs.setdefault(record.partition("\n")[0].strip(), record)
+
+        for name in names:
+            key = f"rescored_{name}"
+            if name not in outputs:
+                store.mark_failed(key, error or "no output record written by gnina")
+                logger.error(f"Error rescoring {name}.sdf: {error or 'no output record'}")
+                continue
+            out_file = rescore_output_path(rescored_dir, name)
+            tmp_file = f"{out_file}.tmp"
+            with gzip.open(tmp_file, "wt") as f:
+                f.write(outputs[name])
+            os.replace(tmp_file, out_file)
+            store.mark_done(key)
+            logger.info(f"Rescored {name}.sdf")
+            if leaderboard is not None:
+                leaderboard.add(Path(protein_file).stem, name, record_tag(outputs[name], "minimizedAffinity"),
+                                source=out_file.name)
+    finally:
+        store.flush()
+        for path in (batch_in, batch_out):
+            if os.path.exists(path):
+                os.remove(path)
+    return sum(1 for name in names if store.is_done(f"rescored_{name}"))
+
+
+def gnina_rescore(copied_files, protein_file, rescored_dir, gnina_exec, logger, store,
+                  workers=1, threads=None, chunk_size=100, cpu_only=False, leaderboard=None):
+    """Rescore every copied pose that is not yet done, one gnina call per chunk.
+
+    Chunks run on `workers` concurrent gnina processes with `threads` CPU
+    threads each (gnina --cpu). cpu_only adds --no_gpu, so several workers do
+    not compete for one GPU. Each ligand is checkpointed as
+    rescored_<ligand>. Returns the number of ligands that are still not done.
+    """
+    os.makedirs(rescored_dir, exist_ok=True)
+
+    by_key = {f"rescored_{sdf_file.stem}": sdf_file for sdf_file in copied_files}
+    pending = [by_key[key] for key in store.remaining(sorted(by_key))]
+    logger.info(f"{len(by_key) - len(pending)} of {len(by_key)} poses already rescored")
+    if not pending:
+        return 0
+
+    chunks = build_rescore_chunks(pending, max(1, chunk_size), workers)
+    logger.info(f"Rescoring {len(pending)} poses in {len(chunks)} chunks on {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(rescore_chunk, chunk, protein_file, rescored_dir, gnina_exec,
+                            threads, cpu_only, store, logger, leaderboard)
+            for chunk in chunks
+        ]
+        rescored = sum(future.result() for future in futures)
+
+    return len(pending) - rescored
 
 
 def read_sdf_file(path: Path) -> str:
@@ -92,31 +220,17 @@ def read_sdf_file(path: Path) -> str:
         return ""
 
 
-def extract_metrics_to_csv(sdf_folder: Path, csv_out: Path, logger: logging.Logger):
-    patterns = {
-        "minimizedAffinity": r"> <minimizedAffinity>\n(.*?)\n",
-        "CNNscore": r"> <CNNscore>\n(.*?)\n",
-        "CNNaffinity": r"> <CNNaffinity>\n(.*?)\n",
-        "CNN_VS": r"> <CNN_VS>\n(.*?)\n",
-        "CNNaffinity_variance": r"> <CNNaffinity_variance>\n(.*?)\n",
-    }
+METRICS = ["minimizedAffinity", "CNNscore", "CNNaffinity", "CNN_VS", "CNNaffinity_variance"]
 
-    data = []
 
-    for file in Path(sdf_folder).glob("*"):
-        if file.suffix in [".sdf", ".gz"]:
-            content = read_sdf_file(file)
-            if not content:
-                continue
-            row = {"File": file.name}
-            for key, pattern in patterns.items():
-                match = re.search(pattern, content)
-                row[key] = match.group(1) if match else None
-            data.append(row)
+def extract_metrics_to_csv(sdf_folder: Path, csv_out: Path, logger: logging.Logger, processes=None):
+    columns, errors = extract_sdf_tags(list_sdf_files(sdf_folder), METRICS, processes=processes)
+    for path, error in errors:
+        logger.error(f"Could not read {path}: {error}")
 
-    if data:
-        pd.DataFrame(data).to_csv(csv_out, index=False)
-        logger.info(f"Saved CSV: {csv_out}")
+    if columns["File"]:
+        write_table(columns, csv_out)
+        logger.info(f"Saved CSV: {csv_out} ({len(columns['File'])} poses)")
 
 
 def main():
@@ -134,9 +248,9 @@ def main():
     logger = setup_logger(log_file)
 
     copy_threads = cfg.get("parallel", 1)
+    store = checkpoint_store_for_dir(str(chk_dir), cfg.get("checkpoint_db"))
 
-    copied_chk = chk_dir / "copied.chk"
-    if copied_chk.exists():
+    if store.is_done("copied"):
         copied_files = list(Path(cfg["copied_dir"]).glob("*.sdf"))
     else:
         copied_files = copy_and_rename_sdf(
@@ -147,24 +261,39 @@ def main():
         )
         if not copied_files:
             return
-        copied_chk.write_text("DONE")
+        store.mark_done("copied")
+        store.flush()
 
-    rescored_chk = chk_dir / "rescored.chk"
-    if not rescored_chk.exists():
-        gnina_rescore(
+    if not store.is_done("rescored"):
+        leaderboard = leaderboard_from_config(cfg)
+        not_done = gnina_rescore(
             copied_files,
             cfg["protein_file"],
             cfg["rescored_dir"],
             cfg["gnina_executable"],
-            logger
+            logger,
+            store,
+            workers=max(1, int(cfg.get("rescore_workers", 1))),
+            threads=cfg.get("rescore_threads"),
+            chunk_size=int(cfg.get("rescore_chunk_size", 100)),
+            cpu_only=bool(cfg.get("rescore_cpu_only", False)),
+            leaderboard=leaderboard
         )
-        rescored_chk.write_text("DONE")
+        if leaderboard is not None:
+            leaderboard.save()
+            logger.info(f"Top {leaderboard.k} rescored poses saved to {leaderboard.path}")
+        if not_done:
+            logger.warning(f"{not_done} poses failed rescoring; rerun to retry them")
+        else:
+            store.mark_done("rescored")
+        store.flush()
 
-    metrics_chk = chk_dir / "metrics.chk"
-    if not metrics_chk.exists():
+    if not store.is_done("metrics"):
         csv_out = chk_dir.parent / f"gnina_score_{Path(cfg['results_dir']).name}.csv"
-        extract_metrics_to_csv(cfg["rescored_dir"], csv_out, logger)
-        metrics_chk.write_text("DONE")
+        extract_metrics_to_csv(cfg["rescored_dir"], csv_out, logger, cfg.get("extract_processes"))
+        if store.is_done("rescored"):
+            store.mark_done("metrics")
+        store.flush()
 
 
 if __name__ == "__main__":
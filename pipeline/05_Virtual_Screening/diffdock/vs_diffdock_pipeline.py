@@ -1,32 +1,20 @@
 import os
+import sys
 import json
 import logging
-import re
 import pandas as pd
-import subprocess
 from concurrent.futures import ThreadPoolExecutor
 from time import time
 import argparse
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.mae_reader import load_mae_index, read_mae_header, write_single_mae
+from vs_common.checkpoint_store import checkpoint_store_for_dir
+from vs_common.structconvert import convert_mae_files, chunked
 
-def parse_mae_to_dict(mae_file):
-    with open(mae_file, "r") as f:
-        content = f.read()
 
-    molecules = content.split("f_m_ct {")
-    if len(molecules) <= 1:
-        return {}
-
-    header = molecules[0]
-    molecule_dict = {}
-
-    for molecule in molecules[1:]:
-        match = re.search(r'"(.+)"', molecule)
-        if match:
-            name = match.group(1)
-            molecule_dict[name] = header + f"f_m_ct {{\n{molecule}"
-
-    return molecule_dict
+def checkpoint_store(config):
+    return checkpoint_store_for_dir(config["checkpoint_dir"], config.get("checkpoint_db"))
 
 
 def parse_csv_to_dict(csv_file):
@@ -35,66 +23,73 @@ def parse_csv_to_dict(csv_file):
 
 
 def write_molecule_to_file(args):
-    output_file, content = args
-    with open(output_file, "w") as f:
-        f.write(content)
-
-def extract_molecules(mae_dict, molecule_names, config, vs_context):
-    checkpoint_dir = config["checkpoint_dir"]
+    output_file, key, header, mae_path, offset, length, store = args
+    try:
+        write_single_mae(output_file, header, mae_path, offset, length)
+        store.mark_done(key)
+    except OSError as e:
+        store.mark_failed(key, e)
+        logging.error(f"Failed to write {output_file}: {e}")
+
+def extract_molecules(mae_path, molecule_names, config, vs_context):
+    store = checkpoint_store(config)
     os.makedirs(config["extracted_mae_dir"], exist_ok=True)
+    index_dir = config.get("mae_index_dir", os.path.join(config["checkpoint_dir"], "mae_index"))
 
+    mae_index = load_mae_index(mae_path, index_dir)
+    header = read_mae_header(mae_path)
     to_write = []
 
-    for name, molecule in mae_dict.items():
-        if name not in molecule_names:
+    for name in molecule_names:
+        entries = mae_index.get(name)
+        if not entries:
             continue
 
         formatted = f"{vs_context}_{name.replace(' ', '_')}.mae"
         out_path = os.path.join(config["extracted_mae_dir"], formatted)
-        chk = os.path.join(checkpoint_dir, f"{formatted}.chk")
 
-        if os.path.exists(chk):
+        if store.is_done(formatted):
             logging.info(f"Checkpoint exists, skipping {formatted}")
             continue
 
-        to_write.append((out_path, molecule))
-
-        with open(chk, "w") as f:
-            f.write("DONE")
+        offset, length = entries[-1]
+        to_write.append((out_path, formatted, header, mae_path, offset, length, store))
 
     with ThreadPoolExecutor() as exe:
-        exe.map(write_molecule_to_file, to_write)
+        list(exe.map(write_molecule_to_file, to_write))
+    store.flush()
 
 def convert_mae_to_mol2(mae_files, config):
-    checkpoint_dir = config["checkpoint_dir"]
+    store = checkpoint_store(config)
     os.makedirs(config["mol2_output_dir"], exist_ok=True)
 
-    def convert_single(mae_file):
+    jobs = []
+    for mae_file in mae_files:
         base = os.path.splitext(os.path.basename(mae_file))[0]
-        mol2 = os.path.join(config["mol2_output_dir"], f"{base}.mol2")
-        chk = os.path.join(checkpoint_dir, f"{base}.mol2.chk")
-
-        if os.path.exists(chk):
+        if store.is_done(f"{base}.mol2"):
             logging.info(f"Skipping conversion (checkpoint): {base}")
-            return
-
-        cmd = [
-            config["schrodinger_run"],
-            "structconvert.py",
-            mae_file,
-            mol2
-        ]
-
-        try:
-            subprocess.run(cmd, check=True)
-            with open(chk, "w") as f:
-                f.write("DONE")
-            logging.info(f"Converted {base}.mae → mol2")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"Conversion failed for {mae_file}: {e}")
-
-    with ThreadPoolExecutor() as exe:
-        exe.map(convert_single, mae_files)
+            continue
+        jobs.append((mae_file, os.path.join(config["mol2_output_dir"], f"{base}.mol2")))
+
+    def convert_chunk(chunk):
+        results = convert_mae_files(chunk, config["schrodinger_run"], workdir=config["mol2_output_dir"])
+        for mae_file, mol2 in chunk:
+            base = os.path.splitext(os.path.basename(mae_file))[0]
+            if results[mae_file] is None:
+                store.mark_done(f"{base}.mol2")
+                logging.info(f"Converted {base}.mae → mol2")
+            else:
+                store.mark_failed(f"{base}.mol2", results[mae_file])
+                logging.error(f"Conversion failed for {mae_file}: {results[mae_file]}")
+
+    workers = min(32, (os.cpu_count() or 1) + 4)
+    chunk_size = int(config.get("structconvert_chunk_size", 200))
+    if jobs:
+        chunk_size = min(chunk_size, -(-len(jobs) // workers))
+
+    with ThreadPoolExecutor(max_workers=workers) as exe:
+        list(exe.map(convert_chunk, chunked(jobs, chunk_size)))
+    store.flush()
 
 def generate_diffdock_csv(ligand_dir, output_csv, protein_file):
     ligands = []
@@ -177,6 +172,7 @@ def main():
     )
 
     logging.info("Starting DiffDock pipeline")
+    logging.info(f"Using checkpoint database {checkpoint_store(config).db_path}")
 
     molecule_names = parse_csv_to_dict(config["csv_file"])
     vs_context = os.path.basename(os.path.dirname(config["extracted_mae_dir"]))
@@ -184,8 +180,7 @@ def main():
     for mae in os.listdir(config["mae_dir"]):
         if mae.endswith(".mae"):
             mae_path = os.path.join(config["mae_dir"], mae)
-            mae_dict = parse_mae_to_dict(mae_path)
-            extract_molecules(mae_dict, molecule_names, config, vs_context)
+            extract_molecules(mae_path, molecule_names, config, vs_context)
 
     extracted = [
         os.path.join(config["extracted_mae_dir"], f)
@@ -1,28 +1,30 @@
 import os
+import sys
 import glob
 import json
 import argparse
-import subprocess
 from rdkit import Chem
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.checkpoint_store import checkpoint_store_for_dir
+from vs_common.structconvert import convert_mae_files, chunked
+
 def load_config(config_path):
     with open(config_path, "r") as f:
         return json.load(f)
 
-def checkpoint_path(step, checkpoint_dir, prefix):
-    return os.path.join(checkpoint_dir, f"{step}_{prefix}.chk")
+def checkpoint_key(step, prefix):
+    return f"{step}_{prefix}"
 
-def convert_single_mae_to_sdf(mae_file, sdf_file):
-    schrodinger = os.environ.get("SCHRODINGER")
-    if not schrodinger:
-        raise EnvironmentError("SCHRODINGER environment variable is not set.")
-    cmd = [f"{schrodinger}/run", "structconvert.py", mae_file, sdf_file]
-    try:
-        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return True
-    except subprocess.CalledProcessError:
-        return False
+def convert_mae_chunk_to_sdf(jobs, backend, rdkit_fallback):
+    run_path = None
+    if backend == "schrodinger":
+        schrodinger = os.environ.get("SCHRODINGER")
+        if not schrodinger:
+            raise EnvironmentError("SCHRODINGER environment variable is not set.")
+        run_path = f"{schrodinger}/run"
+    return convert_mae_files(jobs, run_path, backend, rdkit_fallback)
 
 def merge_sdf_files(sdf_files, merged_file):
     writer = Chem.SDWriter(merged_file)
@@ -49,47 +51,59 @@ def main():
     merged_sdf_path = config["merged_sdf_path"]
     checkpoint_dir = config["checkpoint_dir"]
     checkpoint_prefix = config.get("checkpoint_prefix", "flexx")
+    backend = config.get("conversion_backend", "schrodinger")
+    rdkit_fallback = config.get("rdkit_fallback", False)
+    workers = os.cpu_count()
 
     os.makedirs(output_sdf_dir, exist_ok=True)
     os.makedirs(checkpoint_dir, exist_ok=True)
 
-    cp1 = checkpoint_path("mae_to_sdf", checkpoint_dir, checkpoint_prefix)
-    cp2 = checkpoint_path("merge_sdf", checkpoint_dir, checkpoint_prefix)
+    store = checkpoint_store_for_dir(checkpoint_dir, config.get("checkpoint_db"))
+    cp1 = checkpoint_key("mae_to_sdf", checkpoint_prefix)
+    cp2 = checkpoint_key("merge_sdf", checkpoint_prefix)
 
-    if not os.path.exists(cp1):
+    if not store.is_done(cp1):
         mae_files = glob.glob(os.path.join(input_mae_dir, "*.mae"))
-        print(f"Converting {len(mae_files)} MAE files to SDF using {os.cpu_count()} processes.")
+        print(f"Converting {len(mae_files)} MAE files to SDF using {workers} processes ({backend} backend).")
+
+        jobs = []
+        for mae_file in mae_files:
+            base = os.path.basename(mae_file).replace(".mae", ".sdf")
+            sdf_file = os.path.join(output_sdf_dir, base)
+            if not os.path.exists(sdf_file):
+                jobs.append((mae_file, sdf_file))
+
+        chunk_size = int(config.get("structconvert_chunk_size", 200))
+        if jobs:
+            chunk_size = min(chunk_size, -(-len(jobs) // workers))
 
-        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
             futures = {}
-            for mae_file in mae_files:
-                base = os.path.basename(mae_file).replace(".mae", ".sdf")
-                sdf_file = os.path.join(output_sdf_dir, base)
-                if os.path.exists(sdf_file):
-                    continue
-                futures[executor.submit(convert_single_mae_to_sdf, mae_file, sdf_file)] = mae_file
+            for chunk in chunked(jobs, chunk_size):
+                futures[executor.submit(convert_mae_chunk_to_sdf, chunk, backend, rdkit_fallback)] = chunk
 
             for future in as_completed(futures):
-                mae_file = futures[future]
                 try:
-                    success = future.result()
-                    if not success:
-                        print(f"Conversion failed: {mae_file}")
+                    results = future.result()
                 except Exception as e:
-                    print(f"Error converting {mae_file}: {e}")
+                    results = {mae_file: e for mae_file, _ in futures[future]}
+                for mae_file, error in results.items():
+                    if error is not None:
+                        store.mark_failed(f"{cp1}_{os.path.basename(mae_file)}", error)
+                        print(f"Error converting {mae_file}: {error}")
 
-        with open(cp1, "w") as f:
-            f.write("done")
+        store.mark_done(cp1)
+        store.flush()
         print("MAE to SDF conversion completed.")
     else:
         print("MAE to SDF conversion skipped (checkpoint exists).")
 
-    if not os.path.exists(cp2):
+    if not store.is_done(cp2):
         sdf_files = glob.glob(os.path.join(output_sdf_dir, "*.sdf"))
         print(f"Merging {len(sdf_files)} SDF files into {merged_sdf_path}.")
         merge_sdf_files(sdf_files, merged_sdf_path)
-        with open(cp2, "w") as f:
-            f.write("done")
+        store.mark_done(cp2)
+        store.flush()
         print("Merge completed.")
     else:
         print("Merge step skipped (checkpoint exists).")
@@ -1,8 +1,12 @@
 import os
+import sys
 import json
 import argparse
 import subprocess
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.checkpoint_store import checkpoint_store_for_dir
+
 def load_config(config_path):
     with open(config_path, "r") as f:
         return json.load(f)
@@ -15,13 +19,13 @@ def run_flexx_docking(config):
     checkpoint_dir = config["checkpoint_dir"]
     flexx_executable = config["flexx_executable"]
     output_sdf = os.path.join(config["output_base_dir"], config.get("docking_output_sdf_name", "flexx_docked.sdf"))
-    checkpoint_file = os.path.join(checkpoint_dir, "flexx_docking_done.chk")
     log_file_path = os.path.join(config["output_base_dir"], "flexx_docking.log")
 
     os.makedirs(checkpoint_dir, exist_ok=True)
     os.makedirs(config["output_base_dir"], exist_ok=True)
 
-    if os.path.exists(checkpoint_file):
+    store = checkpoint_store_for_dir(checkpoint_dir, config.get("checkpoint_db"))
+    if store.is_done("flexx_docking_done"):
         print("FlexX docking skipped (checkpoint exists).")
         return
 
@@ -41,10 +45,12 @@ def run_flexx_docking(config):
     try:
         with open(log_file_path, "w") as log_file:
             subprocess.run(command, check=True, stdout=log_file, stderr=subprocess.STDOUT)
-        with open(checkpoint_file, "w") as f:
-            f.write("done")
+        store.mark_done("flexx_docking_done")
+        store.flush()
         print("Docking completed successfully. Log saved to:", log_file_path)
-    except subprocess.CalledProcessError:
+    except subprocess.CalledProcessError as e:
+        store.mark_failed("flexx_docking_done", e)
+        store.flush()
         print("FlexX docking failed.")
         print("Command:", " ".join(command))
         print(f"Check log file: {log_file_path}")
@@ -1,15 +1,36 @@
 import os
+import sys
 import argparse
 import json
 import csv
 from rdkit import Chem
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.checkpoint_store import checkpoint_store_for_dir
+from vs_common.results_store import ResultsStore, results_frame
+from vs_common.leaderboard import leaderboard_from_config
+
 def get_biosolveit_score(mol):
     for key in mol.GetPropNames():
         if "BIOSOLVEIT.DOCKING_SCORE" in key:
             return mol.GetProp(key)
     return "NA"
 
+def store_results(config, results):
+    """Append the _01 pose scores to the shared results store (run = checkpoint_prefix)."""
+    prefix = config["checkpoint_prefix"]
+    store = ResultsStore(config["results_store"])
+    done = store.sources(prefix, "flexx")
+    results = [(fname, score) for fname, score in results if fname not in done]
+    ligands = [fname[len(prefix) + 1:-len("_01.sdf")] for fname, _ in results]
+    added = store.append(results_frame(
+        prefix, "flexx", ligands,
+        [None if score == "NA" else score for _, score in results],
+        [fname for fname, _ in results],
+        receptor=os.path.splitext(os.path.basename(config.get("protein_path", "")))[0]
+    ))
+    print(f"Added {added} results to {config['results_store']} (run {prefix})")
+
 def filter_and_save_individual_poses(config):
     prefix = config["checkpoint_prefix"]
     checkpoint_dir = config["checkpoint_dir"]
@@ -22,15 +43,18 @@ def filter_and_save_individual_poses(config):
     os.makedirs(checkpoint_dir, exist_ok=True)
     os.makedirs(output_base_dir, exist_ok=True)
 
-    checkpoint_filter = os.path.join(checkpoint_dir, f"filter_poses_{prefix}.chk")
-    checkpoint_csv = os.path.join(checkpoint_dir, f"csv_creation_{prefix}.chk")
+    store = checkpoint_store_for_dir(checkpoint_dir, config.get("checkpoint_db"))
+    checkpoint_filter = f"filter_poses_{prefix}"
+    checkpoint_csv = f"csv_creation_{prefix}"
     csv_path = os.path.join(output_base_dir, f"{prefix}_flexx_results.csv")
 
-    if not os.path.exists(checkpoint_filter):
+    if not store.is_done(checkpoint_filter):
         suppl = Chem.SDMolSupplier(docking_output_sdf)
         if suppl is None:
             raise FileNotFoundError(f"Cannot open docked SDF file: {docking_output_sdf}")
 
+        leaderboard = leaderboard_from_config(config)
+        receptor = os.path.splitext(os.path.basename(config.get("protein_path", "")))[0]
         results = []
         for mol in suppl:
             if mol is None:
@@ -46,15 +70,20 @@ def filter_and_save_individual_poses(config):
 
                 docking_score = get_biosolveit_score(mol)
                 results.append((filename, docking_score))
+                if leaderboard is not None:
+                    leaderboard.add(receptor, name[:-len("_01")], docking_score, source=filename)
 
+        if leaderboard is not None:
+            leaderboard.save()
+            print(f"Top {leaderboard.k} poses saved to {leaderboard.path}")
         config["_results"] = results
-        with open(checkpoint_filter, "w") as f:
-            f.write("done")
+        store.mark_done(checkpoint_filter)
+        store.flush()
         print(f"Saved {len(results)} _01 poses to {docking_output_dir}")
     else:
         print(f"Filtering checkpoint exists, skipping filtering: {checkpoint_filter}")
 
-    if not os.path.exists(checkpoint_csv):
+    if not store.is_done(checkpoint_csv):
         results = config.get("_results")
         if results is None:
             results = []
@@ -71,8 +100,11 @@ def filter_and_save_individual_poses(config):
             writer.writerow(["filename", "docking_score"])
             writer.writerows(results)
 
-        with open(checkpoint_csv, "w") as f:
-            f.write("done")
+        if config.get("results_store"):
+            store_results(config, results)
+
+        store.mark_done(checkpoint_csv)
+        store.flush()
         print(f"Docking scores saved to CSV: {csv_path}")
     else:
         print(f"CSV creation checkpoint exists, skipping CSV generation: {checkpoint_csv}")
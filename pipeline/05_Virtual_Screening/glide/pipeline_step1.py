@@ -2,50 +2,139 @@ import argparse
 import json
 import logging
 import os
+import sys
 import shutil
 import time
+from itertools import islice
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.checkpoint_store import checkpoint_store_for_dir
+from vs_common.mae_reader import iter_mae_blocks
+from vs_common.structconvert import write_mae_chunk, chunked
+
+# Written to input_scripts_dir: {chunk job: [[ligand, title], ...]} in the order of the chunk file.
+CHUNK_MANIFEST = "ligand_chunks.json"
+
+def checkpoint_store(config):
+    return checkpoint_store_for_dir(config["checkpoints_dir"], config.get("checkpoint_db"))
+
+STAGING_MODES = ("copy", "sync", "symlink", "hardlink", "none")
+
+def staged_mae_dir(config):
+    """Directory the .in scripts read ligands from: the originals with mae_staging "none", else the staged copy."""
+    if config.get("mae_staging", "copy") == "none":
+        return config["mae_dir"]
+    return os.path.join(config["copied_mae_dir"], "mae")
+
+def _replace_with(dst_path, make):
+    """Create dst_path with make(tmp_path) and rename it into place, so a stale entry is never half-replaced."""
+    tmp_path = f"{dst_path}.tmp.{os.getpid()}"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        make(tmp_path)
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _is_staged(src_path, dst_path, mode):
+    if not os.path.lexists(dst_path):
+        return False
+    if mode == "symlink":
+        return os.path.islink(dst_path) and os.readlink(dst_path) == src_path
+    if mode == "hardlink":
+        if os.path.islink(dst_path):
+            return os.readlink(dst_path) == src_path
+        return os.path.samefile(src_path, dst_path)
+    src_stat, dst_stat = os.stat(src_path), os.lstat(dst_path)
+    return (not os.path.islink(dst_path) and src_stat.st_size == dst_stat.st_size
+            and src_stat.st_mtime_ns == dst_stat.st_mtime_ns)
+
+def stage_mae_files(src, dst, mode):
+    """Bring dst in line with the .mae files of src; returns (staged, unchanged, removed) counts.
+
+    "sync" copies only new or changed files (size or mtime differ; copy2 keeps
+    the mtime), "symlink" and "hardlink" link to the originals instead of
+    copying them. A hardlink that cannot be made (e.g. across filesystems)
+    falls back to a symlink. Staged files no longer in src are removed, and
+    so are .tmp.<pid> files left behind by a run that was killed mid-write.
+    """
+    os.makedirs(dst, exist_ok=True)
+    with os.scandir(src) as entries:
+        names = {entry.name for entry in entries if entry.name.endswith(".mae") and entry.is_file()}
+
+    staged = unchanged = removed = 0
+    for name in sorted(names):
+        src_path = os.path.abspath(os.path.join(src, name))
+        dst_path = os.path.join(dst, name)
+        if _is_staged(src_path, dst_path, mode):
+            unchanged += 1
+            continue
+        if mode == "hardlink":
+            try:
+                _replace_with(dst_path, lambda tmp: os.link(src_path, tmp))
+            except OSError as e:
+                logging.warning(f"Cannot hardlink {src_path} ({e}); using a symlink.")
+                _replace_with(dst_path, lambda tmp: os.symlink(src_path, tmp))
+        elif mode == "symlink":
+            _replace_with(dst_path, lambda tmp: os.symlink(src_path, tmp))
+        else:
+            _replace_with(dst_path, lambda tmp: shutil.copy2(src_path, tmp))
+        staged += 1
+
+    with os.scandir(dst) as entries:
+        stale = [entry.path for entry in entries
+                 if (entry.name.endswith(".mae") and entry.name not in names) or ".mae.tmp." in entry.name]
+    for path in stale:
+        os.remove(path)
+        removed += 1
+    return staged, unchanged, removed
 
 def copy_mae_dir(config):
-    """Copy .mae files to a working directory, checkpointed."""
-    checkpoint_copy = "copy_mae_dir.chk"
-    checkpoint_path = os.path.join(config["checkpoints_dir"], checkpoint_copy)
-    if os.path.exists(checkpoint_path):
+    """Stage .mae files in a working directory, checkpointed.
+
+    mae_staging selects how: "copy" (default) replaces the working directory
+    with a full copy once; "sync", "symlink" and "hardlink" update it in
+    place on every run, which only touches new, changed or removed files;
+    "none" stages nothing and the .in scripts read the originals.
+    """
+    store = checkpoint_store(config)
+    mode = config.get("mae_staging", "copy")
+    if mode not in STAGING_MODES:
+        raise ValueError(f"Unknown mae_staging {mode!r}, expected one of {STAGING_MODES}")
+    if mode == "none":
+        logging.info(f"MAE staging disabled; .in scripts will read ligands from {config['mae_dir']}")
+        return
+    if mode == "copy" and store.is_done("copy_mae_dir"):
         logging.info("MAE directory copy checkpoint found. Skipping copying.")
         return
 
     src = config["mae_dir"]
     dst = os.path.join(config["copied_mae_dir"], "mae")
-    logging.info(f"Copying MAE directory from {src} to {dst}")
+    logging.info(f"Staging MAE directory from {src} to {dst} ({mode})")
 
     try:
-        if os.path.exists(dst):
-            shutil.rmtree(dst)
-        shutil.copytree(src, dst)
-        logging.info("MAE directory copied successfully.")
-
-        os.makedirs(config["checkpoints_dir"], exist_ok=True)
-        with open(checkpoint_path, "w") as f:
-            f.write("done")
+        if mode == "copy":
+            if os.path.exists(dst):
+                shutil.rmtree(dst)
+            shutil.copytree(src, dst)
+            logging.info("MAE directory copied successfully.")
+        else:
+            staged, unchanged, removed = stage_mae_files(src, dst, mode)
+            logging.info(f"MAE directory staged: {staged} new or changed, {unchanged} unchanged, {removed} removed.")
+        store.mark_done("copy_mae_dir")
+        store.flush()
     except Exception as e:
-        logging.error(f"Failed to copy MAE directory: {e}")
+        store.mark_failed("copy_mae_dir", e)
+        store.flush()
+        logging.error(f"Failed to stage MAE directory: {e}")
         raise e
 
-def generate_in_files(config):
-    """Generate Glide .in input files for docking from .mae ligands."""
-    input_scripts_dir = config.get("input_scripts_dir", os.path.join(config["copied_mae_dir"], "input_scripts"))
-    mae_dir = os.path.join(config["copied_mae_dir"], "mae")
-    grid_file = config["grid_file"]
-
-    os.makedirs(input_scripts_dir, exist_ok=True)
-    mae_files = [f for f in os.listdir(mae_dir) if f.endswith(".mae")]
-    logging.info(f"Found {len(mae_files)} .mae files to create .in scripts.")
-
-    for mae_file in mae_files:
-        ligand_path = os.path.join(mae_dir, mae_file)
-        in_file_name = os.path.splitext(mae_file)[0] + ".in"
-        in_file_path = os.path.join(input_scripts_dir, in_file_name)
-
-        file_content = f"""GRIDFILE   {grid_file}
+def write_in_file(input_scripts_dir, job_name, grid_file, ligand_path):
+    in_file_path = os.path.join(input_scripts_dir, job_name + ".in")
+    file_content = f"""GRIDFILE   {grid_file}
 LIGANDFILE   {ligand_path}
 CALC_INPUT_RMS   True
 DOCKING_METHOD confgen
@@ -53,9 +142,100 @@ FORCEFIELD OPLS4
 POSE_OUTTYPE ligandlib_sd
 PRECISION SP
 """
-        with open(in_file_path, "w") as f:
-            f.write(file_content)
-        logging.info(f"Created {in_file_path}")
+    with open(in_file_path, "w") as f:
+        f.write(file_content)
+    logging.info(f"Created {in_file_path}")
+
+def is_single_structure(mae_path):
+    return sum(1 for _ in islice(iter_mae_blocks(mae_path), 2)) == 1
+
+def generate_chunk_files(config, mae_dir, mae_files, input_scripts_dir, grid_file, ligands_per_job):
+    """Concatenate ligands_per_job single-structure .mae files into chunk_NNNNN.mae and write one .in per chunk.
+
+    Every Glide job then pays for its launch, grid load and licence checkout
+    once per chunk instead of once per ligand. Files holding several
+    structures are docked on their own, as before. The ligands of each chunk
+    are recorded in CHUNK_MANIFEST, so step3 can split the poses back into one
+    .sdf per ligand. mae_files only lists ligands that have no job yet: they
+    go to new chunks numbered after the existing ones, which are kept.
+
+    A Glide job reads a single LIGANDFILE, so the chunk files are always
+    written to copied_mae_dir/chunks, whatever mae_staging is: with "none",
+    "symlink" or "hardlink" the ligands end up copied there once after all.
+    """
+    mode = config.get("mae_staging", "copy")
+    if mode in ("none", "symlink", "hardlink"):
+        logging.warning(f"ligands_per_job > 1 with mae_staging {mode!r}: chunk jobs still read concatenated "
+                        f"copies of the ligands from {config['copied_mae_dir']}/chunks.")
+    chunk_dir = os.path.join(config["copied_mae_dir"], "chunks")
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    singles, alone = [], []
+    for mae_file in mae_files:
+        (singles if is_single_structure(os.path.join(mae_dir, mae_file)) else alone).append(mae_file)
+
+    chunks = load_chunk_manifest(input_scripts_dir)
+    first = 1 + max((int(job.rsplit("_", 1)[1]) for job in chunks), default=0)
+    created = 0
+    for number, group in enumerate(chunked(singles, ligands_per_job), start=first):
+        job_name = f"chunk_{number:05d}"
+        chunk_path = os.path.join(chunk_dir, job_name + ".mae")
+        titles = write_mae_chunk([os.path.join(mae_dir, mae_file) for mae_file in group], chunk_path)
+        chunks[job_name] = [[os.path.splitext(mae_file)[0], title] for mae_file, title in zip(group, titles)]
+        write_in_file(input_scripts_dir, job_name, grid_file, chunk_path)
+        created += 1
+
+    for mae_file in alone:
+        logging.warning(f"{mae_file} holds several structures; docking it as its own job.")
+        write_in_file(input_scripts_dir, os.path.splitext(mae_file)[0], grid_file, os.path.join(mae_dir, mae_file))
+
+    manifest_path = os.path.join(input_scripts_dir, CHUNK_MANIFEST)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(chunks, f)
+    os.replace(tmp_path, manifest_path)
+    logging.info(f"Created {created} chunk jobs for {len(singles)} new ligands, {len(chunks)} in all ({manifest_path}).")
+
+def load_chunk_manifest(input_scripts_dir):
+    manifest_path = os.path.join(input_scripts_dir, CHUNK_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def generate_in_files(config):
+    """Generate Glide .in input files for docking from .mae ligands.
+
+    With ligands_per_job > 1 in the config, ligands are docked in chunks of
+    that many per job; otherwise each .mae file gets its own .in script.
+    Only ligands without a job yet get one, so a rerun after staging new
+    ligands adds just their scripts; scripts of ligands no longer staged
+    are removed.
+    """
+    input_scripts_dir = config.get("input_scripts_dir", os.path.join(config["copied_mae_dir"], "input_scripts"))
+    mae_dir = staged_mae_dir(config)
+    grid_file = config["grid_file"]
+    ligands_per_job = int(config.get("ligands_per_job", 1))
+
+    os.makedirs(input_scripts_dir, exist_ok=True)
+    mae_files = sorted(f for f in os.listdir(mae_dir) if f.endswith(".mae"))
+    ligands = {os.path.splitext(mae_file)[0] for mae_file in mae_files}
+    chunks = load_chunk_manifest(input_scripts_dir)
+    scripts = {f[:-3] for f in os.listdir(input_scripts_dir) if f.endswith(".in")}
+    for job in sorted(scripts - ligands - chunks.keys()):
+        logging.info(f"Removing {job}.in: its ligand is no longer staged.")
+        os.remove(os.path.join(input_scripts_dir, job + ".in"))
+
+    has_job = scripts | {ligand for members in chunks.values() for ligand, _ in members}
+    mae_files = [f for f in mae_files if os.path.splitext(f)[0] not in has_job]
+    logging.info(f"Found {len(mae_files)} .mae files without a .in script.")
+
+    if ligands_per_job > 1:
+        generate_chunk_files(config, mae_dir, mae_files, input_scripts_dir, grid_file, ligands_per_job)
+        return
+
+    for mae_file in mae_files:
+        write_in_file(input_scripts_dir, os.path.splitext(mae_file)[0], grid_file, os.path.join(mae_dir, mae_file))
 
 def main():
     parser = argparse.ArgumentParser(description="Glide Step 1: Prepare MAE files and .in scripts")
@@ -87,16 +267,15 @@ def main():
         logging.error("Aborting due to error in copying MAE directory.")
         return
 
-    checkpoint_infiles = "generated_in_files.chk"
-    checkpoint_infiles_path = os.path.join(config["checkpoints_dir"], checkpoint_infiles)
-    if os.path.exists(checkpoint_infiles_path):
+    store = checkpoint_store(config)
+    # The other staging modes pick up new and removed ligands on every run, so their scripts follow
+    if config.get("mae_staging", "copy") == "copy" and store.is_done("generated_in_files"):
         logging.info("Checkpoint found for .in files generation. Skipping.")
     else:
         logging.info("Generating .in files...")
         generate_in_files(config)
-        os.makedirs(config["checkpoints_dir"], exist_ok=True)
-        with open(checkpoint_infiles_path, "w") as f:
-            f.write("done")
+        store.mark_done("generated_in_files")
+        store.flush()
 
     elapsed_time = time.time() - start_time
     logging.info(f"Step 1 completed in {elapsed_time:.2f} seconds")
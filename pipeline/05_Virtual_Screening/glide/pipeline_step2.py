@@ -1,11 +1,24 @@
 import os
+import re
+import sys
 import time
+import shlex
 import logging
 import subprocess
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 import json
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.checkpoint_store import DONE, checkpoint_store_for_dir
+
+# Failures worth retrying after a pause: no licence available, or the job could
+# not be handed to Job Control. Anything else is a docking failure of that script.
+LICENCE_ERROR = re.compile(r"licen[cs]e|FLEXlm|lmgrd|check(ed)?[ -]?out", re.IGNORECASE)
+LAUNCH_ERROR = re.compile(r"fail(ed)? to (launch|start|submit)|jlaunch|jserver|job server|connection refused",
+                          re.IGNORECASE)
+
 def setup_logging(log_path):
     logging.basicConfig(
         filename=log_path,
@@ -19,16 +32,132 @@ def setup_logging(log_path):
     console.setFormatter(formatter)
     logging.getLogger('').addHandler(console)
 
-def run_glide(script_path, glide_path):
-    cmd = f"{glide_path} -HOST localhost {script_path}"
-    logging.info(f"Starting: {cmd}")
+def glide_command(config):
+    """Glide launcher and options; -WAIT makes the launcher return when the job has finished."""
+    options = config.get("glide_options", "-HOST localhost -WAIT")
+    return [config.get("glide_path", "glide"), *shlex.split(options)]
+
+def run_glide(script_path, command):
+    """Run one .in script; returns (script_path, error, kind) with kind None, "licence", "launch" or "failed"."""
+    cmd = [*command, str(script_path)]
+    logging.info(f"Starting: {' '.join(cmd)}")
     try:
-        subprocess.run(cmd, shell=True, check=True)
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except OSError as e:
+        logging.error(f"Failed to launch {script_path}: {e}")
+        return script_path, e, "launch"
+
+    output = f"{result.stdout}\n{result.stderr}".strip()
+    if output:
+        logging.debug(f"Output of {script_path.name}:\n{output}")
+    if result.returncode == 0:
         logging.info(f"Finished successfully: {script_path}")
-        return script_path, True
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Failed: {script_path} with error: {e}")
-        return script_path, False
+        return script_path, None, None
+
+    error = subprocess.CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
+    if LICENCE_ERROR.search(output):
+        kind = "licence"
+    elif result.returncode in (126, 127) or LAUNCH_ERROR.search(output):
+        kind = "launch"
+    else:
+        kind = "failed"
+    logging.error(f"Failed ({kind}): {script_path} with error: {error}")
+    return script_path, error, kind
+
+class GlideScheduler:
+    """Keeps up to `slots` Glide jobs in flight and starts the next script as soon as one finishes.
+
+    slots is the lower of --max_parallel and the number of Glide licences the
+    screen may hold. A licence or launch error puts the script back in the
+    queue (at most `retries` times), holds new launches for an exponentially
+    growing backoff and, for licence errors, lowers the in-flight limit to the
+    jobs that did get a licence; every success raises it again by one up to
+    slots. Other failures are recorded at once, without a pause. Each result is
+    committed to the checkpoint database as soon as the job ends.
+    """
+
+    def __init__(self, command, store, slots, retries=5, backoff_initial=30.0, backoff_max=600.0,
+                 report_interval=60.0):
+        self.command = command
+        self.store = store
+        self.slots = max(1, slots)
+        self.limit = self.slots
+        self.retries = retries
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.report_interval = report_interval
+        self.counts = Counter()
+
+    def _report(self, queue, running, busy, start, final=False):
+        now = time.time()
+        busy += sum(now - started for _, started in running.values())
+        utilization = busy / max(self.slots * (now - start), 1e-9)
+        logging.info(
+            f"{'Finished' if final else 'Running'}: {len(running)}/{self.limit} jobs in flight "
+            f"({self.slots} slots), {len(queue)} queued, {self.counts['done']} done, "
+            f"{self.counts['failed']} failed, {self.counts['retried']} retried, "
+            f"slot utilization {100 * utilization:.1f}%"
+        )
+
+    def run(self, scripts):
+        queue = deque(scripts)
+        attempts = Counter()
+        running = {}
+        busy = 0.0
+        errors_in_row = 0
+        resume_at = 0.0
+        start = last_report = time.time()
+
+        with ThreadPoolExecutor(max_workers=self.slots) as executor:
+            while queue or running:
+                now = time.time()
+                while queue and len(running) < self.limit and now >= resume_at:
+                    script = queue.popleft()
+                    self.store.mark_running(f"glide_{script.name}")
+                    running[executor.submit(run_glide, script, self.command)] = (script, time.time())
+
+                timeout = max(0.0, self.report_interval - (now - last_report))
+                if queue and resume_at > now:
+                    timeout = min(timeout, resume_at - now)
+                if running:
+                    finished, _ = wait(running, timeout=max(timeout, 0.1), return_when=FIRST_COMPLETED)
+                else:
+                    # Backoff with nothing in flight: wait() would return at once on an empty set
+                    time.sleep(timeout)
+                    finished = ()
+
+                for future in finished:
+                    script, started = running.pop(future)
+                    busy += time.time() - started
+                    script, error, kind = future.result()
+                    key = f"glide_{script.name}"
+                    if error is None:
+                        self.store.mark_done(key)
+                        self.counts["done"] += 1
+                        errors_in_row = 0
+                        self.limit = min(self.slots, self.limit + 1)
+                    elif kind in ("licence", "launch") and attempts[script] < self.retries:
+                        attempts[script] += 1
+                        self.counts["retried"] += 1
+                        queue.append(script)
+                        errors_in_row += 1
+                        if kind == "licence":
+                            self.limit = max(1, len(running))
+                        backoff = min(self.backoff_max, self.backoff_initial * 2 ** (errors_in_row - 1))
+                        resume_at = time.time() + backoff
+                        logging.warning(f"{kind} error for {script.name} (attempt {attempts[script]}); "
+                                        f"pausing new launches for {backoff:.1f} s, limit {self.limit} jobs")
+                    else:
+                        self.store.mark_failed(key, error)
+                        self.counts["failed"] += 1
+                    self.store.flush()
+
+                if time.time() - last_report >= self.report_interval:
+                    self._report(queue, running, busy, start)
+                    last_report = time.time()
+
+        self._report(queue, running, busy, start, final=True)
+        return self.counts
 
 def main(config_path, max_parallel=24):
     with open(config_path) as f:
@@ -37,46 +166,39 @@ def main(config_path, max_parallel=24):
     input_scripts_dir = Path(config["input_scripts_dir"])
     os.chdir(input_scripts_dir)
     log_file = Path(config["log_dir"]) / "pipeline_step2.log"
-    checkpoint_file = Path(config["checkpoints_dir"]) / "submitted_all_in_files.chk"
-    glide_path = config.get("glide_path", "glide")
+    checkpoints_dir = Path(config["checkpoints_dir"])
 
     setup_logging(str(log_file))
 
-    input_scripts = sorted(input_scripts_dir.glob("*.in"))
-    completed_jobs = set()
-    if checkpoint_file.exists():
-        with checkpoint_file.open("r") as f:
-            completed_jobs = set(line.strip() for line in f if line.strip())
+    store = checkpoint_store_for_dir(str(checkpoints_dir), config.get("checkpoint_db"))
+    completed_jobs = store.keys(DONE, prefix="glide_")
+    legacy_file = checkpoints_dir / "submitted_all_in_files.chk"
+    if not completed_jobs and legacy_file.exists():
+        imported = store.import_chk_list(str(legacy_file), prefix="glide_")
+        logging.info(f"Imported {imported} completed jobs from {legacy_file}")
+        completed_jobs = store.keys(DONE, prefix="glide_")
 
-    scripts_to_process = [script for script in input_scripts if script.name not in completed_jobs]
+    input_scripts = sorted(input_scripts_dir.glob("*.in"))
+    scripts_to_process = [script for script in input_scripts if f"glide_{script.name}" not in completed_jobs]
     if not scripts_to_process:
         logging.info("No new jobs to process. All jobs are submitted.")
         return
 
-    batch_wait = 30
-    for i in range(0, len(scripts_to_process), max_parallel):
-        batch = scripts_to_process[i:i + max_parallel]
-        logging.info(f"Processing batch {i // max_parallel + 1} with {len(batch)} jobs.")
-
-        with ThreadPoolExecutor(max_workers=max_parallel) as executor:
-            futures = {executor.submit(run_glide, script, glide_path): script for script in batch}
-
-            for future in as_completed(futures):
-                script_path, success = future.result()
-                if success:
-                    with checkpoint_file.open("a") as f:
-                        f.write(f"{script_path.name}\n")
-                else:
-                    logging.error(f"Failed: {script_path}")
-
-        logging.info(f"Batch {i // max_parallel + 1} completed. Waiting {batch_wait} seconds.")
-        time.sleep(batch_wait)
-
-    logging.info("All batches processed.")
+    slots = min(max_parallel, int(config.get("max_licences", max_parallel)))
+    logging.info(f"Scheduling {len(scripts_to_process)} Glide jobs on {slots} slots.")
+    scheduler = GlideScheduler(
+        glide_command(config), store, slots,
+        retries=int(config.get("launch_retries", 5)),
+        backoff_initial=float(config.get("backoff_initial", 30)),
+        backoff_max=float(config.get("backoff_max", 600)),
+        report_interval=float(config.get("report_interval", 60)),
+    )
+    scheduler.run(scripts_to_process)
+    logging.info("All jobs processed.")
 
 if __name__ == "__main__":
     import argparse
-    parser = argparse.ArgumentParser(description="Run Glide docking in parallel batches.")
+    parser = argparse.ArgumentParser(description="Run Glide docking jobs, keeping a fixed number in flight.")
     parser.add_argument("config", help="Path to JSON config file")
     parser.add_argument("--max_parallel", default=24, type=int, help="Max parallel jobs")
     args = parser.parse_args()
@@ -1,10 +1,19 @@
 import os
+import sys
 import json
 import gzip
 import shutil
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.checkpoint_store import DONE, RUNNING, checkpoint_store_for_dir
+from vs_common.extraction_manifest import ExtractionManifest
+from vs_common.sdf_tags import TAG_RE, iter_sdf_records, iter_sdf_text
+from vs_common.leaderboard import leaderboard_from_config
+
 def setup_logging(log_file):
     logging.basicConfig(
         level=logging.INFO,
@@ -15,23 +24,138 @@ def setup_logging(log_file):
         ]
     )
 
-def copy_and_decompress_gz(src_gz_path, dest_sdf_path):
-    try:
-        copied_gz_path = dest_sdf_path.with_suffix(".sdfgz")
-        shutil.copy(src_gz_path, copied_gz_path)
-        logging.info(f"Copied {src_gz_path} to {copied_gz_path}")
-
-        with gzip.open(copied_gz_path, 'rb') as f_in:
-            with open(dest_sdf_path, 'wb') as f_out:
-                shutil.copyfileobj(f_in, f_out)
-        logging.info(f"Decompressed {copied_gz_path} to {dest_sdf_path}")
+def decompress_gz(src_gz_path, dest_sdf_path):
+    """Decompress a Glide output straight from its source in one pass.
 
-        os.remove(copied_gz_path)
-        logging.info(f"Deleted temporary file {copied_gz_path}")
+    The .sdf is written under a temporary name and renamed when complete, so
+    an interrupted run never leaves a truncated result behind.
+    """
+    tmp_path = dest_sdf_path.with_name(f"{dest_sdf_path.name}.tmp.{os.getpid()}")
+    try:
+        with gzip.open(src_gz_path, 'rb') as f_in, open(tmp_path, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out, 1 << 20)
+        os.replace(tmp_path, dest_sdf_path)
+        logging.info(f"Decompressed {src_gz_path} to {dest_sdf_path}")
     except Exception as e:
         logging.error(f"Error processing {src_gz_path}: {e}")
+        if tmp_path.exists():
+            os.remove(tmp_path)
         raise
 
+def load_chunk_manifest(input_dir):
+    """{chunk job: [[ligand, title], ...]} written by step1 in multi-ligand mode, or {}."""
+    manifest_path = input_dir / "ligand_chunks.json"
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def pose_ligand(record, ligands, by_title):
+    """Ligand of one pose: from i_i_glide_lignum (1-based position in the chunk file), else a unique title."""
+    for name, value in TAG_RE.findall(record):
+        if name == "i_i_glide_lignum":
+            value = value.strip()
+            if value.isdigit() and 1 <= int(value) <= len(ligands):
+                return ligands[int(value) - 1][0]
+            break
+    names = by_title.get(record.partition("\n")[0].strip(), [])
+    return names[0] if len(names) == 1 else None
+
+def write_records(dest_sdf_path, records):
+    """Write SDF records under a temporary name and rename the file when complete, as decompress_gz does."""
+    tmp_path = dest_sdf_path.with_name(f"{dest_sdf_path.name}.tmp.{os.getpid()}")
+    try:
+        with open(tmp_path, "w") as f:
+            f.writelines(records)
+        os.replace(tmp_path, dest_sdf_path)
+    except Exception:
+        if tmp_path.exists():
+            os.remove(tmp_path)
+        raise
+
+def split_chunk_output(src_gz_path, job, ligands, docking_results_dir):
+    """Split the poses of a multi-ligand job into <ligand>.sdf files; returns the files written.
+
+    The output of one chunk is streamed once and its poses are grouped in
+    memory by ligand, keeping their order, so a ligand gets the same file as
+    when it was docked on its own. Poses that cannot be mapped to a ligand go
+    to <job>_unassigned.sdf. Each file is renamed into place when complete,
+    so an interrupted split never leaves a truncated ligand file behind.
+    """
+    by_title = defaultdict(list)
+    for name, title in ligands:
+        if title is not None:
+            by_title[title.strip()].append(name)
+
+    poses = defaultdict(list)
+    with gzip.open(src_gz_path, "rt", errors="replace") as f:
+        for record in iter_sdf_text(f):
+            ligand = pose_ligand(record, ligands, by_title) or f"{job}_unassigned"
+            poses[ligand].append(record + "\n$$$$\n")
+
+    written = []
+    for ligand, records in poses.items():
+        dest_sdf_path = docking_results_dir / f"{ligand}.sdf"
+        write_records(dest_sdf_path, records)
+        written.append(dest_sdf_path)
+    if f"{job}_unassigned" in poses:
+        logging.warning(f"{len(poses[f'{job}_unassigned'])} poses of {src_gz_path} could not be mapped to a ligand")
+    missing = len(ligands) - len(poses.keys() - {f"{job}_unassigned"})
+    logging.info(f"Split {src_gz_path} into {len(written)} files ({missing} of {len(ligands)} ligands without poses)")
+    return written
+
+def load_retry_counts(path):
+    """{job: resubmissions after finishing without output}, or {} before the first one."""
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_retry_counts(path, counts):
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(counts, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def record_missing_outputs(store, jobs, retries, counts):
+    """Mark jobs without a _lib.sdfgz output for resubmission; returns (jobs left done, jobs still running).
+
+    Jobs step2 has running are left alone, their output may still come. A
+    job step2 has not recorded as done or running failed or never ran and
+    is marked failed. A job recorded as done finished but docked no poses:
+    it is resubmitted at most `retries` times, counted in `counts`, and
+    then left done.
+    """
+    done = store.keys(DONE, prefix="glide_")
+    running = store.keys(RUNNING, prefix="glide_")
+    kept, live = [], []
+    for job in jobs:
+        key = f"glide_{job}.in"
+        if key in running:
+            live.append(job)
+        elif key not in done:
+            store.mark_failed(key, "no _lib.sdfgz output found")
+        elif counts.get(job, 0) >= retries:
+            kept.append(job)
+        else:
+            counts[job] = counts.get(job, 0) + 1
+            store.mark_failed(key, "finished without a _lib.sdfgz output")
+    return kept, live
+
+def add_to_leaderboard(leaderboard, receptor, sdf_path):
+    """Offer the docking score of every pose in a decompressed Glide output file."""
+    for title, values in iter_sdf_records(sdf_path, ["r_i_docking_score"]):
+        leaderboard.add(receptor, title, values.get("r_i_docking_score"), source=sdf_path.name)
+
+def process_output(sdfgz_file, chunks, docking_results_dir):
+    """Turn one _lib.sdfgz output into its .sdf result files; returns the files written."""
+    job = sdfgz_file.name.replace("_lib.sdfgz", "")
+    if job in chunks:
+        return split_chunk_output(sdfgz_file, job, chunks[job], docking_results_dir)
+    dest_sdf_path = docking_results_dir / f"{job}.sdf"
+    decompress_gz(sdfgz_file, dest_sdf_path)
+    return [dest_sdf_path]
+
 def main(config_path):
     with open(config_path, 'r') as f:
         config = json.load(f)
@@ -48,6 +172,7 @@ def main(config_path):
     setup_logging(log_file)
 
     logging.info("Starting Glide Step 3: Process docking results")
+    store = checkpoint_store_for_dir(str(checkpoints_dir), config.get("checkpoint_db"))
 
     in_basenames = {f.stem for f in input_dir.glob("*.in")}
     sdfgz_files = list(output_dir.glob("*_lib.sdfgz"))
@@ -55,19 +180,67 @@ def main(config_path):
     incomplete_jobs = sorted(list(in_basenames - completed_basenames))
 
     checkpoints_dir.mkdir(exist_ok=True, parents=True)
+    retry_counts_path = checkpoints_dir / "no_output_retries.json"
+    retry_counts = load_retry_counts(retry_counts_path)
+    no_poses, running = record_missing_outputs(store, incomplete_jobs, int(config.get("no_output_retries", 1)),
+                                               retry_counts)
+    store.flush()
+    save_retry_counts(retry_counts_path, retry_counts)
     with open(checkpoint_file, 'w') as chk:
         for job in incomplete_jobs:
-            chk.write(f"{job}.in\n")
+            if job not in running:
+                chk.write(f"{job}.in\n")
+    if running:
+        logging.info(f"{len(running)} jobs without output are still running; left to step2.")
+    if no_poses:
+        logging.warning(f"{len(no_poses)} jobs finished without poses after every retry; left as done.")
     logging.info(f"Checkpoint file created: {checkpoint_file}")
 
-    for sdfgz_file in sdfgz_files:
-        dest_sdf_path = docking_results_dir / sdfgz_file.name.replace("_lib.sdfgz", ".sdf")
-        copy_and_decompress_gz(sdfgz_file, dest_sdf_path)
+    # Outputs already processed, with their size and mtime at the time; only new or rewritten ones are processed.
+    manifest_path = config.get("step3_manifest", str(checkpoints_dir / "step3_manifest.sqlite"))
+    manifest = ExtractionManifest(manifest_path) if config.get("step3_incremental", True) else None
+    names = sorted(f.name for f in sdfgz_files)
+    if manifest is not None:
+        pending, removed = manifest.scan(str(output_dir), names, check_content=False)
+        manifest.forget(removed)
+        logging.info(f"{len(pending)} of {len(names)} outputs are new or changed ({manifest_path}).")
+    else:
+        pending = names
+
+    chunks = load_chunk_manifest(input_dir)
+    leaderboard = leaderboard_from_config(config)
+    receptor = Path(config.get("grid_file", "")).stem
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, int(config.get("step3_workers", 4)))) as executor:
+        futures = {executor.submit(process_output, output_dir / name, chunks, docking_results_dir): name
+                   for name in pending}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                sdf_paths = future.result()
+            except Exception as e:
+                errors.append((name, e))
+                continue
+            if manifest is not None:
+                manifest.record(name, [[name, sdf_path.name] for sdf_path in sdf_paths])
+            if leaderboard is not None:
+                for sdf_path in sdf_paths:
+                    add_to_leaderboard(leaderboard, receptor, sdf_path)
+    if manifest is not None:
+        manifest.close()
+
+    if leaderboard is not None:
+        leaderboard.save()
+        logging.info(f"Top {leaderboard.k} hits of {leaderboard.seen} poses saved to {leaderboard.path}")
+
+    if errors:
+        for name, error in errors:
+            logging.error(f"Failed to process {name}: {error}")
+        raise RuntimeError(f"{len(errors)} outputs could not be processed; rerun step3 to retry them")
 
-    process_done_file = checkpoints_dir / "all_process_done.chk"
-    with open(process_done_file, 'w') as done_file:
-        done_file.write("All processes completed successfully.\n")
-    logging.info(f"All processes completed. Final checkpoint created: {process_done_file}")
+    store.mark_done("all_process_done")
+    store.flush()
+    logging.info(f"All processes completed. Final checkpoint recorded in {store.db_path}")
 
 if __name__ == "__main__":
     import sys
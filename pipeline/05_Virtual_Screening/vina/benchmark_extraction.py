@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Benchmark ligand extraction from .mae libraries on synthetic data.
+
+Compares the original whole-file split + per-name substring scan against the
+title index (cold and warm) and the quoted-value mode of vs_vina_pipeline.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.mae_reader import load_mae_index, match_titles, match_quoted_values
+
+MAE_HEADER = "{\n  s_m_m2io_version\n  :::\n  2.0.0\n}\n\n"
+
+
+def synthetic_block(name, n_atoms):
+    atoms = "\n".join(f"    {i + 1} 3 {i * 0.1:.3f} {i * 0.2:.3f} {i * 0.3:.3f}" for i in range(n_atoms))
+    return (
+        "f_m_ct {\n"
+        "  s_m_title\n"
+        "  s_m_entry_name\n"
+        "  i_m_ct_format\n"
+        "  :::\n"
+        f'  "{name}"\n'
+        f'  "{name}.1"\n'
+        "  2\n"
+        f"  m_atom[{n_atoms}] {{\n"
+        "    i_m_mmod_type\n"
+        "    r_m_x_coord\n"
+        "    r_m_y_coord\n"
+        "    r_m_z_coord\n"
+        "    :::\n"
+        f"{atoms}\n"
+        "    :::\n"
+        "  }\n"
+        "}\n\n"
+    )
+
+
+def write_library(path, n_blocks, n_atoms):
+    names = [f"CSC{i:09d}" for i in range(n_blocks)]
+    with open(path, "w") as f:
+        f.write(MAE_HEADER)
+        for name in names:
+            f.write(synthetic_block(name, n_atoms))
+    return names
+
+
+def legacy_extract(mae_path, molecule_names):
+    with open(mae_path, "r") as f:
+        mae_content = f.read()
+
+    matched = set()
+    molecules = mae_content.split("f_m_ct {")
+    for molecule in molecules[1:]:
+        for filename in molecule_names:
+            if f'"{filename}"' in molecule:
+                matched.add(filename)
+    return matched
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run(n_blocks, n_names, n_atoms, skip_legacy, workdir):
+    mae_path = os.path.join(workdir, f"library_{n_blocks}.mae")
+    index_dir = os.path.join(workdir, "index")
+    all_names = write_library(mae_path, n_blocks, n_atoms)
+    selected = set(random.sample(all_names, min(n_names, n_blocks)))
+    selected.update(f"MISSING{i}" for i in range(max(1, n_names // 100)))
+
+    rows = []
+    if not skip_legacy:
+        elapsed, matched = timed(legacy_extract, mae_path, selected)
+        rows.append(("legacy split + substring", elapsed, len(matched)))
+
+    elapsed, index = timed(load_mae_index, mae_path, index_dir)
+    lookup, matched = timed(match_titles, index, selected)
+    rows.append(("title index (cold)", elapsed + lookup, len(matched)))
+
+    elapsed, index = timed(load_mae_index, mae_path, index_dir)
+    lookup, matched = timed(match_titles, index, selected)
+    rows.append(("title index (warm)", elapsed + lookup, len(matched)))
+
+    elapsed, matched = timed(match_quoted_values, mae_path, selected)
+    rows.append(("quoted values", elapsed, len(matched)))
+
+    size_mb = os.path.getsize(mae_path) / 1e6
+    print(f"\n{n_blocks} blocks ({size_mb:.1f} MB), {len(selected)} requested names")
+    for label, elapsed, n_matched in rows:
+        print(f"  {label:<26} {elapsed:9.3f} s   {n_matched} matched")
+
+    os.remove(mae_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark .mae ligand extraction strategies")
+    parser.add_argument("--blocks", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="Library sizes (number of f_m_ct blocks) to test")
+    parser.add_argument("--names", type=int, default=1000, help="Number of requested ligand names")
+    parser.add_argument("--atoms", type=int, default=30, help="Atoms per synthetic molecule")
+    parser.add_argument("--skip_legacy", action="store_true", help="Skip the original O(names x blocks) scan")
+    parser.add_argument("--seed", type=int, default=1698)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_blocks in args.blocks:
+            run(n_blocks, args.names, args.atoms, args.skip_legacy, workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Benchmark ligand PDBQT preparation backends (ligands/second).
+
+Compares MGLTools prepare_ligand4.py (one pythonsh process per ligand) with
+in-process Meeko over the same process pool. Ligands are read from
+--ligand_dir (.mol2 works for both backends) or generated from a small set
+of drug-like SMILES with RDKit, written as .pdb for MGLTools and .sdf for
+Meeko from the same 3D coordinates.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from functools import partial
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.ligand_prep import mgltools_paths, prepare_ligands
+from vs_common.structconvert import chunked
+
+SMILES = [
+    "CC(=O)Nc1ccc(O)cc1",
+    "CC(C)Cc1ccc(C(C)C(=O)O)cc1",
+    "O=C(O)c1ccccc1OC(C)=O",
+    "CN1CCC[C@H]1c1cccnc1",
+    "Cn1cnc2c1c(=O)n(C)c(=O)n2C",
+    "CC(C)NCC(O)COc1cccc2ccccc12",
+    "COc1ccc2[nH]cc(CCNC(C)=O)c2c1",
+    "CN(C)CCCN1c2ccccc2CCc2ccccc21",
+    "O=C(c1ccccc1)c1ccc(O)cc1",
+    "Clc1ccc(C(c2ccccc2)n2ccnc2)cc1",
+]
+
+
+def generate_ligands(n, workdir):
+    from rdkit import Chem
+    from rdkit.Chem import AllChem
+
+    sdf_files, pdb_files = [], []
+    for i in range(n):
+        mol = Chem.AddHs(Chem.MolFromSmiles(SMILES[i % len(SMILES)]))
+        AllChem.EmbedMolecule(mol, randomSeed=i)
+        mol.SetProp("_Name", f"LIG{i:06d}")
+        sdf_file = os.path.join(workdir, f"LIG{i:06d}.sdf")
+        pdb_file = os.path.join(workdir, f"LIG{i:06d}.pdb")
+        writer = Chem.SDWriter(sdf_file)
+        writer.write(mol)
+        writer.close()
+        Chem.MolToPDBFile(mol, pdb_file)
+        sdf_files.append(sdf_file)
+        pdb_files.append(pdb_file)
+    return {"meeko": sdf_files, "mgltools": pdb_files}
+
+
+def prepare_chunk(ligand_files, backend, pythonsh, prepare_script, out_dir):
+    jobs = [
+        (f, os.path.join(out_dir, os.path.splitext(os.path.basename(f))[0] + ".pdbqt"))
+        for f in ligand_files
+    ]
+    results = prepare_ligands(jobs, backend, pythonsh, prepare_script)
+    return sum(1 for error in results.values() if error is None)
+
+
+def run(backend, ligand_files, procs, chunk_size, pythonsh, prepare_script, workdir):
+    out_dir = tempfile.mkdtemp(prefix=f"{backend}_", dir=workdir)
+    chunks = chunked(ligand_files, min(chunk_size, -(-len(ligand_files) // procs)))
+    start = time.perf_counter()
+    with Pool(procs) as pool:
+        prepared = sum(pool.map(
+            partial(prepare_chunk, backend=backend, pythonsh=pythonsh,
+                    prepare_script=prepare_script, out_dir=out_dir),
+            chunks, chunksize=1
+        ))
+    return time.perf_counter() - start, prepared
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ligand PDBQT preparation backends")
+    parser.add_argument("--ligand_dir", help="Directory of .mol2/.sdf/.pdb ligands (default: generate ligands)")
+    parser.add_argument("--generate", type=int, default=200, help="Number of ligands to generate without --ligand_dir")
+    parser.add_argument("--backends", nargs="+", default=["meeko", "mgltools"], choices=["meeko", "mgltools"])
+    parser.add_argument("--mgltools_path", help="MGLTools installation directory (required for mgltools)")
+    parser.add_argument("--procs", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--chunk_size", type=int, default=50, help="Ligands per worker task")
+    args = parser.parse_args()
+
+    pythonsh = prepare_script = None
+    if "mgltools" in args.backends:
+        if not args.mgltools_path:
+            parser.error("--mgltools_path is required for the mgltools backend")
+        pythonsh, prepare_script = mgltools_paths(args.mgltools_path)
+
+    if "meeko" in args.backends:
+        # Import once here so forked workers do not each pay for it
+        import meeko  # noqa: F401
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.ligand_dir:
+            files = sorted(
+                os.path.join(args.ligand_dir, f) for f in os.listdir(args.ligand_dir)
+                if f.endswith((".mol2", ".sdf", ".pdb"))
+            )
+            inputs = {backend: files for backend in args.backends}
+        else:
+            inputs = generate_ligands(args.generate, workdir)
+
+        print(f"{args.procs} processes, chunks of up to {args.chunk_size} ligands")
+        for backend in args.backends:
+            ligand_files = inputs[backend]
+            elapsed, prepared = run(backend, ligand_files, args.procs, args.chunk_size,
+                                    pythonsh, prepare_script, workdir)
+            rate = prepared / elapsed if elapsed > 0 else 0.0
+            print(f"  {backend:<9} {len(ligand_files)} ligands  {prepared} prepared  "
+                  f"{elapsed:8.2f} s  {rate:8.1f} ligands/s")
+
+
+if __name__ == "__main__":
+    main()
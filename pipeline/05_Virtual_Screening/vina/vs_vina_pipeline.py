@@ -1,13 +1,27 @@
 import os
+import sys
 import json
 import argparse
 import logging
 import time
+import shutil
+import tempfile
 import subprocess
 import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from multiprocessing import Pool, cpu_count
 from functools import partial
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from vs_common.mae_reader import (
+    load_mae_index, match_titles, match_quoted_values, read_mae_header, read_mae_block
+)
+from vs_common.checkpoint_store import DONE, checkpoint_store_for_dir
+from vs_common.structconvert import convert_mae_files, chunked
+from vs_common.ligand_prep import mgltools_paths, prepare_ligands as prepare_pdbqt_files
+from vs_common.leaderboard import leaderboard_from_config
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Docking process automation script")
     parser.add_argument(
@@ -18,111 +32,227 @@ def parse_arguments():
     )
     return parser.parse_args()
 
+def checkpoint_store(config):
+    return checkpoint_store_for_dir(config["checkpoints_dir"], config.get("checkpoint_db"))
+
 def is_checkpoint_done(config, checkpoint_name):
-    checkpoint_path = os.path.join(config["checkpoints_dir"], checkpoint_name)
-    return os.path.exists(checkpoint_path)
+    return checkpoint_store(config).is_done(checkpoint_name)
 
 def write_checkpoint(config, checkpoint_name):
-    checkpoint_path = os.path.join(config["checkpoints_dir"], checkpoint_name)
-    with open(checkpoint_path, "w") as f:
-        f.write("done")
-
-def extract_molecules(mae_file, config):
-    checkpoint_name = f"extract_{os.path.basename(mae_file)}.chk"
-    if is_checkpoint_done(config, checkpoint_name):
-        logging.info(f"Checkpoint found. Skipping extraction for {mae_file}")
-        return
+    store = checkpoint_store(config)
+    store.mark_done(checkpoint_name)
+    store.flush()
 
-    df = pd.read_csv(config["csv_file"])
-    molecule_names = set(df["Molecule Name"].values)
-    mae_path = os.path.join(config["mae_dir"], mae_file)
-    vs_context = os.path.basename(os.path.dirname(config["extracted_mae_dir"]))
+def write_failure(config, checkpoint_name, error):
+    store = checkpoint_store(config)
+    store.mark_failed(checkpoint_name, error)
+    store.flush()
 
-    with open(mae_path, "r") as f:
-        mae_content = f.read()
-
-    molecules = mae_content.split("f_m_ct {")
-    if len(molecules) <= 1:
-        logging.warning(f"No molecules found in the .mae file: {mae_file}")
-        return
+def read_molecule_names(csv_file):
+    return pd.read_csv(csv_file)["Molecule Name"].astype(str)
 
-    header = molecules[0]
-    for molecule in molecules[1:]:
-        for filename in molecule_names:
-            if f'"{filename}"' in molecule:
-                formatted_name = f"{vs_context}_{filename.replace(' ', '_')}.mae"
-                output_file = os.path.join(config["extracted_mae_dir"], formatted_name)
-
-                with open(output_file, "w") as out_f:
-                    out_f.write(header)
-                    out_f.write(f"f_m_ct {{\n{molecule}")
-
-    write_checkpoint(config, checkpoint_name)
-    logging.info(f"Extraction completed for {mae_file}")
+def extracted_mae_path(config, name):
+    vs_context = os.path.basename(os.path.dirname(config["extracted_mae_dir"]))
+    return os.path.join(config["extracted_mae_dir"], f"{vs_context}_{name.replace(' ', '_')}.mae")
 
-def convert_mae_to_mol2(mae_file, config):
-    checkpoint_name = f"convert_mae_to_mol2_{os.path.basename(mae_file)}.chk"
+def extract_molecules(mae_file, config, molecule_names):
+    checkpoint_name = f"extract_{os.path.basename(mae_file)}"
     if is_checkpoint_done(config, checkpoint_name):
-        logging.info(f"Checkpoint found. Skipping .mae to .mol2 conversion for {mae_file}")
-        return
-
-    base_name = os.path.splitext(os.path.basename(mae_file))[0]
-    mol2_file = os.path.join(config["mol2_output_dir"], f"{base_name}.mol2")
-
-    command = [os.path.join(config["schrodinger_path"], "run"), "structconvert.py", mae_file, mol2_file]
-
-    try:
-        subprocess.run(command, check=True)
-        write_checkpoint(config, checkpoint_name)
-        logging.info(f"Converted {mae_file} to {mol2_file}")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Error converting {mae_file} to .mol2: {e}")
+        logging.info(f"Checkpoint found. Skipping extraction for {mae_file}")
+        return None
 
-def convert_mol2_to_pdbqt(mol2_file, config):
-    checkpoint_name = f"convert_mol2_to_pdbqt_{os.path.basename(mol2_file)}.chk"
-    if is_checkpoint_done(config, checkpoint_name):
-        logging.info(f"Checkpoint found. Skipping .mol2 to .pdbqt conversion for {mol2_file}")
-        return
+    mae_path = os.path.join(config["mae_dir"], mae_file)
 
-    base_name = os.path.splitext(os.path.basename(mol2_file))[0]
-    pdbqt_file = os.path.join(config["pdbqt_output_dir"], f"{base_name}.pdbqt")
+    # "quoted" is the default, so configs written before extraction_mode existed keep matching as before
+    if config.get("extraction_mode", "quoted") == "quoted":
+        matches = match_quoted_values(mae_path, molecule_names)
+    else:
+        index_dir = config.get("mae_index_dir", os.path.join(config["checkpoints_dir"], "mae_index"))
+        mae_index = load_mae_index(mae_path, index_dir)
+        if not mae_index:
+            logging.warning(f"No molecules found in the .mae file: {mae_file}")
+            return None
+        matches = match_titles(mae_index, molecule_names)
+
+    header = read_mae_header(mae_path)
+    with open(mae_path, "rb") as src:
+        for filename, entries in matches.items():
+            if len(entries) > 1:
+                logging.warning(f"{filename} found {len(entries)} times in {mae_file}; keeping the last block")
+            offset, length = entries[-1]
+            output_file = extracted_mae_path(config, filename)
+
+            with open(output_file, "wb") as out_f:
+                out_f.write(header)
+                out_f.write(read_mae_block(src, offset, length))
 
-    command = [
-        os.path.join(config["mgltools_path"], "bin/pythonsh"),
-        os.path.join(config["mgltools_path"], "MGLToolsPckgs/AutoDockTools/Utilities24/prepare_ligand4.py"),
-        "-l", mol2_file,
-        "-o", pdbqt_file
+    write_checkpoint(config, checkpoint_name)
+    logging.info(f"Extraction completed for {mae_file}: {len(matches)} molecules")
+    return {name: len(entries) for name, entries in matches.items()}
+
+def report_extraction(names, results, config):
+    """Log and save unmatched and duplicated molecule names for this run."""
+    found = {}
+    for counts in results:
+        for name, count in (counts or {}).items():
+            found[name] = found.get(name, 0) + count
+
+    rows = []
+    for name, count in names.value_counts().items():
+        if count > 1:
+            rows.append((name, "duplicate_in_csv", count))
+    for name in sorted(set(names) - set(found)):
+        rows.append((name, "unmatched", 0))
+    for name, count in sorted(found.items()):
+        if count > 1:
+            rows.append((name, "duplicate_in_library", count))
+
+    report_file = os.path.join(config["log_dir"], "extraction_report.csv")
+    pd.DataFrame(rows, columns=["Molecule Name", "Status", "Count"]).to_csv(report_file, index=False)
+
+    skipped = sum(1 for counts in results if counts is None)
+    unmatched = sum(1 for row in rows if row[1] == "unmatched")
+    duplicates = sum(1 for row in rows if row[1] != "unmatched")
+    logging.info(
+        f"Extraction report: {len(found)} of {names.nunique()} names matched, "
+        f"{unmatched} unmatched, {duplicates} duplicated. Saved to {report_file}"
+    )
+    if skipped:
+        logging.info(f"{skipped} .mae files were skipped by checkpoint and are not included in the report")
+
+def convert_mae_to_mol2(mae_files, config):
+    """Convert a chunk of extracted .mae files with one structconvert.py call.
+
+    Returns {mae_file: mol2_file} for every file converted now or skipped by
+    checkpoint. Failures are recorded per file and left out of the result.
+    """
+    store = checkpoint_store(config)
+    converted, jobs = {}, []
+    for mae_file in mae_files:
+        base_name = os.path.splitext(os.path.basename(mae_file))[0]
+        mol2_file = os.path.join(config["mol2_output_dir"], f"{base_name}.mol2")
+        if store.is_done(f"convert_mae_to_mol2_{os.path.basename(mae_file)}"):
+            logging.info(f"Checkpoint found. Skipping .mae to .mol2 conversion for {mae_file}")
+            converted[mae_file] = mol2_file
+        else:
+            jobs.append((mae_file, mol2_file))
+
+    run_path = os.path.join(config["schrodinger_path"], "run")
+    results = convert_mae_files(jobs, run_path, workdir=config["mol2_output_dir"])
+    for mae_file, mol2_file in jobs:
+        checkpoint_name = f"convert_mae_to_mol2_{os.path.basename(mae_file)}"
+        if results[mae_file] is None:
+            store.mark_done(checkpoint_name)
+            converted[mae_file] = mol2_file
+            logging.info(f"Converted {mae_file} to {mol2_file}")
+        else:
+            store.mark_failed(checkpoint_name, results[mae_file])
+            logging.error(f"Error converting {mae_file} to .mol2: {results[mae_file]}")
+    store.flush()
+    return converted
+
+def convert_to_pdbqt(ligand_files, config):
+    """Prepare .pdbqt files for a chunk of .mol2 (or, with meeko, .mae) ligands.
+
+    Returns {ligand_file: pdbqt_file} for every ligand prepared now or skipped
+    by checkpoint. Failures are recorded per file and left out of the result.
+    """
+    store = checkpoint_store(config)
+    backend = config.get("ligand_prep_backend", "mgltools")
+    prepared, jobs = {}, []
+    for ligand_file in ligand_files:
+        name = os.path.basename(ligand_file)
+        base_name, ext = os.path.splitext(name)
+        pdbqt_file = os.path.join(config["pdbqt_output_dir"], f"{base_name}.pdbqt")
+        if store.is_done(f"convert_{ext[1:]}_to_pdbqt_{name}"):
+            logging.info(f"Checkpoint found. Skipping {ext} to .pdbqt conversion for {ligand_file}")
+            prepared[ligand_file] = pdbqt_file
+        else:
+            jobs.append((ligand_file, pdbqt_file))
+
+    pythonsh, prepare_script = mgltools_paths(config.get("mgltools_path", ""))
+    results = prepare_pdbqt_files(jobs, backend, pythonsh, prepare_script)
+    for ligand_file, pdbqt_file in jobs:
+        name = os.path.basename(ligand_file)
+        checkpoint_name = f"convert_{os.path.splitext(name)[1][1:]}_to_pdbqt_{name}"
+        if results[ligand_file] is None:
+            store.mark_done(checkpoint_name)
+            prepared[ligand_file] = pdbqt_file
+            logging.info(f"Converted {ligand_file} to {pdbqt_file}")
+        else:
+            store.mark_failed(checkpoint_name, results[ligand_file])
+            logging.error(f"Error converting {ligand_file} to .pdbqt: {results[ligand_file]}")
+    store.flush()
+    return prepared
+
+def prepare_ligands(mae_files, config):
+    """Convert a chunk of extracted .mae files to .pdbqt and return the .pdbqt file names.
+
+    The meeko backend reads the .mae files directly; mgltools needs a .mol2
+    intermediate written by structconvert.py.
+    """
+    if config.get("ligand_prep_backend", "mgltools") == "meeko":
+        ligand_files = mae_files
+    else:
+        ligand_files = list(convert_mae_to_mol2(mae_files, config).values())
+    return [os.path.basename(pdbqt_file) for pdbqt_file in convert_to_pdbqt(ligand_files, config).values()]
+
+def conversion_chunks(files, config, workers):
+    """Split files into conversion chunks, keeping every worker busy."""
+    chunk_size = int(config.get("structconvert_chunk_size", 200))
+    if files:
+        chunk_size = min(chunk_size, -(-len(files) // workers))
+    return chunked(files, chunk_size)
+
+def grid_box_args(config):
+    box = config["grid_box"]
+    return [
+        "--center_x", str(box["center_x"]),
+        "--center_y", str(box["center_y"]),
+        "--center_z", str(box["center_z"]),
+        "--size_x", str(box["size_x"]),
+        "--size_y", str(box["size_y"]),
+        "--size_z", str(box["size_z"]),
     ]
 
-    try:
-        subprocess.run(command, check=True)
-        write_checkpoint(config, checkpoint_name)
-        logging.info(f"Converted {mol2_file} to {pdbqt_file}")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Error converting {mol2_file} to .pdbqt: {e}")
+def docking_output_path(config, protein, ligand):
+    protein_name = protein.replace(".pdbqt", "")
+    ligand_name = ligand.replace(".pdbqt", "")
+    return os.path.join(config["docking_output_dir"], f"{protein_name}_{ligand_name}.pdbqt")
+
+def vina_score(output_file):
+    """Affinity of the first (best) pose in a Vina output file, or None."""
+    with open(output_file) as f:
+        for line in f:
+            if line.startswith("REMARK VINA RESULT:"):
+                return float(line.split()[3])
+    return None
+
+def docking_hit(config, protein, ligand, score=None):
+    """(receptor, ligand, score, output file) of a docked pair, as fed to the leaderboard."""
+    output_file = docking_output_path(config, protein, ligand)
+    if score is None:
+        try:
+            score = vina_score(output_file)
+        except (OSError, ValueError, IndexError) as e:
+            logging.warning(f"Could not read the Vina score of {output_file}: {e}")
+    return (protein.replace(".pdbqt", ""), ligand.replace(".pdbqt", ""), score, os.path.basename(output_file))
 
 def run_docking(pair, config):
+    """Dock one pair; returns [hit] if it was docked now, otherwise []."""
     protein, ligand = pair
-    checkpoint_name = f"docking_{protein}_{ligand}.chk"
+    checkpoint_name = f"docking_{protein}_{ligand}"
     if is_checkpoint_done(config, checkpoint_name):
         logging.info(f"Checkpoint found. Skipping docking for {protein} and {ligand}")
-        return
+        return []
 
-    protein_name = protein.replace(".pdbqt", "")
-    ligand_name = ligand.replace(".pdbqt", "")
-    output_file_name = f"{protein_name}_{ligand_name}.pdbqt"
-    output_file = os.path.join(config["docking_output_dir"], output_file_name)
+    output_file = docking_output_path(config, protein, ligand)
 
     vina_command = [
         config["vina_path"],
         "--receptor", os.path.join(config["protein_dir"], protein),
         "--ligand", os.path.join(config["pdbqt_output_dir"], ligand),
-        "--center_x", str(config["grid_box"]["center_x"]),
-        "--center_y", str(config["grid_box"]["center_y"]),
-        "--center_z", str(config["grid_box"]["center_z"]),
-        "--size_x", str(config["grid_box"]["size_x"]),
-        "--size_y", str(config["grid_box"]["size_y"]),
-        "--size_z", str(config["grid_box"]["size_z"]),
+        *grid_box_args(config),
         "--cpu", "1",
         "--seed", "1698",
         "--out", output_file
@@ -132,8 +262,291 @@ def run_docking(pair, config):
         subprocess.run(vina_command, check=True)
         write_checkpoint(config, checkpoint_name)
         logging.info(f"Docking completed for {protein} and {ligand}. Output saved to {output_file}")
+        return [docking_hit(config, protein, ligand)]
     except subprocess.CalledProcessError as e:
+        write_failure(config, checkpoint_name, e)
         logging.error(f"Error docking {protein} with {ligand}: {e}")
+        return []
+
+def build_docking_chunks(proteins, ligands, config):
+    """Group pending ligands into (protein, [ligands]) chunks.
+
+    Chunks are capped so that every worker still receives at least one chunk
+    when only a few ligands are left.
+    """
+    chunk_size = max(1, int(config.get("docking_chunk_size", 100)))
+    done = checkpoint_store(config).keys(DONE, prefix="docking_")
+    tasks = []
+    for protein in proteins:
+        pending = [ligand for ligand in ligands if f"docking_{protein}_{ligand}" not in done]
+        tasks.append((protein, pending))
+
+    n_pending = sum(len(pending) for _, pending in tasks)
+    if n_pending:
+        chunk_size = min(chunk_size, -(-n_pending // config["num_cpus"]))
+
+    chunks = []
+    for protein, pending in tasks:
+        for i in range(0, len(pending), chunk_size):
+            chunks.append((protein, pending[i:i + chunk_size]))
+    return chunks
+
+def dock_chunk_cli(protein, ligands, config):
+    """Dock a chunk of ligands with a single `vina --batch` call and return their hits."""
+    batch_dir = tempfile.mkdtemp(prefix=".batch_", dir=config["docking_output_dir"])
+    vina_command = [
+        config["vina_path"],
+        "--receptor", os.path.join(config["protein_dir"], protein),
+        "--batch", *[os.path.join(config["pdbqt_output_dir"], ligand) for ligand in ligands],
+        "--dir", batch_dir,
+        *grid_box_args(config),
+        "--cpu", "1",
+        "--seed", "1698"
+    ]
+
+    try:
+        subprocess.run(vina_command, check=True)
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Error in batch docking of {len(ligands)} ligands against {protein}: {e}")
+
+    store = checkpoint_store(config)
+    hits = []
+    try:
+        for ligand in ligands:
+            checkpoint_name = f"docking_{protein}_{ligand}"
+            batch_output = os.path.join(batch_dir, ligand.replace(".pdbqt", "") + "_out.pdbqt")
+            if not os.path.exists(batch_output):
+                store.mark_failed(checkpoint_name, "no output written by vina --batch")
+                logging.error(f"Error docking {protein} with {ligand}: no output written")
+                continue
+            output_file = docking_output_path(config, protein, ligand)
+            os.replace(batch_output, output_file)
+            store.mark_done(checkpoint_name)
+            hits.append(docking_hit(config, protein, ligand))
+            logging.info(f"Docking completed for {protein} and {ligand}. Output saved to {output_file}")
+    finally:
+        store.flush()
+        shutil.rmtree(batch_dir, ignore_errors=True)
+    return hits
+
+def dock_chunk_python(protein, ligands, config):
+    """Dock a chunk of ligands in-process, computing the affinity maps once, and return their hits."""
+    from vina import Vina
+
+    box = config["grid_box"]
+    v = Vina(sf_name="vina", cpu=1, seed=1698, verbosity=0)
+    v.set_receptor(os.path.join(config["protein_dir"], protein))
+    v.compute_vina_maps(
+        center=[box["center_x"], box["center_y"], box["center_z"]],
+        box_size=[box["size_x"], box["size_y"], box["size_z"]]
+    )
+
+    store = checkpoint_store(config)
+    hits = []
+    for ligand in ligands:
+        checkpoint_name = f"docking_{protein}_{ligand}"
+        output_file = docking_output_path(config, protein, ligand)
+        try:
+            v.set_ligand_from_file(os.path.join(config["pdbqt_output_dir"], ligand))
+            v.dock(exhaustiveness=config.get("exhaustiveness", 8), n_poses=config.get("num_modes", 9))
+            v.write_poses(output_file, n_poses=config.get("num_modes", 9), overwrite=True)
+            store.mark_done(checkpoint_name)
+            hits.append(docking_hit(config, protein, ligand, float(v.energies(n_poses=1)[0][0])))
+            logging.info(f"Docking completed for {protein} and {ligand}. Output saved to {output_file}")
+        except Exception as e:
+            store.mark_failed(checkpoint_name, e)
+            logging.error(f"Error docking {protein} with {ligand}: {e}")
+    store.flush()
+    return hits
+
+def run_docking_chunk(task, config):
+    """Dock a (protein, [ligands]) task; returns the (receptor, ligand, score, source) hits."""
+    protein, ligands = task
+    docking_mode = config.get("docking_mode", "pair")
+    if docking_mode == "pair":
+        return [hit for ligand in ligands for hit in run_docking((protein, ligand), config)]
+    if docking_mode == "python":
+        return dock_chunk_python(protein, ligands, config)
+    return dock_chunk_cli(protein, ligands, config)
+
+def log_throughput(docked, start_time, first_result_time):
+    elapsed = time.time() - start_time
+    rate = docked / elapsed * 60 if elapsed > 0 else 0.0
+    first = "n/a" if first_result_time is None else f"{first_result_time - start_time:.1f} s"
+    logging.info(f"Docked {docked} pairs in {elapsed:.1f} s ({rate:.1f} pairs/min), first result after {first}")
+
+def run_staged(config, mae_files, names, start_time, leaderboard=None):
+    """Run each step for the whole library before starting the next one."""
+    store = checkpoint_store(config)
+
+    logging.info("Starting molecule extraction...")
+    molecule_names = set(names)
+    with Pool(processes=cpu_count()) as pool:
+        results = pool.map(partial(extract_molecules, config=config, molecule_names=molecule_names), mae_files)
+    report_extraction(names, results, config)
+
+    mae_files = [os.path.join(config["extracted_mae_dir"], f) for f in os.listdir(config["extracted_mae_dir"]) if f.endswith(".mae")]
+    if config.get("ligand_prep_backend", "mgltools") == "meeko":
+        logging.info("Starting .mae to .pdbqt preparation with Meeko...")
+        ligand_files = mae_files
+    else:
+        logging.info("Starting .mae to .mol2 conversion...")
+        with Pool(processes=cpu_count()) as pool:
+            pool.map(partial(convert_mae_to_mol2, config=config), conversion_chunks(mae_files, config, cpu_count()), chunksize=1)
+
+        logging.info("Starting .mol2 to .pdbqt conversion...")
+        ligand_files = [os.path.join(config["mol2_output_dir"], f) for f in os.listdir(config["mol2_output_dir"]) if f.endswith(".mol2")]
+
+    with Pool(processes=cpu_count()) as pool:
+        pool.map(partial(convert_to_pdbqt, config=config), conversion_chunks(ligand_files, config, cpu_count()), chunksize=1)
+
+    logging.info(f"Starting docking process after {time.time() - start_time:.1f} s...")
+    proteins = [f for f in os.listdir(config["protein_dir"]) if f.endswith(".pdbqt")]
+    ligands = [f for f in os.listdir(config["pdbqt_output_dir"]) if f.endswith(".pdbqt")]
+    if config.get("docking_mode", "pair") == "pair":
+        done = store.keys(DONE, prefix="docking_")
+        docking_pairs = [
+            (protein, ligand) for protein in proteins for ligand in ligands
+            if f"docking_{protein}_{ligand}" not in done
+        ]
+        tasks, dock = docking_pairs, run_docking
+    else:
+        tasks, dock = build_docking_chunks(proteins, ligands, config), run_docking_chunk
+        logging.info(f"Docking in {len(tasks)} chunks ({config['docking_mode']} mode)")
+
+    # Results are consumed as each task finishes, so the leaderboard is
+    # current while the screen runs.
+    docked = 0
+    first_result_time = None
+    with Pool(processes=config["num_cpus"]) as pool:
+        for hits in pool.imap_unordered(partial(dock, config=config), tasks):
+            if not hits:
+                continue
+            docked += len(hits)
+            if leaderboard is not None:
+                leaderboard.add_many(hits)
+            if first_result_time is None:
+                first_result_time = time.time()
+                logging.info(f"First docking result after {first_result_time - start_time:.1f} s")
+
+    log_throughput(docked, start_time, first_result_time)
+
+def run_streaming(config, mae_files, names, start_time, leaderboard=None):
+    """Run extraction, conversion and docking as a pipeline of bounded stages.
+
+    Each ligand is handed to the next stage as soon as its previous step
+    finishes, so docking starts while the rest of the library is still being
+    extracted and converted. A stage stops taking new work while more than
+    stream_queue_size ligands are waiting downstream of it.
+    """
+    store = checkpoint_store(config)
+    docking_mode = config.get("docking_mode", "pair")
+    chunk_size = 1 if docking_mode == "pair" else max(1, int(config.get("docking_chunk_size", 100)))
+    queue_size = max(1, int(config.get("stream_queue_size", 1000)))
+    prep_workers = max(1, int(config.get("prep_workers", cpu_count() // 4)))
+    prep_chunk_size = max(1, int(config.get("structconvert_chunk_size", 200)))
+    dock_workers = config["num_cpus"]
+
+    molecule_names = set(names)
+    proteins = sorted(f for f in os.listdir(config["protein_dir"]) if f.endswith(".pdbqt"))
+    done = store.keys(DONE, prefix="docking_")
+
+    # Ligands extracted by an earlier, interrupted run are picked up first.
+    to_extract = deque(mae_files)
+    extracted = deque(
+        os.path.join(config["extracted_mae_dir"], f)
+        for f in sorted(os.listdir(config["extracted_mae_dir"])) if f.endswith(".mae")
+    )
+    seen = set(extracted)
+    ready = {protein: [] for protein in proteins}
+    extraction_results = []
+    running = {}
+    docked = 0
+    first_result_time = None
+
+    if not mae_files:
+        report_extraction(names, extraction_results, config)
+
+    logging.info(
+        f"Streaming {len(mae_files)} libraries with {prep_workers} preparation and "
+        f"{dock_workers} docking workers ({docking_mode} mode)"
+    )
+
+    with ProcessPoolExecutor(max_workers=prep_workers) as prep_pool, \
+            ProcessPoolExecutor(max_workers=dock_workers) as dock_pool:
+        while True:
+            in_flight = {"extract": 0, "prepare": 0, "dock": 0}
+            preparing_ligands = docking_ligands = 0
+            for stage, payload in running.values():
+                in_flight[stage] += 1
+                if stage == "prepare":
+                    preparing_ligands += len(payload)
+                elif stage == "dock":
+                    docking_ligands += len(payload[1])
+            waiting_pairs = sum(len(pending) for pending in ready.values())
+            dock_backlog = (waiting_pairs + docking_ligands) // max(1, len(proteins))
+
+            while to_extract and in_flight["extract"] < prep_workers and len(extracted) < queue_size:
+                mae_file = to_extract.popleft()
+                future = prep_pool.submit(extract_molecules, mae_file, config, molecule_names)
+                running[future] = ("extract", mae_file)
+                in_flight["extract"] += 1
+
+            # Chunks shrink when little work is waiting, so the first ligands
+            # reach docking quickly while a long backlog still gets batched.
+            while extracted and in_flight["prepare"] < 2 * prep_workers and dock_backlog + preparing_ligands < queue_size:
+                size = min(prep_chunk_size, max(1, len(extracted) // prep_workers))
+                chunk = [extracted.popleft() for _ in range(min(size, len(extracted)))]
+                running[prep_pool.submit(prepare_ligands, chunk, config)] = ("prepare", chunk)
+                in_flight["prepare"] += 1
+                preparing_ligands += len(chunk)
+
+            upstream_idle = not (to_extract or extracted or in_flight["extract"] or in_flight["prepare"])
+            for protein, pending in ready.items():
+                # Full chunks are queued up to two per worker; partial chunks
+                # only go out when a docking worker would otherwise sit idle.
+                while pending and in_flight["dock"] < 2 * dock_workers and (
+                        len(pending) >= chunk_size or upstream_idle or in_flight["dock"] < dock_workers):
+                    task = (protein, pending[:chunk_size])
+                    del pending[:chunk_size]
+                    running[dock_pool.submit(run_docking_chunk, task, config)] = ("dock", task)
+                    in_flight["dock"] += 1
+
+            if not running:
+                break
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, payload = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error(f"Streaming {stage} task failed for {payload}: {e}")
+                    continue
+
+                if stage == "extract":
+                    extraction_results.append(result)
+                    for name in (result or {}):
+                        mae_path = extracted_mae_path(config, name)
+                        if mae_path not in seen:
+                            seen.add(mae_path)
+                            extracted.append(mae_path)
+                    if not to_extract and not any(s == "extract" for s, _ in running.values()):
+                        report_extraction(names, extraction_results, config)
+                elif stage == "prepare":
+                    for ligand in result:
+                        for protein in proteins:
+                            if f"docking_{protein}_{ligand}" not in done:
+                                ready[protein].append(ligand)
+                elif result:
+                    docked += len(result)
+                    if leaderboard is not None:
+                        leaderboard.add_many(result)
+                    if first_result_time is None:
+                        first_result_time = time.time()
+                        logging.info(f"First docking result after {first_result_time - start_time:.1f} s")
+
+    log_throughput(docked, start_time, first_result_time)
 
 def main():
     start_time = time.time()
@@ -159,27 +572,29 @@ def main():
     for key in ["extracted_mae_dir", "mol2_output_dir", "pdbqt_output_dir", "docking_output_dir", "checkpoints_dir"]:
         os.makedirs(config[key], exist_ok=True)
 
-    logging.info("Starting molecule extraction...")
-    mae_files = [f for f in os.listdir(config["mae_dir"]) if f.endswith(".mae")]
-    with Pool(processes=cpu_count()) as pool:
-        pool.map(partial(extract_molecules, config=config), mae_files)
+    store = checkpoint_store(config)
+    logging.info(f"Using checkpoint database {store.db_path}")
 
-    logging.info("Starting .mae to .mol2 conversion...")
-    mae_files = [os.path.join(config["extracted_mae_dir"], f) for f in os.listdir(config["extracted_mae_dir"]) if f.endswith(".mae")]
-    with Pool(processes=cpu_count()) as pool:
-        pool.map(partial(convert_mae_to_mol2, config=config), mae_files)
+    if config.get("ligand_prep_backend", "mgltools") == "meeko":
+        # Import once here so forked workers do not each pay for it
+        import meeko  # noqa: F401
 
-    logging.info("Starting .mol2 to .pdbqt conversion...")
-    mol2_files = [os.path.join(config["mol2_output_dir"], f) for f in os.listdir(config["mol2_output_dir"]) if f.endswith(".mol2")]
-    with Pool(processes=cpu_count()) as pool:
-        pool.map(partial(convert_mol2_to_pdbqt, config=config), mol2_files)
+    leaderboard = leaderboard_from_config(config)
+    if leaderboard is not None:
+        logging.info(f"Keeping the top {leaderboard.k} hits per receptor in {leaderboard.path}")
 
-    logging.info("Starting docking process...")
-    proteins = [f for f in os.listdir(config["protein_dir"]) if f.endswith(".pdbqt")]
-    ligands = [f for f in os.listdir(config["pdbqt_output_dir"]) if f.endswith(".pdbqt")]
-    docking_pairs = [(protein, ligand) for protein in proteins for ligand in ligands]
-    with Pool(processes=config["num_cpus"]) as pool:
-        pool.map(partial(run_docking, config=config), docking_pairs)
+    mae_files = [f for f in os.listdir(config["mae_dir"]) if f.endswith(".mae")]
+    names = read_molecule_names(config["csv_file"])
+    if config.get("execution_mode", "staged") == "streaming":
+        run_streaming(config, mae_files, names, start_time, leaderboard)
+    else:
+        run_staged(config, mae_files, names, start_time, leaderboard)
+
+    logging.info(f"Docking checkpoints: {store.summary(prefix='docking_')}")
+    if leaderboard is not None:
+        leaderboard.save()
+        for entry in leaderboard.top(5):
+            logging.info(f"Top hit: {entry['ligand']} on {entry['receptor']} ({entry['score']:.2f})")
 
     elapsed_time = time.time() - start_time
     logging.info(f"Completed docking process in {elapsed_time:.2f} seconds")
@@ -0,0 +1 @@
+"""Shared helpers for the VS-Pipeline stage scripts."""
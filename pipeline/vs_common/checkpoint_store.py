@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""SQLite-backed checkpoint store shared by the virtual screening pipelines.
+
+Every unit of work is a row keyed by its checkpoint name (the old .chk file
+name without the suffix) with a status of pending, running, done or failed.
+Writes are buffered and committed in batches, so a screen with millions of
+pairs keeps one database file instead of millions of tiny files.
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+STATUSES = (PENDING, RUNNING, DONE, FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    key TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    error TEXT,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS checkpoints_status ON checkpoints (status, key);
+"""
+
+_stores = {}
+
+
+class CheckpointStore:
+    def __init__(self, db_path, batch_size=1000, flush_interval=30.0, timeout=120.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending_writes = {}
+        self._last_flush = time.time()
+        self._lock = threading.RLock()
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self.created = not os.path.exists(db_path)
+
+        self._conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _set(self, key, status, error=None):
+        with self._lock:
+            self._pending_writes[key] = (key, status, error, time.time())
+            if (len(self._pending_writes) >= self.batch_size
+                    or time.time() - self._last_flush >= self.flush_interval):
+                self.flush()
+
+    def mark_pending(self, key):
+        self._set(key, PENDING)
+
+    def mark_running(self, key):
+        self._set(key, RUNNING)
+
+    def mark_done(self, key):
+        self._set(key, DONE)
+
+    def mark_failed(self, key, error=None):
+        self._set(key, FAILED, None if error is None else str(error))
+
+    def register(self, keys):
+        """Insert keys as pending unless they already have a status."""
+        now = time.time()
+        with self._lock:
+            self.flush()
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO checkpoints (key, status, error, updated) VALUES (?, ?, NULL, ?)",
+                    ((key, PENDING, now) for key in keys)
+                )
+
+    def flush(self):
+        with self._lock:
+            if self._pending_writes:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO checkpoints (key, status, error, updated) VALUES (?, ?, ?, ?)",
+                        self._pending_writes.values()
+                    )
+                self._pending_writes.clear()
+            self._last_flush = time.time()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+    def status(self, key):
+        with self._lock:
+            if key in self._pending_writes:
+                return self._pending_writes[key][1]
+            row = self._conn.execute("SELECT status FROM checkpoints WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def is_done(self, key):
+        return self.status(key) == DONE
+
+    def keys(self, status=DONE, prefix=""):
+        """Return the set of keys with a given status, optionally under a key prefix."""
+        self.flush()
+        query = "SELECT key FROM checkpoints WHERE status = ?"
+        params = [status]
+        if prefix:
+            query += " AND key >= ? AND key < ?"
+            params += [prefix, prefix + "\U0010ffff"]
+        with self._lock:
+            return {row[0] for row in self._conn.execute(query, params)}
+
+    def remaining(self, keys):
+        """Return the keys from an iterable that are not yet done, in order."""
+        keys = list(keys)
+        if not keys:
+            return []
+        prefix = os.path.commonprefix(keys)
+        done = self.keys(DONE, prefix)
+        return [key for key in keys if key not in done]
+
+    def failures(self, prefix=""):
+        """Return {key: error} for failed keys."""
+        self.flush()
+        query = "SELECT key, error FROM checkpoints WHERE status = ?"
+        params = [FAILED]
+        if prefix:
+            query += " AND key >= ? AND key < ?"
+            params += [prefix, prefix + "\U0010ffff"]
+        with self._lock:
+            return dict(self._conn.execute(query, params).fetchall())
+
+    def summary(self, prefix=""):
+        """Return {status: count}, optionally under a key prefix."""
+        self.flush()
+        query = "SELECT status, COUNT(*) FROM checkpoints"
+        params = []
+        if prefix:
+            query += " WHERE key >= ? AND key < ?"
+            params = [prefix, prefix + "\U0010ffff"]
+        query += " GROUP BY status"
+        with self._lock:
+            return dict(self._conn.execute(query, params).fetchall())
+
+    def import_chk_dir(self, chk_dir, prefix=""):
+        """Import every <name>.chk file in chk_dir as a done key prefix + name."""
+        if not os.path.isdir(chk_dir):
+            return 0
+        count = 0
+        with os.scandir(chk_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".chk"):
+                    self.mark_done(prefix + entry.name[:-len(".chk")])
+                    count += 1
+        self.flush()
+        return count
+
+    def import_chk_list(self, list_file, prefix=""):
+        """Import every non-empty line of a list-style checkpoint file as a done key."""
+        if not os.path.isfile(list_file):
+            return 0
+        count = 0
+        with open(list_file) as f:
+            for line in f:
+                if line.strip():
+                    self.mark_done(prefix + line.strip())
+                    count += 1
+        self.flush()
+        return count
+
+
+def get_checkpoint_store(db_path, legacy_dir=None):
+    """Return the store for db_path, opening one connection per process.
+
+    When the database is created for the first time and legacy_dir is given,
+    existing .chk files in that directory are imported once.
+    """
+    cache_key = (os.path.abspath(db_path), os.getpid())
+    store = _stores.get(cache_key)
+    if store is None:
+        store = CheckpointStore(db_path)
+        if store.created and legacy_dir:
+            store.import_chk_dir(legacy_dir)
+        _stores[cache_key] = store
+    return store
+
+
+def checkpoint_store_for_dir(checkpoints_dir, db_path=None):
+    """Return the store kept in checkpoints_dir (checkpoints.sqlite unless db_path
+    is given), importing any legacy .chk files found there on first use."""
+    if db_path is None:
+        db_path = os.path.join(checkpoints_dir, "checkpoints.sqlite")
+    return get_checkpoint_store(db_path, legacy_dir=checkpoints_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or inspect a VS pipeline checkpoint database")
+    parser.add_argument("db", help="Path to the checkpoint database")
+    parser.add_argument("--import_dir", help="Directory of legacy .chk files to import")
+    parser.add_argument("--import_list", help="List-style checkpoint file (one key per line) to import")
+    parser.add_argument("--prefix", default="", help="Prefix added to imported keys")
+    parser.add_argument("--summary", action="store_true", help="Print status counts")
+    parser.add_argument("--failed", action="store_true", help="Print failed keys and their errors")
+    args = parser.parse_args()
+
+    with CheckpointStore(args.db) as store:
+        if args.import_dir:
+            print(f"Imported {store.import_chk_dir(args.import_dir, args.prefix)} checkpoints from {args.import_dir}")
+        if args.import_list:
+            print(f"Imported {store.import_chk_list(args.import_list, args.prefix)} checkpoints from {args.import_list}")
+        if args.summary:
+            for status, count in sorted(store.summary(args.prefix).items()):
+                print(f"{status}\t{count}")
+        if args.failed:
+            for key, error in sorted(store.failures(args.prefix).items()):
+                print(f"{key}\t{error or ''}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""Paginated, cached and resumable ChEMBL activity download.
+
+saruniqifier_chembl.py used to turn new_client.activity.filter(...) into a
+DataFrame in one go: every field of every activity over the network, with
+nothing kept if the download failed half-way and everything downloaded again
+on the next run. fetch_activities() pages through the activities of a target
+in activity_id order, asking only for the fields the uniqifier keeps, and
+commits every page to a SQLite cache as it arrives. An interrupted download
+continues after the last cached activity_id, and a completed query is served
+from the cache without network access.
+
+The client is anything with the small QuerySet interface the download uses
+(filter / only / order_by / slicing), by default
+chembl_webresource_client's new_client.activity. RecordedActivities is a
+local stand-in that replays activities saved in a JSON file, so the fetch
+layer can be exercised offline.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+
+# Activity fields kept in the uniqifier output, plus the ones its References
+# column is built from and activity_id, which orders the pages.
+FIELDS = [
+    "activity_comment", "activity_id", "activity_properties", "assay_description", "assay_type",
+    "assay_variant_accession", "assay_variant_mutation", "bao_label", "canonical_smiles",
+    "data_validity_comment", "document_chembl_id", "document_journal", "document_year",
+    "ligand_efficiency", "molecule_chembl_id", "relation", "src_id", "standard_relation",
+    "standard_type", "standard_units", "standard_value", "units", "uo_units", "value",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    query TEXT PRIMARY KEY,
+    complete INTEGER NOT NULL,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pages (
+    query TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    records TEXT NOT NULL,
+    PRIMARY KEY (query, page)
+) WITHOUT ROWID;
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityCache:
+    def __init__(self, db_path, timeout=120.0):
+        self.db_path = db_path
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=timeout)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def is_complete(self, query):
+        row = self._conn.execute("SELECT complete FROM queries WHERE query = ?", (query,)).fetchone()
+        return bool(row and row[0])
+
+    def last_page(self, query):
+        """(page, last activity_id) of the last cached page, or (-1, None)."""
+        row = self._conn.execute(
+            "SELECT page, last_id FROM pages WHERE query = ? ORDER BY page DESC LIMIT 1", (query,)
+        ).fetchone()
+        return row if row else (-1, None)
+
+    def add_page(self, query, page, records):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (query, page, last_id, records) VALUES (?, ?, ?, ?)",
+                (query, page, records[-1]["activity_id"], json.dumps(records))
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO queries (query, complete, updated) VALUES (?, 0, ?)", (query, time.time())
+            )
+
+    def mark_complete(self, query):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO queries (query, complete, updated) VALUES (?, 1, ?)", (query, time.time())
+            )
+
+    def clear(self, query):
+        with self._conn:
+            self._conn.execute("DELETE FROM pages WHERE query = ?", (query,))
+            self._conn.execute("DELETE FROM queries WHERE query = ?", (query,))
+
+    def records(self, query):
+        return [
+            record for (records,) in self._conn.execute(
+                "SELECT records FROM pages WHERE query = ? ORDER BY page", (query,))
+            for record in json.loads(records)
+        ]
+
+    def close(self):
+        self._conn.close()
+
+
+class RecordedActivities:
+    """Stand-in for new_client.activity that serves activities saved in a JSON file.
+
+    The file holds a list of activity records (or a list of pages, i.e.
+    lists of records) as returned by the ChEMBL web services. Every slice
+    that is read is appended to `requests`, so a caller can check what
+    would have gone over the network.
+    """
+
+    def __init__(self, source, requests=None, _filters=None, _fields=None, _order=None):
+        if isinstance(source, (str, os.PathLike)):
+            with open(source) as f:
+                source = json.load(f)
+            if source and isinstance(source[0], list):
+                source = [record for page in source for record in page]
+        self._records = source
+        self.requests = [] if requests is None else requests
+        self._filters = _filters or {}
+        self._fields = _fields
+        self._order = _order
+
+    def _copy(self, filters=None, fields=None, order=None):
+        return RecordedActivities(
+            self._records, self.requests, {**self._filters, **(filters or {})},
+            fields or self._fields, order or self._order
+        )
+
+    def filter(self, **filters):
+        return self._copy(filters=filters)
+
+    def only(self, fields):
+        return self._copy(fields=list(fields))
+
+    def order_by(self, field):
+        return self._copy(order=field)
+
+    def _matches(self, record):
+        for name, value in self._filters.items():
+            field, _, op = name.partition("__")
+            if op == "in" and record.get(field) not in value:
+                return False
+            if op == "gt" and not record.get(field) > value:
+                return False
+            if not op and record.get(field) != value:
+                return False
+        return True
+
+    def _selected(self):
+        records = [record for record in self._records if self._matches(record)]
+        if self._order:
+            records.sort(key=lambda record: record[self._order])
+        if self._fields:
+            records = [{k: v for k, v in record.items() if k in self._fields} for record in records]
+        return records
+
+    def __len__(self):
+        return len(self._selected())
+
+    def __getitem__(self, index):
+        self.requests.append((dict(self._filters), index))
+        return self._selected()[index]
+
+    def __iter__(self):
+        self.requests.append((dict(self._filters), None))
+        return iter(self._selected())
+
+
+def query_key(target_chembl_id, fields):
+    return json.dumps({"target_chembl_id": target_chembl_id, "fields": sorted(fields) if fields else None})
+
+
+def fetch_activities(target_chembl_id, cache_path, client=None, fields=FIELDS, page_size=1000,
+                     offline=False, refresh=False):
+    """All activity records of a target, downloaded page by page through the cache.
+
+    Pages are requested in activity_id order as activity_id > <last id of the
+    previous page>, so a resumed download neither skips nor repeats records.
+    fields=None downloads every field. offline=True only reads the cache and
+    raises RuntimeError if the query has not been downloaded completely;
+    refresh=True drops the cached pages and downloads again.
+    """
+    query = query_key(target_chembl_id, fields)
+    with ActivityCache(cache_path) as cache:
+        if refresh:
+            cache.clear(query)
+        if cache.is_complete(query):
+            records = cache.records(query)
+            logger.info(f"Read {len(records)} activities of {target_chembl_id} from {cache_path}")
+            return records
+        if offline:
+            raise RuntimeError(f"Activities of {target_chembl_id} are not completely cached in {cache_path}")
+
+        if client is None:
+            from chembl_webresource_client.new_client import new_client
+            client = new_client.activity
+
+        queryset = client.filter(target_chembl_id__in=[target_chembl_id])
+        if fields:
+            queryset = queryset.only(fields)
+        page, last_id = cache.last_page(query)
+        if last_id is not None:
+            logger.info(f"Resuming the download of {target_chembl_id} after activity_id {last_id}")
+
+        while True:
+            pending = queryset if last_id is None else queryset.filter(activity_id__gt=last_id)
+            records = list(pending.order_by("activity_id")[0:page_size])
+            if records:
+                page += 1
+                cache.add_page(query, page, records)
+                last_id = records[-1]["activity_id"]
+                logger.info(f"Cached page {page} of {target_chembl_id} ({len(records)} activities)")
+            if len(records) < page_size:
+                break
+
+        cache.mark_complete(query)
+        return cache.records(query)
@@ -0,0 +1,327 @@
+"""Make-style DAG runner for the numbered optimization step scripts.
+
+The run_<engine>_pipeline.py wrappers used to run every numbered script as
+a subprocess, one after the other, on every invocation. Here each step
+declares the paths it reads and writes and the steps it must follow, and
+run_steps():
+
+* skips a step whose last successful run (a stamp file in the state
+  directory) is newer than all of its inputs, including its script and
+  configs, when its outputs exist and none of its dependencies ran again;
+* starts every step whose dependencies have finished, up to `jobs` at a
+  time, so independent steps (e.g. receptor and ligand preparation) run
+  concurrently;
+* optionally runs the Python-only steps (RMSD, matrix, heatmap) in-process
+  with runpy, so pandas, RDKit or PyMOL are imported once per pipeline
+  instead of once per step. Each of them starts with the root logger it
+  would have in its own process.
+
+A step that produces a path another step reads becomes a dependency of that
+step automatically. When a step fails, the steps that depend on it are not
+started and run_steps() returns False once the running steps have ended.
+"""
+import os
+import sys
+import json
+import time
+import runpy
+import logging
+import threading
+import subprocess
+import configparser
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# sys.argv and the working directory are process-wide, so in-process steps run one at a time.
+_in_process_lock = threading.Lock()
+
+
+class Step:
+    """One numbered script: how to run it, what it reads and writes, and what it follows.
+
+    Relative inputs and outputs are resolved against cwd (the directory the
+    script runs in). in_process marks scripts that can run in the runner
+    process when in-process execution is requested.
+    """
+
+    def __init__(self, name, script, args=(), inputs=(), outputs=(), after=(), cwd=None, in_process=False):
+        self.name = name
+        self.script = os.path.abspath(script)
+        self.args = [str(arg) for arg in args]
+        self.cwd = os.path.abspath(cwd or os.getcwd())
+        self.inputs = [self._resolve(path) for path in inputs if path]
+        self.outputs = [self._resolve(path) for path in outputs if path]
+        self.after = list(after)
+        self.in_process = in_process
+
+    def _resolve(self, path):
+        return os.path.normpath(os.path.join(self.cwd, os.path.expanduser(str(path))))
+
+    def fingerprint(self):
+        return json.dumps({"script": self.script, "args": self.args, "cwd": self.cwd})
+
+
+def _strip_value(value):
+    value = value.split(" #", 1)[0].strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        value = value[1:-1]
+    return value
+
+
+def read_conf(path):
+    """Flat {key: value} of a step config, or {} if it does not exist.
+
+    Reads the formats used by the step scripts: JSON objects, INI files
+    (keys as "section.key", DEFAULT keys also bare) and KEY=VALUE or
+    key = "value" lines (shell-style and Python-literal configs). Only used
+    to find the paths a step reads and writes.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+        return {key: str(value) for key, value in data.items()} if isinstance(data, dict) else {}
+    except ValueError:
+        pass
+
+    parser = configparser.ConfigParser(interpolation=None)
+    try:
+        parser.read_string(text)
+        values = {key: _strip_value(value) for key, value in parser.defaults().items()}
+        for section in parser.sections():
+            for key in parser.options(section):
+                if key not in parser.defaults():
+                    values[f"{section}.{key}"] = _strip_value(parser.get(section, key))
+        return values
+    except configparser.Error:
+        pass
+
+    values = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith(("#", "[")) or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        values[key.strip()] = _strip_value(value)
+    return values
+
+
+def _newest_mtime(path):
+    """Newest modification time of a file, or of a directory and everything below it; None if missing."""
+    try:
+        newest = os.stat(path).st_mtime
+    except OSError:
+        return None
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            for name in dirs + files:
+                try:
+                    newest = max(newest, os.stat(os.path.join(root, name)).st_mtime)
+                except OSError:
+                    pass
+    return newest
+
+
+def _inside(path, directory):
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def resolve_dependencies(steps):
+    """{step name: set of step names it must follow}: its `after` plus the producers of its inputs."""
+    by_name = {step.name: step for step in steps}
+    depends = {}
+    for step in steps:
+        unknown = [name for name in step.after if name not in by_name]
+        if unknown:
+            raise ValueError(f"Step {step.name} follows unknown steps {unknown}")
+        depends[step.name] = set(step.after) | {
+            other.name for other in steps if other is not step
+            and any(_inside(path, output) for path in step.inputs for output in other.outputs)
+        }
+
+    state = {}
+
+    def visit(name, chain):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Step dependencies form a cycle: {' -> '.join(chain + [name])}")
+        state[name] = "visiting"
+        for dependency in depends[name]:
+            visit(dependency, chain + [name])
+        state[name] = "done"
+
+    for step in steps:
+        visit(step.name, [])
+    return depends
+
+
+class StepState:
+    """Stamp files recording the last successful run of each step."""
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+
+    def _stamp(self, step):
+        return os.path.join(self.state_dir, f"{step.name}.done")
+
+    def is_current(self, step):
+        """True if the step finished after its inputs last changed and its outputs still exist."""
+        stamp = self._stamp(step)
+        if not os.path.exists(stamp):
+            return False
+        with open(stamp) as f:
+            if f.read() != step.fingerprint():
+                return False
+        finished = os.stat(stamp).st_mtime
+        for path in [step.script, *step.inputs]:
+            mtime = _newest_mtime(path)
+            if mtime is None or mtime > finished:
+                return False
+        return all(os.path.exists(path) for path in step.outputs)
+
+    def mark_done(self, step):
+        tmp_file = f"{self._stamp(step)}.tmp"
+        with open(tmp_file, "w") as f:
+            f.write(step.fingerprint())
+        os.replace(tmp_file, self._stamp(step))
+
+    def forget(self, step):
+        if os.path.exists(self._stamp(step)):
+            os.remove(self._stamp(step))
+
+
+def _run_in_process(step):
+    """Run a step script as __main__ in this process.
+
+    The root logger is left as the step found it afterwards: handlers the
+    step added (e.g. with logging.basicConfig(filename=...)) are removed and
+    closed, so the next in-process step can configure its own logging, as it
+    would in a fresh interpreter.
+    """
+    with _in_process_lock:
+        saved_argv, saved_cwd = sys.argv, os.getcwd()
+        root = logging.getLogger()
+        saved_handlers, saved_level = root.handlers[:], root.level
+        sys.argv = [step.script, *step.args]
+        os.chdir(step.cwd)
+        try:
+            runpy.run_path(step.script, run_name="__main__")
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                raise RuntimeError(f"exited with status {e.code}") from None
+        finally:
+            sys.argv = saved_argv
+            os.chdir(saved_cwd)
+            for handler in root.handlers[:]:
+                if handler not in saved_handlers:
+                    root.removeHandler(handler)
+                    handler.close()
+            root.handlers[:] = saved_handlers
+            root.setLevel(saved_level)
+
+
+def run_step(step, in_process=False):
+    """Run one step; returns None on success, otherwise the error."""
+    start = time.time()
+    try:
+        if in_process and step.in_process:
+            logger.info(f"Running {step.name} in-process: {os.path.basename(step.script)} {' '.join(step.args)}")
+            _run_in_process(step)
+        else:
+            command = [sys.executable, step.script, *step.args]
+            logger.info(f"Running {step.name}: {' '.join(command)}")
+            subprocess.run(command, cwd=step.cwd, check=True)
+    except Exception as e:
+        logger.error(f"Step {step.name} failed after {time.time() - start:.1f} s: {e}")
+        return e
+    logger.info(f"Step {step.name} finished in {time.time() - start:.1f} s")
+    return None
+
+
+def run_steps(steps, state_dir, jobs=2, force=False, in_process=False, dry_run=False):
+    """Run the steps that are not up to date, dependencies first, up to `jobs` at a time.
+
+    force reruns every step. dry_run only logs which steps would run or be
+    skipped. Returns True if no step failed.
+    """
+    depends = resolve_dependencies(steps)
+    by_name = {step.name: step for step in steps}
+    state = StepState(state_dir)
+    finished, ran, failed = set(), set(), set()
+    running = {}
+
+    def ready():
+        return [step for step in steps
+                if step.name not in finished and step.name not in running.values()
+                and step.name not in failed and depends[step.name] <= finished]
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        while True:
+            # Skipped steps finish at once and may make their dependents ready.
+            progressed = False
+            for step in ready():
+                if not force and not (depends[step.name] & ran) and state.is_current(step):
+                    logger.info(f"Skipping {step.name}: up to date")
+                    finished.add(step.name)
+                    progressed = True
+                elif dry_run:
+                    logger.info(f"Would run {step.name}")
+                    finished.add(step.name)
+                    ran.add(step.name)
+                    progressed = True
+                elif len(running) < max(1, jobs):
+                    running[executor.submit(run_step, step, in_process)] = step.name
+            if progressed:
+                continue
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.result() is None:
+                    state.mark_done(by_name[name])
+                    finished.add(name)
+                    ran.add(name)
+                else:
+                    state.forget(by_name[name])
+                    failed.add(name)
+
+    blocked = [step.name for step in steps if step.name not in finished | failed]
+    if failed:
+        logger.error(f"Failed: {', '.join(sorted(failed))}; not run: {', '.join(blocked) or 'none'}")
+    return not failed
+
+
+def add_arguments(parser):
+    """Options shared by the run_<engine>_pipeline.py wrappers."""
+    parser.add_argument("--jobs", type=int, default=2, help="Steps run at the same time when independent")
+    parser.add_argument("--force", action="store_true", help="Rerun every step, even if it is up to date")
+    parser.add_argument("--in_process", action="store_true",
+                        help="Run the Python-only steps (RMSD, matrix, heatmap) in this process")
+    parser.add_argument("--dry_run", action="store_true", help="Only list the steps that would run")
+    parser.add_argument("--state_dir", default=".pipeline_state",
+                        help="Directory of the step stamp files (default: .pipeline_state)")
+    return parser
+
+
+def run_pipeline(steps, args):
+    """Run the steps with the wrapper options; returns the exit status.
+
+    The runner logs through its own handler rather than the root logger, so
+    the logging.basicConfig() calls of in-process steps still take effect.
+    """
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    ok = run_steps(steps, args.state_dir, jobs=args.jobs, force=args.force, in_process=args.in_process,
+                   dry_run=args.dry_run)
+    return 0 if ok else 1
@@ -0,0 +1,205 @@
+"""SQLite manifest of extracted docking output files for incremental score extraction.
+
+Each output file is a row with its size, modification time, content hash
+and the score rows extracted from it. scan() compares a directory listing
+with the manifest and returns only the files that are new or whose content
+changed (the hash is only computed when size or mtime differ), so a periodic
+extraction during a long screen parses only the outputs written since the
+previous run. The complete table is rebuilt from the stored rows.
+
+Rows are keyed by the absolute path of the file, and scan(), forget() and
+rows() only see the files of the directory scanned last, so runs that share
+a manifest (e.g. actives and decoys) do not treat each other's files as
+removed. Rows of manifests written before, keyed by bare file name, are
+taken over by the first scan that finds the file.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    rows TEXT NOT NULL,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionManifest:
+    def __init__(self, db_path, batch_size=5000, timeout=120.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self._pending_writes = {}
+        self._scanned = {}
+        self.modified = set()
+        self.directory = None
+        self._lock = threading.RLock()
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _known(self):
+        """{name: (size, mtime_ns, hash)} of the scanned directory, and of legacy bare-name rows."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns, hash FROM files WHERE (path >= ? AND path < ?) OR path NOT LIKE ?",
+                (self.directory + os.sep, self.directory + os.sep + "\U0010ffff", f"%{os.sep}%")
+            ).fetchall()
+        known, legacy = {}, {}
+        for path, size, mtime_ns, digest in rows:
+            if os.sep not in path:
+                legacy[path] = (size, mtime_ns, digest)
+            elif os.path.dirname(path) == self.directory:
+                known[os.path.basename(path)] = (size, mtime_ns, digest)
+        return known, legacy
+
+    def scan(self, directory, names, check_content=True):
+        """Return (changed, removed) for the file names found in a directory.
+
+        changed lists the names that are new or whose content changed since
+        they were recorded (the changed ones are also kept in self.modified);
+        removed lists recorded names that are no longer in `names`. Files
+        that were only touched (same hash) are updated in place and not
+        returned. With check_content=False no file is hashed and any change
+        of size or mtime counts as changed.
+        """
+        self.flush()
+        self.directory = os.path.abspath(directory)
+        known, legacy = self._known()
+        changed, touched, adopted = [], [], []
+        self.modified = set()
+        for name in names:
+            st = os.stat(os.path.join(directory, name))
+            previous = known.pop(name, None)
+            if previous is None and name in legacy:
+                previous = legacy[name]
+                adopted.append((self._path(name), name))
+            if previous and previous[:2] == (st.st_size, st.st_mtime_ns):
+                continue
+            digest = file_hash(os.path.join(directory, name)) if check_content else "-"
+            if check_content and previous and previous[2] == digest:
+                touched.append((st.st_size, st.st_mtime_ns, self._path(name)))
+                continue
+            self._scanned[name] = (st.st_size, st.st_mtime_ns, digest)
+            changed.append(name)
+            if previous:
+                self.modified.add(name)
+
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE OR REPLACE files SET path = ? WHERE path = ?", adopted)
+            self._conn.executemany("UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?", touched)
+        return changed, sorted(known)
+
+    def record(self, name, rows):
+        """Store the rows extracted from a file returned by scan()."""
+        size, mtime_ns, digest = self._scanned.pop(name)
+        with self._lock:
+            path = self._path(name)
+            self._pending_writes[path] = (path, size, mtime_ns, digest, json.dumps(rows), time.time())
+            if len(self._pending_writes) >= self.batch_size:
+                self.flush()
+
+    def record_all(self, names, rows):
+        """Record every scanned name with its rows; row[0] is the file name.
+
+        Files without any row are recorded as well, so they are not parsed
+        again until they change.
+        """
+        by_name = {name: [] for name in names}
+        for row in rows:
+            by_name[row[0]].append(list(row))
+        for name, file_rows in by_name.items():
+            self.record(name, file_rows)
+
+    def forget(self, names):
+        with self._lock:
+            self.flush()
+            with self._conn:
+                self._conn.executemany("DELETE FROM files WHERE path = ?", ((self._path(name),) for name in names))
+
+    def flush(self):
+        with self._lock:
+            if self._pending_writes:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO files (path, size, mtime_ns, hash, rows, updated) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        self._pending_writes.values()
+                    )
+                self._pending_writes.clear()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+    def rows(self):
+        """All recorded rows of the scanned directory, ordered by file name."""
+        self.flush()
+        with self._lock:
+            return [
+                row for path, rows in self._conn.execute(
+                    "SELECT path, rows FROM files WHERE path >= ? AND path < ? ORDER BY path",
+                    (self.directory + os.sep, self.directory + os.sep + "\U0010ffff"))
+                if os.path.dirname(path) == self.directory
+                for row in json.loads(rows)
+            ]
+
+
+def pending_files(directory, names, manifest=None, store=None, run=None, engine=None):
+    """Return the file names in a directory that an extractor still has to parse.
+
+    With a manifest these are the new and changed files; rows of changed and
+    removed files are dropped from the manifest and from the results store,
+    so they are replaced rather than duplicated. Files new to the manifest
+    that the store already holds (a manifest enabled on an existing store)
+    are recorded without rows and not parsed again; their rows stay in the
+    store. Without a manifest but with a results store, files whose name is
+    already a source of the run are skipped. Otherwise every name is returned.
+    """
+    if manifest is not None:
+        changed, removed = manifest.scan(directory, names)
+        manifest.forget(removed)
+        if store is not None:
+            if manifest.modified or removed:
+                store.remove_sources(run, engine, list(manifest.modified) + removed)
+            stored = store.sources(run, engine)
+            seeded = {name for name in changed if name in stored and name not in manifest.modified}
+            for name in seeded:
+                manifest.record(name, [])
+            manifest.flush()
+            changed = [name for name in changed if name not in seeded]
+        return changed
+    if store is not None:
+        done = store.sources(run, engine)
+        return [name for name in names if name not in done]
+    return list(names)
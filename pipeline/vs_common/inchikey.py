@@ -0,0 +1,136 @@
+"""SMILES -> InChIKey conversion with deduplication, a process pool and an on-disk cache.
+
+Activity tables repeat the same compound across many assays, and the SAR
+uniqifiers used to parse the SMILES of every row with RDKit on one core.
+inchikey_column() converts each distinct SMILES once: keys that are already
+in the SQLite cache are read from it, the rest are computed in chunks on a
+process pool and written back chunk by chunk, so a re-run, an interrupted
+run or another uniqifier working on overlapping compounds does not compute
+them again. SMILES that RDKit cannot parse are cached too and get no key.
+
+The cache is keyed by the SMILES text as given. ChEMBL already provides
+canonical SMILES; canonicalizing other inputs before the lookup would need
+the RDKit parse that the cache is there to avoid.
+"""
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inchikeys (
+    smiles TEXT PRIMARY KEY,
+    inchikey TEXT
+) WITHOUT ROWID;
+"""
+
+
+def smiles_to_inchikey(smiles):
+    if isinstance(smiles, str) and smiles.strip():
+        from rdkit import Chem
+        mol = Chem.MolFromSmiles(smiles)
+        if mol:
+            return Chem.inchi.MolToInchiKey(mol)
+    return None
+
+
+def smiles_to_inchi(smiles):
+    """(InChI, InChIKey) of a SMILES string, or (None, None) if it cannot be parsed."""
+    if isinstance(smiles, str) and smiles.strip():
+        from rdkit import Chem
+        mol = Chem.MolFromSmiles(smiles)
+        if mol:
+            inchi = Chem.MolToInchi(mol)
+            if inchi:
+                return inchi, Chem.InchiToInchiKey(inchi)
+    return None, None
+
+
+def _inchikey_chunk(smiles):
+    return [smiles_to_inchikey(s) for s in smiles]
+
+
+class InChIKeyCache:
+    def __init__(self, db_path, timeout=120.0):
+        self.db_path = db_path
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=timeout)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_many(self, smiles, batch_size=500):
+        """{smiles: inchikey} for the SMILES found in the cache (None for unparsable ones)."""
+        smiles = list(smiles)
+        found = {}
+        for i in range(0, len(smiles), batch_size):
+            batch = smiles[i:i + batch_size]
+            found.update(self._conn.execute(
+                f"SELECT smiles, inchikey FROM inchikeys WHERE smiles IN ({','.join('?' * len(batch))})",
+                batch
+            ))
+        return found
+
+    def put_many(self, items):
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO inchikeys (smiles, inchikey) VALUES (?, ?)", items)
+
+    def close(self):
+        self._conn.close()
+
+
+def compute_inchikeys(smiles, processes=None, chunk_size=2000, on_chunk=None):
+    """{smiles: inchikey} for a list of distinct SMILES.
+
+    Chunks of chunk_size SMILES run on a process pool (processes=1 runs in
+    the calling process). on_chunk is called with the pairs of every
+    finished chunk, e.g. to write them to a cache.
+    """
+    smiles = list(smiles)
+    chunks = [smiles[i:i + chunk_size] for i in range(0, len(smiles), chunk_size)]
+    if processes == 1 or len(chunks) <= 1:
+        results = map(_inchikey_chunk, chunks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=processes)
+        results = executor.map(_inchikey_chunk, chunks)
+
+    keys = {}
+    try:
+        for chunk, chunk_keys in zip(chunks, results):
+            pairs = list(zip(chunk, chunk_keys))
+            keys.update(pairs)
+            if on_chunk is not None:
+                on_chunk(pairs)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return keys
+
+
+def inchikey_column(values, cache_path=None, processes=None, chunk_size=2000):
+    """InChIKeys for a Series of SMILES, aligned with its index.
+
+    Every distinct SMILES is converted once; with cache_path the keys are
+    read from and added to that SQLite cache. Missing, empty and
+    unparsable SMILES give a missing value.
+    """
+    unique = [s for s in values.dropna().unique() if isinstance(s, str) and s.strip()]
+    cache = InChIKeyCache(cache_path) if cache_path else None
+    try:
+        keys = cache.get_many(unique) if cache else {}
+        missing = [s for s in unique if s not in keys]
+        keys.update(compute_inchikeys(
+            missing, processes, chunk_size, on_chunk=cache.put_many if cache else None
+        ))
+    finally:
+        if cache:
+            cache.close()
+    return values.map(keys)
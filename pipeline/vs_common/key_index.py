@@ -0,0 +1,187 @@
+"""Compact on-disk index of InChIKeys for streaming membership tests.
+
+Keeping only the compounds of a catalogue that are also in a reference
+dataset used to mean holding the reference keys (or both tables) in memory.
+A key index stores the distinct reference InChIKeys once, without hyphens,
+as a sorted array of 25-byte records, followed by a Bloom filter over them:
+
+    <reference>.keyidx = 4 KiB text header | sorted keys | Bloom filter
+
+contains() tests a chunk of keys against the Bloom filter (held in memory,
+about bloom_bits bits per key) and verifies the candidates by binary search
+in the memory-mapped key array, so a negative costs a few bit lookups and a
+positive a few page reads. Only the chunk being tested is held in memory.
+
+The index is built from chunks of keys, bucketed on disk by their first
+letter and sorted bucket by bucket, so building it does not need the
+reference in memory either. Like the .mae offset index, it carries a stamp
+of the reference file (size, mtime and what the keys were taken from) and
+load_key_index() rebuilds it when the stamp no longer matches.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+INDEX_VERSION = "keyidx-1"
+HEADER_SIZE = 4096
+KEY_WIDTH = 25
+KEY_PATTERN = r"[A-Z]{14}-[A-Z]{10}-[A-Z]"
+
+
+def encode_keys(keys):
+    """(S25 array of the well-formed InChIKeys without hyphens, mask of those keys)."""
+    keys = pd.Series(keys, dtype=object)
+    valid = keys.str.fullmatch(KEY_PATTERN).eq(True).to_numpy()
+    encoded = keys[valid].str.replace("-", "", regex=False).to_numpy().astype(f"S{KEY_WIDTH}")
+    return encoded, valid
+
+
+def _bloom_positions(encoded, n_bits, n_hashes):
+    """(n_hashes, len(encoded)) bit positions by double hashing.
+
+    InChIKey letters are themselves hash output; the first 13 letters and the
+    remaining 12 are read as base-26 numbers and mixed into two 64-bit hashes.
+    """
+    letters = encoded.view(np.uint8).reshape(-1, KEY_WIDTH).astype(np.uint64) - np.uint64(65)
+    h1 = np.zeros(len(encoded), dtype=np.uint64)
+    h2 = np.zeros(len(encoded), dtype=np.uint64)
+    for i in range(13):
+        h1 = h1 * np.uint64(26) + letters[:, i]
+    for i in range(13, KEY_WIDTH):
+        h2 = h2 * np.uint64(26) + letters[:, i]
+    h2 = (h2 * np.uint64(0x9E3779B97F4A7C15)) ^ (h1 >> np.uint64(29)) | np.uint64(1)
+    return np.stack([(h1 + np.uint64(i) * h2) % np.uint64(n_bits) for i in range(n_hashes)])
+
+
+def _file_stamp(path, source):
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}:{source}"
+
+
+def index_path_for(reference_file, index_dir=None):
+    name = os.path.basename(reference_file) + ".keyidx"
+    if index_dir is None:
+        return reference_file + ".keyidx"
+    return os.path.join(index_dir, name)
+
+
+def build_key_index(key_chunks, index_file, stamp="-", bloom_bits=10, tmp_dir=None):
+    """Write the distinct well-formed keys of an iterable of key chunks to index_file.
+
+    bloom_bits is the Bloom filter size in bits per key (0 for no filter).
+    Returns the number of distinct keys.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(index_file)), exist_ok=True)
+    tmp_file = f"{index_file}.tmp.{os.getpid()}"
+    bucket_dir = tempfile.mkdtemp(prefix="keyidx_", dir=tmp_dir or os.path.dirname(os.path.abspath(index_file)))
+    try:
+        buckets = [os.path.join(bucket_dir, chr(65 + i)) for i in range(26)]
+        for keys in key_chunks:
+            encoded, _ = encode_keys(keys)
+            first = encoded.view(np.uint8).reshape(-1, KEY_WIDTH)[:, 0] - 65
+            order = np.argsort(first, kind="stable")
+            bounds = np.searchsorted(first[order], np.arange(27))
+            for i in range(26):
+                if bounds[i] < bounds[i + 1]:
+                    with open(buckets[i], "ab") as f:
+                        encoded[order[bounds[i]:bounds[i + 1]]].tofile(f)
+
+        n_keys = 0
+        with open(tmp_file, "wb") as out:
+            out.write(b"\0" * HEADER_SIZE)
+            for bucket in buckets:
+                if os.path.exists(bucket):
+                    keys = np.unique(np.fromfile(bucket, dtype=f"S{KEY_WIDTH}"))
+                    keys.tofile(out)
+                    n_keys += len(keys)
+                    os.remove(bucket)
+    finally:
+        shutil.rmtree(bucket_dir, ignore_errors=True)
+
+    n_bits = -(-n_keys * bloom_bits // 64) * 64 if bloom_bits else 0
+    n_hashes = min(16, max(1, round(bloom_bits * 0.693))) if bloom_bits else 0
+    with open(tmp_file, "r+b") as out:
+        if n_bits:
+            bloom = np.zeros(n_bits // 8, dtype=np.uint8)
+            keys = np.memmap(tmp_file, dtype=f"S{KEY_WIDTH}", mode="r", offset=HEADER_SIZE, shape=(n_keys,))
+            for start in range(0, n_keys, 1 << 20):
+                positions = _bloom_positions(np.asarray(keys[start:start + (1 << 20)]), n_bits, n_hashes).ravel()
+                bits = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+                np.bitwise_or.at(bloom, (positions >> np.uint64(3)).astype(np.intp), bits)
+            del keys
+            out.seek(HEADER_SIZE + n_keys * KEY_WIDTH)
+            bloom.tofile(out)
+        header = f"# {INDEX_VERSION} {stamp} {n_keys} {n_bits} {n_hashes}\n".encode()
+        if len(header) > HEADER_SIZE:
+            raise ValueError(f"Key index stamp too long: {stamp}")
+        out.seek(0)
+        out.write(header)
+
+    os.replace(tmp_file, index_file)
+    return n_keys
+
+
+class KeyIndex:
+    def __init__(self, index_file):
+        self.index_file = index_file
+        with open(index_file, "rb") as f:
+            header = f.read(HEADER_SIZE).split(b"\n", 1)[0].decode().split()
+        if len(header) != 6 or header[:2] != ["#", INDEX_VERSION]:
+            raise ValueError(f"{index_file} is not a key index")
+        self.stamp = header[2]
+        self.n_keys, self.n_bits, self.n_hashes = map(int, header[3:])
+        self.keys = np.memmap(
+            index_file, dtype=f"S{KEY_WIDTH}", mode="r", offset=HEADER_SIZE, shape=(self.n_keys,)
+        ) if self.n_keys else np.empty(0, dtype=f"S{KEY_WIDTH}")
+        self.bloom = np.fromfile(
+            index_file, dtype=np.uint8, count=self.n_bits // 8, offset=HEADER_SIZE + self.n_keys * KEY_WIDTH
+        ) if self.n_bits else None
+
+    def __len__(self):
+        return self.n_keys
+
+    def contains(self, keys):
+        """Boolean array: which of the keys are in the index (malformed and missing keys are not)."""
+        encoded, valid = encode_keys(keys)
+        found = np.zeros(len(valid), dtype=bool)
+        if not self.n_keys or not len(encoded):
+            return found
+
+        candidates = np.ones(len(encoded), dtype=bool)
+        if self.bloom is not None:
+            positions = _bloom_positions(encoded, self.n_bits, self.n_hashes)
+            bits = self.bloom[(positions >> np.uint64(3)).astype(np.intp)] >> (positions & np.uint64(7)).astype(np.uint8)
+            candidates = (bits & 1).all(axis=0).astype(bool)
+
+        # Sorted queries let the binary searches walk the memory-mapped keys in order.
+        unique, inverse = np.unique(encoded[candidates], return_inverse=True)
+        at = np.searchsorted(self.keys, unique)
+        hit = at < self.n_keys
+        hit[hit] = self.keys[at[hit]] == unique[hit]
+        matched = np.zeros(len(encoded), dtype=bool)
+        matched[candidates] = hit[inverse]
+        found[valid] = matched
+        return found
+
+
+def load_key_index(reference_file, key_chunks, source="", index_file=None, bloom_bits=10, tmp_dir=None):
+    """KeyIndex of a reference file, rebuilt from key_chunks() if it is missing or stale.
+
+    key_chunks is a callable returning the chunks of reference keys; it is only
+    called when the index has to be (re)built. source names what the keys are
+    taken from (e.g. the column) and is part of the stamp.
+    """
+    index_file = index_file or index_path_for(reference_file)
+    stamp = _file_stamp(reference_file, source).replace(" ", "_")
+    if os.path.exists(index_file):
+        try:
+            index = KeyIndex(index_file)
+        except (ValueError, OSError):
+            index = None
+        if index is not None and index.stamp == stamp:
+            return index
+    build_key_index(key_chunks(), index_file, stamp, bloom_bits, tmp_dir)
+    return KeyIndex(index_file)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Streaming top-K leaderboard of docking hits for a running virtual screen.
+
+The best hits used to be known only after the whole screen and a separate
+extraction script had finished. A Leaderboard is fed (receptor, ligand,
+score) as each docking job completes and keeps the k best-scoring ligands
+per receptor and over all receptors in bounded heaps, so memory and update
+cost do not grow with the size of the library. Scores are docking scores
+(lower is better); a ligand that is scored again only replaces its entry
+when the new score is better.
+
+The leaderboard is saved as a small JSON file (written to a temporary file
+and renamed, so readers never see a partial file) at most every
+save_interval seconds and when the pipeline finishes. A restarted run
+loads it and carries on. Query it at any time, also mid-run:
+
+    python vs_common/leaderboard.py leaderboard.json -n 20 [--receptor R]
+
+One pipeline process writes a given leaderboard file.
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import argparse
+import threading
+
+
+class _Reversed(tuple):
+    """Tuple that sorts in reverse, so equal scores also keep the heap's worst entry on top."""
+    __slots__ = ()
+
+    def __lt__(self, other):
+        return tuple.__gt__(self, other)
+
+
+class TopK:
+    """The k entries with the lowest (score, key), one per key, in a bounded max-heap."""
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []  # (-score, reversed key, entry); the worst kept entry is on top
+        self._scores = {}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, key, score, entry):
+        """Keep entry if it is among the k best; returns True if the heap changed."""
+        best = self._scores.get(key)
+        if best is not None:
+            if best <= score:
+                return False
+            self._heap = [item for item in self._heap if item[1] != key]
+            heapq.heapify(self._heap)
+        elif len(self._heap) >= self.k:
+            worst_score, worst_key, _ = self._heap[0]
+            if (score, key) >= (-worst_score, tuple(worst_key)):
+                return False
+            del self._scores[tuple(heapq.heappop(self._heap)[1])]
+        heapq.heappush(self._heap, (-score, _Reversed(key), entry))
+        self._scores[key] = score
+        return True
+
+    def items(self, n=None):
+        """Entries from best to worst."""
+        ranked = sorted(self._heap, key=lambda item: (-item[0], tuple(item[1])))
+        return [entry for _, _, entry in ranked[:n]]
+
+
+def _score(value):
+    """float(value), or None for missing and non-numeric scores (e.g. FlexX "NA")."""
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if score != score else score
+
+
+class Leaderboard:
+    def __init__(self, path=None, k=100, save_interval=60.0):
+        self.path = path
+        self.k = k
+        self.save_interval = save_interval
+        self.seen = 0
+        self._global = TopK(k)
+        self._receptors = {}
+        self._changed = False
+        self._last_save = time.time()
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.save()
+
+    def _load(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        self.seen = data.get("seen", 0)
+        for entries in data.get("receptors", {}).values():
+            for entry in entries:
+                self._push(entry)
+
+    def _push(self, entry):
+        key = (entry["receptor"], entry["ligand"])
+        receptor_top = self._receptors.get(entry["receptor"])
+        if receptor_top is None:
+            receptor_top = self._receptors[entry["receptor"]] = TopK(self.k)
+        changed = receptor_top.push(key, entry["score"], entry)
+        return self._global.push(key, entry["score"], entry) or changed
+
+    def add(self, receptor, ligand, score, **info):
+        """Offer one docking result; extra keyword values (e.g. source) are kept with it.
+
+        Results without a numeric score are ignored. Returns True if the
+        result entered a top-k list.
+        """
+        score = _score(score)
+        if score is None:
+            return False
+        entry = {"receptor": str(receptor), "ligand": str(ligand), "score": score, **info}
+        with self._lock:
+            self.seen += 1
+            changed = self._push(entry)
+            self._changed = self._changed or changed
+            self.maybe_save()
+        return changed
+
+    def add_many(self, hits):
+        """Offer (receptor, ligand, score[, source]) tuples; returns how many entered a list."""
+        with self._lock:
+            return sum(self.add(*hit[:3], **({"source": hit[3]} if len(hit) > 3 else {})) for hit in hits)
+
+    def top(self, n=None, receptor=None):
+        """The n best entries (default k) over all receptors or for one receptor."""
+        with self._lock:
+            if receptor is None:
+                return self._global.items(n)
+            receptor_top = self._receptors.get(str(receptor))
+            return receptor_top.items(n) if receptor_top else []
+
+    def receptors(self):
+        with self._lock:
+            return sorted(self._receptors)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "k": self.k,
+                "seen": self.seen,
+                "updated": time.time(),
+                "global": self._global.items(),
+                "receptors": {receptor: top.items() for receptor, top in sorted(self._receptors.items())},
+            }
+
+    def maybe_save(self):
+        """Save if something changed and save_interval seconds have passed since the last save."""
+        if self._changed and time.time() - self._last_save >= self.save_interval:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = self.to_dict()
+            path_dir = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(path_dir, exist_ok=True)
+            tmp_file = f"{self.path}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp_file, self.path)
+            self._changed = False
+            self._last_save = time.time()
+
+
+def leaderboard_from_config(config):
+    """Leaderboard at config["leaderboard"] (size leaderboard_size, saved every
+    leaderboard_interval seconds), or None if the key is not set."""
+    path = config.get("leaderboard")
+    if not path:
+        return None
+    return Leaderboard(
+        path,
+        k=int(config.get("leaderboard_size", 100)),
+        save_interval=float(config.get("leaderboard_interval", 60))
+    )
+
+
+def read_top(path, n=None, receptor=None):
+    """Top entries of a saved leaderboard file, without rebuilding the heaps."""
+    with open(path) as f:
+        data = json.load(f)
+    entries = data["global"] if receptor is None else data["receptors"].get(receptor, [])
+    return entries[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the current top hits of a VS leaderboard")
+    parser.add_argument("path", help="Leaderboard JSON file written by a VS pipeline")
+    parser.add_argument("-n", type=int, default=20, help="Number of hits to print (default: 20)")
+    parser.add_argument("--receptor", help="Only this receptor (default: all receptors)")
+    parser.add_argument("--receptors", action="store_true", help="List the receptors and exit")
+    args = parser.parse_args()
+
+    if args.receptors:
+        with open(args.path) as f:
+            print("\n".join(json.load(f)["receptors"]))
+        return 0
+
+    for rank, entry in enumerate(read_top(args.path, args.n, args.receptor), start=1):
+        print(f"{rank}\t{entry['score']:.3f}\t{entry['receptor']}\t{entry['ligand']}\t{entry.get('source', '')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
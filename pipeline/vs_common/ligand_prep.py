@@ -0,0 +1,98 @@
+"""Ligand PDBQT preparation backends.
+
+"mgltools" runs AutoDockTools prepare_ligand4.py under MGLTools' pythonsh,
+one Python 2 process per ligand. "meeko" builds the PDBQT in-process from an
+RDKit molecule, so there is no interpreter start-up per ligand and .mae or
+.sdf input can be prepared directly, without a .mol2 intermediate on disk.
+Both backends take a chunk of (input_file, pdbqt_file) jobs and return
+{input_file: None on success, otherwise the error}.
+"""
+import os
+import subprocess
+
+BACKENDS = ("mgltools", "meeko")
+
+
+def mgltools_paths(mgltools_path):
+    """Return (pythonsh, prepare_ligand4.py) for an MGLTools installation directory."""
+    return (
+        os.path.join(mgltools_path, "bin/pythonsh"),
+        os.path.join(mgltools_path, "MGLToolsPckgs/AutoDockTools/Utilities24/prepare_ligand4.py"),
+    )
+
+
+def prepare_with_mgltools(jobs, pythonsh, prepare_script):
+    results = {}
+    for ligand_file, pdbqt_file in jobs:
+        try:
+            subprocess.run([pythonsh, prepare_script, "-l", ligand_file, "-o", pdbqt_file], check=True)
+            results[ligand_file] = None
+        except (subprocess.CalledProcessError, OSError) as e:
+            results[ligand_file] = e
+    return results
+
+
+def read_rdkit_mol(ligand_file):
+    """Read the first structure of a .mae, .sdf, .mol2 or .pdb file with hydrogens kept."""
+    from rdkit import Chem
+
+    ext = os.path.splitext(ligand_file)[1].lower()
+    if ext == ".mae":
+        mols = Chem.MaeMolSupplier(ligand_file, removeHs=False)
+    elif ext == ".sdf":
+        mols = Chem.SDMolSupplier(ligand_file, removeHs=False)
+    elif ext == ".mol2":
+        mols = [Chem.MolFromMol2File(ligand_file, removeHs=False)]
+    elif ext == ".pdb":
+        mols = [Chem.MolFromPDBFile(ligand_file, removeHs=False)]
+    else:
+        raise ValueError(f"Unsupported ligand format: {ligand_file}")
+
+    for mol in mols:
+        if mol is not None:
+            return mol
+    raise ValueError(f"RDKit could not read a structure from {ligand_file}")
+
+
+def meeko_pdbqt_string(mol, preparator=None):
+    """Return the PDBQT text for an RDKit molecule with 3D coordinates (Meeko >= 0.5)."""
+    from rdkit import Chem
+    from meeko import MoleculePreparation, PDBQTWriterLegacy
+
+    if mol.GetNumConformers() == 0 or not mol.GetConformer().Is3D():
+        raise ValueError("ligand has no 3D coordinates")
+    if preparator is None:
+        preparator = MoleculePreparation()
+    mol = Chem.AddHs(mol, addCoords=True)
+    setups = preparator.prepare(mol)
+    pdbqt, ok, error = PDBQTWriterLegacy.write_string(setups[0])
+    if not ok:
+        raise ValueError(error)
+    return pdbqt
+
+
+def prepare_with_meeko(jobs):
+    from meeko import MoleculePreparation
+
+    preparator = MoleculePreparation()
+    results = {}
+    for ligand_file, pdbqt_file in jobs:
+        try:
+            pdbqt = meeko_pdbqt_string(read_rdkit_mol(ligand_file), preparator)
+            tmp_file = f"{pdbqt_file}.tmp.{os.getpid()}"
+            with open(tmp_file, "w") as f:
+                f.write(pdbqt)
+            os.replace(tmp_file, pdbqt_file)
+            results[ligand_file] = None
+        except Exception as e:
+            results[ligand_file] = e
+    return results
+
+
+def prepare_ligands(jobs, backend="mgltools", pythonsh=None, prepare_script=None):
+    """Write a PDBQT file for every (input_file, pdbqt_file) job in a chunk."""
+    if backend == "mgltools":
+        return prepare_with_mgltools(jobs, pythonsh, prepare_script)
+    if backend == "meeko":
+        return prepare_with_meeko(jobs)
+    raise ValueError(f"Unknown ligand preparation backend {backend!r}, expected one of {BACKENDS}")
@@ -0,0 +1,187 @@
+import os
+import re
+from collections import namedtuple
+
+MaeBlock = namedtuple("MaeBlock", ["title", "offset", "length"])
+
+BLOCK_START = b"f_m_ct {"
+INDEX_VERSION = "mae-index-v1"
+
+_VALUE_TOKEN = re.compile(rb'"(?:\\.|[^"\\])*"|\S+')
+_QUOTED = re.compile(rb'"(?:\\.|[^"\\])*"')
+
+
+def _unquote(token):
+    if token.startswith(b'"') and token.endswith(b'"') and len(token) >= 2:
+        token = token[1:-1].replace(b'\\"', b'"').replace(b"\\\\", b"\\")
+    return token.decode("utf-8", errors="replace")
+
+
+def _is_block_start(line):
+    return line.lstrip().startswith(BLOCK_START)
+
+
+def _parse_title(keys, values):
+    """Return s_m_title if present, otherwise the first property value."""
+    if not values:
+        return None
+    if "s_m_title" in keys:
+        idx = keys.index("s_m_title")
+        if idx < len(values):
+            return values[idx]
+    return values[0]
+
+
+def _scan_blocks(mae_path, collect_quoted):
+    with open(mae_path, "rb") as f:
+        offset = 0
+        start = None
+        keys, values = [], []
+        quoted = set() if collect_quoted else None
+        state = None
+
+        for line in f:
+            if _is_block_start(line):
+                if start is not None:
+                    yield MaeBlock(_parse_title(keys, values), start, offset - start), quoted
+                start = offset
+                keys, values = [], []
+                quoted = set() if collect_quoted else None
+                state = "keys"
+            elif state == "keys":
+                stripped = line.strip()
+                if stripped == b":::":
+                    state = "values" if keys else None
+                elif stripped and not stripped.startswith(b"#"):
+                    keys.append(stripped.decode("utf-8", errors="replace"))
+            elif state == "values":
+                for token in _VALUE_TOKEN.findall(line):
+                    values.append(_unquote(token))
+                if len(values) >= len(keys):
+                    state = None
+
+            if collect_quoted and start is not None and b'"' in line:
+                quoted.update(_unquote(token) for token in _QUOTED.findall(line))
+
+            offset += len(line)
+
+        if start is not None:
+            yield MaeBlock(_parse_title(keys, values), start, offset - start), quoted
+
+
+def iter_mae_blocks(mae_path):
+    """Stream (title, offset, length) for every f_m_ct block in an MAE file.
+
+    Only the property header of each block is parsed, so memory use does not
+    depend on the size of the library.
+    """
+    for block, _ in _scan_blocks(mae_path, collect_quoted=False):
+        yield block
+
+
+def iter_mae_quoted_values(mae_path):
+    """Stream (MaeBlock, quoted) pairs, where quoted is the set of every quoted
+    string value found anywhere in the block."""
+    return _scan_blocks(mae_path, collect_quoted=True)
+
+
+def match_titles(mae_index, names):
+    """Return {name: [(offset, length), ...]} for names present in an index."""
+    return {name: mae_index[name] for name in names if name in mae_index}
+
+
+def match_quoted_values(mae_path, names):
+    """Return {name: [(offset, length), ...]} for blocks containing "name" as
+    any quoted value, not only as the title.
+
+    Each block is tokenized once and matched by set intersection, so the cost
+    does not depend on how many names are requested.
+    """
+    matches = {}
+    for block, quoted in iter_mae_quoted_values(mae_path):
+        for name in quoted.intersection(names):
+            matches.setdefault(name, []).append((block.offset, block.length))
+    return matches
+
+
+def _file_stamp(mae_path):
+    st = os.stat(mae_path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def index_path_for(mae_path, index_dir=None):
+    name = os.path.basename(mae_path) + ".idx"
+    if index_dir is None:
+        return mae_path + ".idx"
+    return os.path.join(index_dir, name)
+
+
+def build_mae_index(mae_path, index_file):
+    """Scan an MAE library once and persist its block offsets to index_file."""
+    os.makedirs(os.path.dirname(os.path.abspath(index_file)), exist_ok=True)
+    tmp_file = f"{index_file}.tmp.{os.getpid()}"
+    stamp = _file_stamp(mae_path)
+
+    with open(tmp_file, "w", encoding="utf-8") as out:
+        out.write(f"# {INDEX_VERSION} {stamp}\n")
+        for block in iter_mae_blocks(mae_path):
+            title = "" if block.title is None else block.title
+            out.write(f"{block.offset}\t{block.length}\t{title}\n")
+
+    os.replace(tmp_file, index_file)
+
+
+def _read_index(mae_path, index_file):
+    entries = {}
+    with open(index_file, "r", encoding="utf-8") as f:
+        header = f.readline().split()
+        if header[1:] != [INDEX_VERSION, _file_stamp(mae_path)]:
+            return None
+        for line in f:
+            offset, length, title = line.rstrip("\n").split("\t", 2)
+            entries.setdefault(title, []).append((int(offset), int(length)))
+    return entries
+
+
+def load_mae_index(mae_path, index_dir=None):
+    """Return {title: [(offset, length), ...]} for an MAE library.
+
+    The index is rebuilt when it is missing or when the library size/mtime no
+    longer match the stamp stored in the index header.
+    """
+    index_file = index_path_for(mae_path, index_dir)
+    if os.path.exists(index_file):
+        try:
+            entries = _read_index(mae_path, index_file)
+        except (ValueError, IndexError):
+            entries = None
+        if entries is not None:
+            return entries
+
+    build_mae_index(mae_path, index_file)
+    return _read_index(mae_path, index_file)
+
+
+def read_mae_header(mae_path):
+    """Return the raw bytes preceding the first f_m_ct block."""
+    header = []
+    with open(mae_path, "rb") as f:
+        for line in f:
+            if _is_block_start(line):
+                break
+            header.append(line)
+    return b"".join(header)
+
+
+def read_mae_block(handle, offset, length):
+    handle.seek(offset)
+    return handle.read(length)
+
+
+def write_single_mae(output_file, header, mae_path, offset, length):
+    """Write one block of mae_path, preceded by the library header, to output_file."""
+    with open(mae_path, "rb") as src:
+        block = read_mae_block(src, offset, length)
+    with open(output_file, "wb") as out:
+        out.write(header)
+        out.write(block)
@@ -0,0 +1,163 @@
+"""Reference/pose pairing for the cross-docking RMSD scripts.
+
+Pose file names carry the receptor (or grid) id, the ligand id and sometimes
+a pose rank, in an engine-specific layout. Each pose name is parsed once into
+a PoseName and its ligand id is looked up in a dict of reference ids, so
+pairing is linear in the number of files. When a name does not separate the
+receptor from the ligand (e.g. glide "grid_<receptor>_<ligand>"), the ligand is
+resolved as the trailing "_"-separated tokens that equal a reference id, so
+"1abc" never matches a pose of "1abcd" and a pose docked into receptor 1abc
+is not paired with reference 1abc. Poses that match no reference, references
+without poses, and poses that match several references (or a reference id
+shared by several files) are reported instead of silently paired.
+"""
+import os
+import logging
+from collections import defaultdict, namedtuple
+
+PoseName = namedtuple("PoseName", ["receptor", "ligand", "rank"])
+Pairing = namedtuple("Pairing", ["pairs", "unmatched_references", "unmatched_poses", "ambiguous"])
+
+logger = logging.getLogger(__name__)
+
+
+def _stem(filename, ext=None):
+    if ext and filename.endswith(ext):
+        return filename[:-len(ext)]
+    return os.path.splitext(filename)[0]
+
+
+def _rank(text):
+    return int(text) if text and text.isdigit() else None
+
+
+# Reference id parsers: reference file name -> ligand id
+
+def prepared_reference_id(filename):
+    """"<ligand>_-_prepared.pdb" -> "<ligand>"."""
+    return _stem(filename).replace("_-_prepared", "")
+
+
+def plain_reference_id(filename):
+    """"<ligand>.sdf" -> "<ligand>"."""
+    return _stem(filename)
+
+
+# Pose name parsers: pose file name -> PoseName, or None if the name does not
+# follow the engine's layout. An empty receptor means it is still part of the
+# ligand text and is split off when the ligand is resolved.
+
+def glide_pose_name(filename):
+    """"grid_<receptor>_<ligand>_pv_ligand<rank>.mae"."""
+    stem = _stem(filename)
+    if stem.startswith("grid_"):
+        stem = stem[len("grid_"):]
+    base, sep, rank = stem.rpartition("_pv_ligand")
+    if not sep:
+        return PoseName("", stem, None)
+    return PoseName("", base, _rank(rank))
+
+
+def vina_pose_name(filename):
+    """"<receptor>_-_prepared_protein_<ligand>_-_prepared.pdbqt" (one pose per file)."""
+    stem = _stem(filename)
+    if stem.endswith("_out"):
+        # Vina's default --out name
+        stem = stem[:-len("_out")]
+    receptor, sep, ligand = stem.partition("_-_prepared_protein_")
+    if not sep:
+        return PoseName("", stem.replace("_-_prepared", ""), None)
+    return PoseName(receptor, ligand.replace("_-_prepared", ""), None)
+
+
+def prepared_pose_name(filename):
+    """"<receptor>_-_prepared_<ligand>.sdf" as written by gnina and DiffDock."""
+    receptor, sep, ligand = _stem(filename).rpartition("_-_prepared_")
+    if not sep:
+        return None
+    return PoseName(receptor, ligand, None)
+
+
+def split_pose_name(filename, separator, trim, ext=None):
+    """"<receptor><separator><ligand><trim><rank>", e.g. FlexX "<receptor>_docked_<ligand>_<n>.sdf"."""
+    stem = _stem(filename, ext)
+    receptor, sep, rest = stem.rpartition(separator)
+    ligand, sep_trim, rank = rest.rpartition(trim)
+    if not sep_trim:
+        ligand, rank = rest, None
+    return PoseName(receptor if sep else "", ligand, _rank(rank))
+
+
+class PairingIndex:
+    """Dict of reference ids -> reference files, queried once per pose."""
+
+    def __init__(self, ref_files, ref_id):
+        self.references = defaultdict(list)
+        for ref_file in ref_files:
+            self.references[ref_id(ref_file)].append(ref_file)
+        self.max_tokens = max((ligand.count("_") + 1 for ligand in self.references), default=0)
+
+    def resolve(self, pose):
+        """Return the reference ids a parsed pose name can belong to."""
+        if pose.receptor and pose.ligand in self.references:
+            return [pose.ligand]
+        # Receptor and ligand are not separated: try the trailing tokens
+        tokens = pose.ligand.split("_")
+        start = max(0, len(tokens) - self.max_tokens)
+        return [
+            candidate for candidate in ("_".join(tokens[i:]) for i in range(start, len(tokens)))
+            if candidate in self.references
+        ]
+
+    def pair(self, pose_files, pose_name):
+        """Pair pose files with references and return a Pairing.
+
+        pairs is a list of (reference_file, pose_file), grouped by reference.
+        ambiguous lists (pose_file, [reference_file, ...]) for poses that
+        match more than one reference file.
+        """
+        by_ligand = defaultdict(list)
+        unmatched_poses, ambiguous = [], []
+
+        for pose_file in pose_files:
+            parsed = pose_name(pose_file)
+            candidates = self.resolve(parsed) if parsed is not None and parsed.ligand else []
+            ref_files = [ref_file for ligand in candidates for ref_file in self.references[ligand]]
+            if not ref_files:
+                unmatched_poses.append(pose_file)
+            elif len(ref_files) > 1:
+                ambiguous.append((pose_file, ref_files))
+            else:
+                by_ligand[candidates[0]].append(pose_file)
+
+        pairs, unmatched_references = [], []
+        for ligand, ref_files in self.references.items():
+            if ligand not in by_ligand:
+                unmatched_references.extend(ref_files)
+                continue
+            pairs.extend((ref_files[0], pose_file) for pose_file in by_ligand[ligand])
+
+        return Pairing(pairs, unmatched_references, unmatched_poses, ambiguous)
+
+
+def pair_directory(ref_dir, pose_dir, ref_ext, pose_ext, ref_id, pose_name):
+    """Pair the reference and pose files (by name) of two directories."""
+    ref_files = sorted(f for f in os.listdir(ref_dir) if f.endswith(ref_ext))
+    pose_files = sorted(f for f in os.listdir(pose_dir) if f.endswith(pose_ext))
+    return PairingIndex(ref_files, ref_id).pair(pose_files, pose_name)
+
+
+def log_pairing(pairing, log=None):
+    """Log a summary of a Pairing and every entry that could not be paired."""
+    log = log or logger
+    log.info(
+        f"Paired {len(pairing.pairs)} poses; {len(pairing.unmatched_poses)} unmatched poses, "
+        f"{len(pairing.unmatched_references)} references without poses, "
+        f"{len(pairing.ambiguous)} ambiguous poses"
+    )
+    for ref_file in pairing.unmatched_references:
+        log.warning(f"No matching poses found for reference ligand: {ref_file}")
+    for pose_file in pairing.unmatched_poses:
+        log.warning(f"No reference ligand matches pose: {pose_file}")
+    for pose_file, ref_files in pairing.ambiguous:
+        log.warning(f"Ambiguous pose {pose_file} matches {', '.join(ref_files)}; skipped")
@@ -0,0 +1,224 @@
+"""Partitioned Parquet store for docking scores of all engines.
+
+Every extractor used to build a Python list and dump its own CSV layout,
+which the ROC and ranking steps then parsed again in full. ResultsStore keeps
+one schema for all engines:
+
+    run, engine, receptor, ligand, pose, score, source
+
+plus any extra numeric columns an engine reports (e.g. CNNscore for GNINA).
+score is the engine's primary docking score (lower is better) and source
+is the output file the row was extracted from. Rows are written as a hive
+partitioned dataset (<root>/run=<run>/engine=<engine>/receptor=<receptor>/),
+and every append adds new part files, so existing data is never rewritten.
+Readers ask for the columns and partitions they need and Parquet reads only
+those.
+
+pyarrow is imported on first use, so scripts that do not use the store keep
+working without it.
+"""
+import os
+import uuid
+from urllib.parse import quote
+
+import pandas as pd
+
+PARTITIONS = ["run", "engine", "receptor"]
+KEY_COLUMNS = PARTITIONS + ["ligand", "pose"]
+COLUMNS = KEY_COLUMNS + ["score", "source"]
+
+
+def ligand_from_file(filename, suffixes=(".gz", ".sdf", ".pdbqt", ".mol2", ".mae", ".maegz", ".log")):
+    """'active_1.sdf.gz' -> 'active_1': the file name without its known extensions."""
+    name = os.path.basename(filename)
+    stripped = True
+    while stripped:
+        stripped = False
+        for suffix in suffixes:
+            if name.endswith(suffix) and len(name) > len(suffix):
+                name = name[:-len(suffix)]
+                stripped = True
+    return name
+
+
+def results_frame(run, engine, ligands, scores, sources, receptor="", poses=None, **extra):
+    """Build a DataFrame in the store schema from per-row lists."""
+    n = len(ligands)
+    df = pd.DataFrame({
+        "run": [run] * n,
+        "engine": [engine] * n,
+        "receptor": receptor if isinstance(receptor, list) else [receptor] * n,
+        "ligand": ligands,
+        "pose": poses if poses is not None else [1] * n,
+        "score": scores,
+        "source": sources,
+    })
+    for name, values in extra.items():
+        df[name] = values
+    return df
+
+
+class ResultsStore:
+    def __init__(self, root):
+        self.root = root
+
+    def _normalize(self, df):
+        missing = [c for c in COLUMNS if c not in df.columns]
+        if missing:
+            raise ValueError(f"Results are missing columns: {', '.join(missing)}")
+        df = df.copy()
+        for column in PARTITIONS + ["ligand", "source"]:
+            df[column] = df[column].fillna("").astype(str)
+        df["pose"] = df["pose"].fillna(1).astype("int32")
+        df["score"] = pd.to_numeric(df["score"], errors="coerce").astype("float64")
+        return df
+
+    def append(self, df):
+        """Append rows in the store schema as new part files; returns the number of rows."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if df is None or len(df) == 0:
+            return 0
+        df = self._normalize(df)
+        os.makedirs(self.root, exist_ok=True)
+        pq.write_to_dataset(
+            pa.Table.from_pandas(df, preserve_index=False),
+            self.root,
+            partition_cols=PARTITIONS,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        )
+        return len(df)
+
+    def _partition_dir(self, run=None, engine=None, receptor=None):
+        # write_to_dataset URL-encodes partition values ("screen 2024" -> "screen%202024")
+        path = self.root
+        for name, value in (("run", run), ("engine", engine), ("receptor", receptor)):
+            if value is None:
+                break
+            path = os.path.join(path, f"{name}={quote(str(value), safe='')}")
+        return path
+
+    def read(self, columns=None, run=None, engine=None, receptor=None):
+        """Read the selected columns of one run / engine / receptor (None = all).
+
+        Only the partition directory that is asked for is opened, so engines
+        with different extra columns do not have to share a schema.
+        Partition columns come back as plain strings.
+        """
+        fixed = {}
+        for name, value in (("run", run), ("engine", engine), ("receptor", receptor)):
+            if value is None:
+                break
+            fixed[name] = str(value)
+        path = self._partition_dir(run, engine, receptor)
+        if not os.path.isdir(path):
+            return pd.DataFrame(columns=columns or COLUMNS)
+
+        wanted = None if columns is None else [c for c in columns if c not in fixed]
+        df = pd.read_parquet(path, columns=wanted)
+        for column in PARTITIONS:
+            if column in fixed and (columns is None or column in columns):
+                df[column] = fixed[column]
+            elif column in df.columns:
+                df[column] = df[column].astype(str)
+        return df if columns is None else df[list(columns)]
+
+    def sources(self, run, engine, receptor=None):
+        """Set of source files already extracted for a run and engine."""
+        return set(self.read(["source"], run, engine, receptor)["source"])
+
+    def scores(self, run, engine, pose=1, columns=("score",)):
+        """receptor, ligand and score (or other columns) of one run and engine.
+
+        By default only the first (top-ranked) pose of each output is kept;
+        pose=None returns every pose.
+        """
+        df = self.read(["receptor", "ligand", "pose", "source", *columns], run, engine)
+        if pose is not None:
+            df = df[df["pose"] == pose]
+        return df.reset_index(drop=True)
+
+    def remove_sources(self, run, engine, sources):
+        """Drop the rows extracted from the given source files (e.g. files that changed).
+
+        Only part files that contain one of the sources are rewritten.
+        Returns the number of rows removed.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        value_set = pa.array(sorted(set(sources)), pa.string())
+        if not len(value_set):
+            return 0
+        removed = 0
+        for dirpath, dirnames, filenames in os.walk(self._partition_dir(run, engine)):
+            for filename in filenames:
+                if not filename.endswith(".parquet"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                table = pq.read_table(path, partitioning=None)
+                kept = table.filter(pc.invert(pc.is_in(table["source"], value_set=value_set)))
+                if kept.num_rows == table.num_rows:
+                    continue
+                removed += table.num_rows - kept.num_rows
+                if kept.num_rows:
+                    tmp_file = os.path.join(dirpath, f".remove-{uuid.uuid4().hex}.tmp")
+                    pq.write_table(kept, tmp_file)
+                    os.replace(tmp_file, path)
+                else:
+                    os.remove(path)
+        return removed
+
+    def compact(self, run=None, engine=None, receptor=None):
+        """Rewrite every leaf partition under a run / engine / receptor into one part file."""
+        import pyarrow.parquet as pq
+
+        start = self._partition_dir(run, engine, receptor)
+        for dirpath, dirnames, filenames in os.walk(start):
+            parts = sorted(f for f in filenames if f.endswith(".parquet"))
+            if dirnames or len(parts) < 2:
+                continue
+            table = pq.ParquetDataset([os.path.join(dirpath, f) for f in parts]).read()
+            tmp_file = os.path.join(dirpath, f".compact-{uuid.uuid4().hex}.tmp")
+            pq.write_table(table, tmp_file)
+            os.replace(tmp_file, os.path.join(dirpath, f"part-{uuid.uuid4().hex}-0.parquet"))
+            for f in parts:
+                os.remove(os.path.join(dirpath, f))
+
+
+def check_round_trip(run="screen 2024/a%b", engine="vina", receptor="rec 1"):
+    """Append, read, list, remove and compact rows under partition values that
+    need escaping, in a temporary store; raises AssertionError on a mismatch."""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as root:
+        store = ResultsStore(root)
+        store.append(results_frame(run, engine, ["l1", "l2"], [-5.0, -6.0], ["a.sdf", "b.sdf"], receptor=receptor))
+        store.append(results_frame(run, engine, ["l3"], [-7.0], ["c.sdf"], receptor=receptor))
+        df = store.read(run=run, engine=engine)
+        assert sorted(df["ligand"]) == ["l1", "l2", "l3"], df
+        assert set(df["run"]) == {run} and set(df["receptor"]) == {receptor}, df
+        assert set(store.read(run=run)["engine"]) == {engine}
+        assert len(store.read(run=run, engine=engine, receptor=receptor)) == 3
+        assert store.sources(run, engine) == {"a.sdf", "b.sdf", "c.sdf"}
+        assert len(store.scores(run, engine)) == 3
+        assert store.remove_sources(run, engine, ["b.sdf"]) == 1
+        store.compact(run, engine)
+        assert sorted(store.read(["ligand"], run, engine)["ligand"]) == ["l1", "l3"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Results store checks")
+    parser.add_argument("--check", action="store_true",
+                        help="Round-trip rows through a temporary store with partition values that need escaping")
+    args = parser.parse_args()
+    if args.check:
+        check_round_trip()
+        check_round_trip(run="run_1", receptor="")
+        print("Results store round trip OK")
+    else:
+        parser.print_help()
@@ -0,0 +1,438 @@
+"""In-place ligand RMSD without a PyMOL session.
+
+The optimization RMSD scripts used to load every (reference, pose) pair into
+PyMOL and call rms_cur(matchmaker=4), which pairs atoms by their index in the
+two objects, uses every atom including hydrogens, and stops at the shorter of
+the two atom lists. PyMOL keeps the file order of .sdf and .mol2 input but
+sorts the atoms of .pdb/.pdbqt input by residue and atom name on load.
+This module parses each reference once, keeps its coordinates as a NumPy
+array and computes the RMSD of all poses of that reference in one batched
+operation. Groups of poses are spread over a process pool.
+
+Two methods are available:
+
+* "index" reproduces rms_cur(matchmaker=4), including PyMOL's atom sorting
+  for .pdb/.pdbqt files, and is the default, so existing results stay
+  comparable.
+* "symmetry" uses heavy atoms only and takes the lowest RMSD over all
+  graph-isomorphic atom mappings between reference and pose. It does not
+  depend on atom order, so it also gives the right answer when the docking
+  program writes atoms in a different order than the reference, and it
+  does not penalize flipped symmetric groups such as carboxylates or phenyl
+  rings.
+
+No superposition is done in either mode; the poses are already in the
+reference frame.
+"""
+import os
+from functools import lru_cache
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+METHODS = ("index", "symmetry")
+
+# AutoDock atom types whose first letters are not the element symbol
+AUTODOCK_TYPES = {
+    "A": "C", "OA": "O", "OS": "O", "NA": "N", "NS": "N", "SA": "S",
+    "HD": "H", "HS": "H", "CL": "Cl", "BR": "Br", "MG": "Mg", "ZN": "Zn",
+    "MN": "Mn", "FE": "Fe", "CA": "Ca", "G": "C", "G0": "C", "G1": "C",
+    "CG0": "C", "CG1": "C",
+}
+
+# Atom name priorities PyMOL uses when it sorts the atoms of a residue
+PYMOL_BACKBONE = {"N": 1, "CA": 2, "C": 3, "O": 4}
+REMOTENESS = "ABGDEZHIJKLMN"
+
+# Extra distance (Angstrom) over the sum of covalent radii that still counts as a bond
+BOND_TOLERANCE = 0.45
+
+# Upper bound on atom mappings per reference/pose topology
+MAX_MAPPINGS = 10000
+
+BATCH_ELEMENTS = 8 * 1024 * 1024
+
+
+class Ligand:
+    """Coordinates, element symbols and (for the symmetry method) bonds of one structure."""
+
+    def __init__(self, coords, elements, bonds=None):
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        self.elements = list(elements)
+        self.bonds = bonds
+
+    def heavy(self):
+        """Return a Ligand with hydrogens removed and bonds renumbered."""
+        keep = [i for i, element in enumerate(self.elements) if element != "H"]
+        new_index = {old: new for new, old in enumerate(keep)}
+        bonds = None
+        if self.bonds is not None:
+            bonds = [(new_index[i], new_index[j]) for i, j in self.bonds if i in new_index and j in new_index]
+        return Ligand(self.coords[keep], [self.elements[i] for i in keep], bonds)
+
+
+def _pdb_element(line, pdbqt):
+    if pdbqt:
+        ad_type = line[77:79].strip().upper()
+        if ad_type:
+            return AUTODOCK_TYPES.get(ad_type, ad_type.capitalize())
+    element = line[76:78].strip()
+    if element:
+        return element.capitalize()
+    name = line[12:16].strip().lstrip("0123456789")
+    return name[:1].upper() if name else "X"
+
+
+def _hydrogen_number(text):
+    # PyMOL reads everything after "H1" as one decimal number with letters
+    # worth ord(c) - 48 (H2A -> 37). Numbers outside the range of numbers of
+    # the same length sort at its ends (H1' with H10, H9A with H99), among
+    # themselves by value.
+    value = 0
+    for char in text:
+        value = value * 10 + ord(char) - 48
+    low = 10 ** (len(text) - 1) if len(text) > 1 else 0
+    return min(max(value, low), 10 ** len(text) - 1), value
+
+
+def pymol_priority(name, element):
+    """(priority, tiebreak) PyMOL gives an atom name in a residue; lower sorts first.
+
+    Heavy atoms: backbone N, CA (and every CA* name), C, O, then C/N/O/S
+    names by the remoteness letter after the element (A, B, G, ... N),
+    phosphorus, nucleic acid names (C1P, C1'), X and numbered names (C0,
+    OXT, C1, C10), other letters, and names that do not start with their
+    element or C/N/O/S/P. Hydrogens come after those: H, HN, HA ... HM,
+    then (after heavy atoms numbered above 700) other letters, HX and
+    numbered hydrogens (H1, H2, H21, H2A).
+    """
+    start = 0
+    while start < len(name) - 1 and name[start].isdigit():
+        start += 1
+    core = name[start:]
+    first, rest = core[:1], core[1:]
+
+    if element == "H":
+        if first != "H":
+            return 1000, 0
+        if not rest:
+            return 1001, 0
+        if rest[0] == "N":
+            return 1002, 0
+        if rest[0] in REMOTENESS:
+            return 1002 + max(1, REMOTENESS.index(rest[0])), 0
+        if rest[0] == "X":
+            return 1600, 0
+        if rest[0].isdigit():
+            number, value = _hydrogen_number(rest)
+            return 1700 + number, value
+        return 1500, 0
+
+    if first != element[:1].upper() or first not in "CNOSP":
+        return 1000, 0
+    if first == "P":
+        return 198, 0
+    if core in PYMOL_BACKBONE or core.startswith("CA"):
+        return PYMOL_BACKBONE.get(core, 2), 0
+    if not rest:
+        return 1000, 0
+    if rest[0] in REMOTENESS:
+        return 5 + REMOTENESS.index(rest[0]), 0
+    if rest[0] == "X":
+        return 300, 0
+    if rest[0].isdigit():
+        digits = rest[:len(rest) - len(rest.lstrip("0123456789"))]
+        suffix = rest[len(digits):len(digits) + 1]
+        if suffix == "P":
+            return 199 + int(digits), 0
+        if suffix in ("'", "*"):
+            return 299 - int(digits), 0
+        return 300 + int(digits), 0
+    return 500, 0
+
+
+def pymol_sort_key(index, name, element, residue):
+    """Sort key reproducing the atom order PyMOL gives a residue read from a PDB file.
+
+    Atoms sort by pymol_priority(), then by name without one leading digit,
+    then by full name (1HB, 2HB, HB, HB1).
+    """
+    stripped = name[1:] if name[:1].isdigit() else name
+    return residue, pymol_priority(name, element), stripped, name, index
+
+
+def read_pdb(path, pymol_order=False):
+    """Read ATOM/HETATM records of the first model of a .pdb or .pdbqt file.
+
+    Atoms are returned in file order, or in the order PyMOL would put them
+    in with pymol_order.
+    """
+    pdbqt = path.lower().endswith(".pdbqt")
+    atoms = []
+    with open(path) as f:
+        for line in f:
+            if line.startswith(("ATOM  ", "HETATM")):
+                element = _pdb_element(line, pdbqt)
+                coords = (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+                key = None
+                if pymol_order:
+                    resi = line[22:26].strip()
+                    residue = (line[21], int(resi) if resi.lstrip("-").isdigit() else 0, line[26])
+                    key = pymol_sort_key(len(atoms), line[12:16].strip().upper(), element, residue)
+                atoms.append((key, coords, element))
+            elif line.startswith("ENDMDL") and atoms:
+                break
+    if not atoms:
+        raise ValueError(f"No atoms found in {path}")
+    if pymol_order:
+        atoms.sort(key=lambda atom: atom[0])
+    return Ligand([atom[1] for atom in atoms], [atom[2] for atom in atoms])
+
+
+def read_sdf(path):
+    """Read the first record of a V2000 .sdf/.mol file as text.
+
+    Returns None for V3000 or malformed records, so the caller can fall back
+    to RDKit.
+    """
+    coords, elements, bonds = [], [], []
+    try:
+        with open(path) as f:
+            counts = [f.readline() for _ in range(4)][3]
+            if "V3000" in counts:
+                return None
+            n_atoms, n_bonds = int(counts[0:3]), int(counts[3:6])
+            for _ in range(n_atoms):
+                line = f.readline()
+                coords.append((float(line[0:10]), float(line[10:20]), float(line[20:30])))
+                elements.append(line[31:34].strip())
+            for _ in range(n_bonds):
+                line = f.readline()
+                bonds.append((int(line[0:3]) - 1, int(line[3:6]) - 1))
+    except ValueError:
+        return None
+    if not coords:
+        return None
+    return Ligand(coords, elements, bonds)
+
+
+def read_rdkit(path):
+    """Read the first structure of a .sdf, .mol, .mol2 or .mae file with hydrogens kept and atom order unchanged."""
+    from rdkit import Chem
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".sdf", ".mol"):
+        mols = Chem.SDMolSupplier(path, sanitize=False, removeHs=False)
+    elif ext == ".mol2":
+        mols = [Chem.MolFromMol2File(path, sanitize=False, removeHs=False)]
+    elif ext == ".mae":
+        mols = Chem.MaeMolSupplier(path, sanitize=False, removeHs=False)
+    else:
+        raise ValueError(f"Unsupported structure format: {path}")
+
+    for mol in mols:
+        if mol is not None and mol.GetNumConformers():
+            bonds = [(b.GetBeginAtomIdx(), b.GetEndAtomIdx()) for b in mol.GetBonds()]
+            return Ligand(
+                mol.GetConformer().GetPositions(),
+                [atom.GetSymbol() for atom in mol.GetAtoms()],
+                bonds
+            )
+    raise ValueError(f"RDKit could not read a structure from {path}")
+
+
+def read_ligand(path, pymol_order=False):
+    path = os.fspath(path)
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".pdb", ".pdbqt"):
+        return read_pdb(path, pymol_order)
+    if ext in (".sdf", ".mol"):
+        ligand = read_sdf(path)
+        if ligand is not None:
+            return ligand
+    return read_rdkit(path)
+
+
+@lru_cache(maxsize=None)
+def _atomic_numbers():
+    from rdkit import Chem
+
+    table = Chem.GetPeriodicTable()
+    return {table.GetElementSymbol(n): n for n in range(1, 119)}
+
+
+def _atomic_number(element):
+    return _atomic_numbers().get(element, 0)
+
+
+def perceive_bonds(ligand):
+    """Fill in bonds from interatomic distances (for .pdb/.pdbqt input)."""
+    from rdkit import Chem
+
+    table = Chem.GetPeriodicTable()
+    radii = np.array([table.GetRcovalent(_atomic_number(element)) for element in ligand.elements])
+    dist = np.linalg.norm(ligand.coords[:, None, :] - ligand.coords[None, :, :], axis=-1)
+    cutoff = radii[:, None] + radii[None, :] + BOND_TOLERANCE
+    i, j = np.nonzero(np.triu((dist < cutoff) & (dist > 0.1), k=1))
+    ligand.bonds = list(zip(i.tolist(), j.tolist()))
+    return ligand
+
+
+def topology_key(ligand):
+    return tuple(ligand.elements), tuple(sorted(tuple(sorted(bond)) for bond in ligand.bonds))
+
+
+def _skeleton(ligand):
+    """Element graph of a ligand with every bond single, for isomorphism matching."""
+    from rdkit import Chem
+
+    mol = Chem.RWMol()
+    for element in ligand.elements:
+        atom = Chem.Atom(_atomic_number(element))
+        atom.SetNoImplicit(True)
+        mol.AddAtom(atom)
+    for i, j in ligand.bonds:
+        mol.AddBond(int(i), int(j), Chem.BondType.SINGLE)
+    mol = mol.GetMol()
+    mol.UpdatePropertyCache(strict=False)
+    Chem.FastFindRings(mol)
+    return mol
+
+
+def atom_mappings(reference, pose):
+    """Return an (n_mappings, n_atoms) array: row m lists, for every pose atom,
+    the index of the reference atom it corresponds to under mapping m."""
+    if len(reference.elements) != len(pose.elements):
+        raise ValueError(f"Reference has {len(reference.elements)} heavy atoms, pose has {len(pose.elements)}")
+    matches = _skeleton(reference).GetSubstructMatches(
+        _skeleton(pose), uniquify=False, useChirality=False, maxMatches=MAX_MAPPINGS
+    )
+    if not matches:
+        raise ValueError("No atom mapping between reference and pose (different bond graphs)")
+    return np.array(matches, dtype=np.intp)
+
+
+def batched_rmsd(reference, poses):
+    """RMSD of a (n_poses, n_atoms, 3) stack against (n_atoms, 3) or, with
+    symmetry mappings, (n_mappings, n_atoms, 3) reference coordinates; the
+    minimum over mappings is returned."""
+    if reference.ndim == 2:
+        reference = reference[None]
+    # Bound the (poses, mappings, atoms, 3) difference array to about 64 MB
+    step = max(1, BATCH_ELEMENTS // (reference.size or 1))
+    out = np.empty(len(poses))
+    for start in range(0, len(poses), step):
+        diff = poses[start:start + step, None, :, :] - reference[None, :, :, :]
+        msd = np.einsum("pmaj,pmaj->pm", diff, diff) / reference.shape[1]
+        out[start:start + step] = np.sqrt(msd.min(axis=1))
+    return out
+
+
+class RMSDEngine:
+    """Per-process cache of parsed structures and atom mappings."""
+
+    def __init__(self, method="index"):
+        if method not in METHODS:
+            raise ValueError(f"Unknown RMSD method {method!r}, expected one of {METHODS}")
+        self.method = method
+        self._references = {}
+        self._mappings = {}
+
+    def load(self, path):
+        ligand = read_ligand(path, pymol_order=self.method == "index")
+        if self.method == "symmetry":
+            if ligand.bonds is None:
+                perceive_bonds(ligand)
+            ligand = ligand.heavy()
+        return ligand
+
+    def reference(self, path):
+        if path not in self._references:
+            self._references[path] = self.load(path)
+        return self._references[path]
+
+    def mappings(self, reference, pose):
+        key = (topology_key(reference), topology_key(pose))
+        if key not in self._mappings:
+            self._mappings[key] = atom_mappings(reference, pose)
+        return self._mappings[key]
+
+    def rmsd_group(self, ref_path, pose_paths):
+        """Return [(pose_path, rmsd or exception)] for every pose of one reference."""
+        try:
+            reference = self.reference(ref_path)
+        except Exception as e:
+            return [(pose_path, e) for pose_path in pose_paths]
+
+        results = {}
+        # Poses scored against the same reference array are stacked into one batch
+        batches = defaultdict(list)
+        for pose_path in pose_paths:
+            try:
+                pose = self.load(pose_path)
+                if self.method == "index":
+                    n = min(len(reference.coords), len(pose.coords))
+                    batches[n].append((pose_path, pose.coords[:n]))
+                else:
+                    # Map first, so a pose that cannot be mapped fails on its own
+                    self.mappings(reference, pose)
+                    batches[topology_key(pose)].append((pose_path, pose.coords))
+            except Exception as e:
+                results[pose_path] = e
+
+        for key, batch in batches.items():
+            if self.method == "index":
+                ref_coords = reference.coords[:key]
+            else:
+                ref_coords = reference.coords[self._mappings[(topology_key(reference), key)]]
+            stack = np.stack([coords for _, coords in batch])
+            for (pose_path, _), rmsd in zip(batch, batched_rmsd(ref_coords, stack)):
+                results[pose_path] = float(rmsd)
+
+        return [(pose_path, results[pose_path]) for pose_path in pose_paths]
+
+
+_engines = {}
+
+
+def _rmsd_group(method, ref_path, pose_paths):
+    if method not in _engines:
+        _engines[method] = RMSDEngine(method)
+    return ref_path, _engines[method].rmsd_group(ref_path, pose_paths)
+
+
+def calculate_rmsd(pairs, method="index", processes=None, group_size=500):
+    """Compute the RMSD for every (reference_path, pose_path) pair.
+
+    Pairs are grouped by reference (at most group_size poses per task), so
+    each reference is parsed once per worker and its poses are scored
+    together. Returns {(reference_path, pose_path): rmsd or the exception
+    raised for that pair}, in input order. processes=1 runs in the calling
+    process.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown RMSD method {method!r}, expected one of {METHODS}")
+    pairs = [tuple(pair) for pair in pairs]
+    poses_by_ref = defaultdict(list)
+    for ref_path, pose_path in pairs:
+        poses_by_ref[ref_path].append(pose_path)
+    tasks = [
+        (ref_path, poses[i:i + group_size])
+        for ref_path, poses in poses_by_ref.items()
+        for i in range(0, len(poses), group_size)
+    ]
+
+    if processes == 1 or len(tasks) <= 1:
+        outputs = [_rmsd_group(method, ref_path, poses) for ref_path, poses in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            outputs = list(executor.map(
+                _rmsd_group, [method] * len(tasks), [t[0] for t in tasks], [t[1] for t in tasks]
+            ))
+
+    results = {}
+    for ref_path, group in outputs:
+        for pose_path, rmsd in group:
+            results[(ref_path, pose_path)] = rmsd
+    return {pair: results[pair] for pair in pairs}
@@ -0,0 +1,155 @@
+"""Streaming extraction of SD tags (data items) from docking output files.
+
+The score extractors used to read every file into one string (decompressing
+.gz files in memory) and run one regular expression per tag over it, which
+only finds the first pose of a multi-pose file. iter_sdf_records reads a
+plain or gzipped SDF file in blocks in one pass and yields the selected
+tags of every record. extract_sdf_tags spreads the files over a process pool
+and returns one column per field (File, Pose, tags), so the result goes
+straight into a DataFrame without building a dict per row.
+"""
+import os
+import re
+import gzip
+from concurrent.futures import ProcessPoolExecutor
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def open_sdf(path):
+    """Open a plain or gzipped SDF file for text reading (detected from the content)."""
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, "rt", errors="replace")
+    return open(path, "r", errors="replace")
+
+
+# "> <name> ..." data header and the first line of its value
+TAG_RE = re.compile(r"^>[^<\n]*<([^>\n]+)>[^\n]*\n([^\n]*)", re.M)
+
+
+def iter_sdf_text(f, block_size=1 << 20):
+    """Yield the text of every record (without its "$$$$" line) from an open SDF file.
+
+    The file is read in blocks, so only one block and the record that spans
+    it are held in memory, however many poses the file contains.
+    """
+    buffer, first = "", True
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        parts = (buffer + block).split("\n$$$$")
+        buffer = parts.pop()
+        for part in parts:
+            # Drop the rest of the previous "$$$$" line
+            yield part if first else part[part.find("\n") + 1:]
+            first = False
+    if not first:
+        buffer = buffer[buffer.find("\n") + 1:] if "\n" in buffer else ""
+    if buffer.strip():
+        # Last record without a closing $$$$
+        yield buffer
+
+
+def iter_sdf_records(path, tags=None):
+    """Yield (title, {tag: value}) for every record of an SDF file.
+
+    Only the tags in `tags` are kept (all tags if None). A value is the first
+    line of its data block and the first block of a tag wins, as in the
+    regular expressions this replaces.
+    """
+    tags = None if tags is None else set(tags)
+    with open_sdf(path) as f:
+        for record in iter_sdf_text(f):
+            values = {}
+            for name, value in TAG_RE.findall(record):
+                if (tags is None or name in tags) and name not in values:
+                    values[name] = value.rstrip("\r")
+            yield record.partition("\n")[0].rstrip("\r"), values
+
+
+def _extract_files(paths, tags):
+    """Columns File, Pose, Title and one per tag for a group of files."""
+    columns = {"File": [], "Pose": [], "Title": []}
+    columns.update({tag: [] for tag in tags})
+    errors = []
+    for path in paths:
+        name = os.path.basename(path)
+        try:
+            # A file that fails half-way (e.g. truncated .gz) contributes no rows
+            records = list(iter_sdf_records(path, tags))
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            errors.append((path, str(e)))
+            continue
+        for pose, (title, values) in enumerate(records, start=1):
+            columns["File"].append(name)
+            columns["Pose"].append(pose)
+            columns["Title"].append(title)
+            for tag in tags:
+                columns[tag].append(values.get(tag))
+    return columns, errors
+
+
+def _to_numbers(values):
+    """Convert a column of strings to floats if every present value is numeric."""
+    try:
+        return [None if v is None or v == "" else float(v) for v in values]
+    except ValueError:
+        return values
+
+
+def extract_sdf_tags(paths, tags, processes=None, chunk_size=256, numeric=True):
+    """Extract `tags` from every record of every file in `paths`.
+
+    Files are read in groups of chunk_size per task on a process pool
+    (processes=1 runs in the calling process). Returns (columns, errors):
+    columns maps File, Pose (1-based record index in the file), Title and
+    each tag to a list with one entry per record, in input file order;
+    errors lists (path, message) for files that could not be read. Tag
+    columns whose values are all numeric are converted to floats.
+    """
+    paths = [str(p) for p in paths]
+    tags = list(tags)
+    groups = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+
+    if processes == 1 or len(groups) <= 1:
+        outputs = [_extract_files(group, tags) for group in groups]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            outputs = list(executor.map(_extract_files, groups, [tags] * len(groups)))
+
+    columns = {"File": [], "Pose": [], "Title": []}
+    columns.update({tag: [] for tag in tags})
+    errors = []
+    for group_columns, group_errors in outputs:
+        for key, values in group_columns.items():
+            columns[key].extend(values)
+        errors.extend(group_errors)
+
+    if numeric:
+        for tag in tags:
+            columns[tag] = _to_numbers(columns[tag])
+    return columns, errors
+
+
+def list_sdf_files(folder, suffixes=(".sdf", ".sdf.gz")):
+    """Sorted paths of the SDF files (plain or gzipped) directly in a folder."""
+    with os.scandir(folder) as entries:
+        return sorted(
+            entry.path for entry in entries
+            if entry.is_file() and entry.name.endswith(tuple(suffixes))
+        )
+
+
+def write_table(columns, output_file):
+    """Write extracted columns as Parquet (.parquet) or CSV (anything else)."""
+    import pandas as pd
+
+    df = pd.DataFrame(columns)
+    if str(output_file).endswith(".parquet"):
+        df.to_parquet(output_file, index=False)
+    else:
+        df.to_csv(output_file, index=False)
+    return df
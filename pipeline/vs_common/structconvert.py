@@ -0,0 +1,193 @@
+"""Batched structconvert.py conversion of single-structure .mae files.
+
+Starting $SCHRODINGER/run costs several seconds, so converting one ligand per
+call is dominated by startup time. convert_mae_files concatenates a chunk of
+single-structure .mae files into one multi-structure file, converts it with a
+single structconvert.py call and splits the result back into one output file
+per input. If the batched call fails, or its output cannot be matched back to
+the inputs, the chunk is split in half and retried, so a bad structure only
+fails itself and costs a few extra calls instead of one call per file.
+"""
+import os
+import shutil
+import logging
+import tempfile
+import subprocess
+
+from .mae_reader import iter_mae_blocks, read_mae_header, read_mae_block
+
+BACKENDS = ("schrodinger", "rdkit")
+
+logger = logging.getLogger(__name__)
+
+
+def split_sdf(path):
+    """Return the raw records of a multi-structure .sdf file."""
+    records, current = [], []
+    with open(path, "rb") as f:
+        for line in f:
+            current.append(line)
+            if line.rstrip(b"\r\n") == b"$$$$":
+                records.append(b"".join(current))
+                current = []
+    if any(line.strip() for line in current):
+        records.append(b"".join(current))
+    return records
+
+
+def split_mol2(path):
+    """Return the raw records of a multi-structure .mol2 file."""
+    records, current = [], None
+    with open(path, "rb") as f:
+        for line in f:
+            if line.startswith(b"@<TRIPOS>MOLECULE"):
+                if current is not None:
+                    records.append(b"".join(current))
+                current = [line]
+            elif current is not None:
+                current.append(line)
+    if current is not None:
+        records.append(b"".join(current))
+    return records
+
+
+def record_title(record, ext):
+    lines = record.splitlines()
+    index = 1 if ext == ".mol2" else 0
+    if len(lines) <= index:
+        return None
+    return lines[index].decode("utf-8", errors="replace").strip()
+
+
+SPLITTERS = {".sdf": split_sdf, ".mol2": split_mol2}
+
+
+def write_mae_chunk(mae_files, chunk_file):
+    """Concatenate single-structure .mae files into chunk_file.
+
+    Returns the title of every structure, in order. Raises ValueError if an
+    input does not hold exactly one structure, since the output could not be
+    mapped back to it.
+    """
+    titles = []
+    with open(chunk_file, "wb") as out:
+        out.write(read_mae_header(mae_files[0]))
+        for mae_file in mae_files:
+            blocks = list(iter_mae_blocks(mae_file))
+            if len(blocks) != 1:
+                raise ValueError(f"{mae_file} holds {len(blocks)} structures, expected 1")
+            with open(mae_file, "rb") as src:
+                out.write(read_mae_block(src, blocks[0].offset, blocks[0].length))
+            titles.append(blocks[0].title)
+    return titles
+
+
+def _write_atomic(path, data):
+    tmp_file = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+    os.replace(tmp_file, path)
+
+
+def convert_each(run_path, jobs):
+    """Convert [(mae_file, out_file), ...] with one structconvert.py call per file."""
+    results = {}
+    for mae_file, out_file in jobs:
+        try:
+            subprocess.run([run_path, "structconvert.py", mae_file, out_file], check=True)
+            results[mae_file] = None
+        except (subprocess.CalledProcessError, OSError) as e:
+            results[mae_file] = e
+    return results
+
+
+def convert_chunk(run_path, jobs, workdir=None):
+    """Convert [(mae_file, out_file), ...] with a single structconvert.py call.
+
+    All outputs must share one extension (.sdf or .mol2). Returns
+    {mae_file: None on success, otherwise the error}. A failed chunk is
+    bisected until the failing structures are isolated.
+    """
+    if not jobs:
+        return {}
+    ext = os.path.splitext(jobs[0][1])[1].lower()
+    if len(jobs) == 1 or ext not in SPLITTERS:
+        return convert_each(run_path, jobs)
+
+    tmp_dir = tempfile.mkdtemp(prefix=".structconvert_", dir=workdir)
+    try:
+        chunk_in = os.path.join(tmp_dir, "chunk.mae")
+        chunk_out = os.path.join(tmp_dir, "chunk" + ext)
+        titles = write_mae_chunk([mae_file for mae_file, _ in jobs], chunk_in)
+        subprocess.run([run_path, "structconvert.py", chunk_in, chunk_out], check=True)
+
+        records = SPLITTERS[ext](chunk_out)
+        if len(records) != len(jobs):
+            raise ValueError(f"structconvert.py wrote {len(records)} structures for {len(jobs)} inputs")
+        for title, record in zip(titles, records):
+            if title is not None and record_title(record, ext) != title.strip():
+                raise ValueError(f"output order does not match input (expected {title!r})")
+
+        for (_, out_file), record in zip(jobs, records):
+            _write_atomic(out_file, record)
+        return {mae_file: None for mae_file, _ in jobs}
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        logger.warning(f"Batched conversion of {len(jobs)} files failed ({e}); splitting the chunk")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    half = len(jobs) // 2
+    results = convert_chunk(run_path, jobs[:half], workdir)
+    results.update(convert_chunk(run_path, jobs[half:], workdir))
+    return results
+
+
+def rdkit_mae_to_sdf(jobs):
+    """Convert [(mae_file, out_file.sdf), ...] in-process with RDKit."""
+    from rdkit import Chem
+
+    results = {}
+    for mae_file, out_file in jobs:
+        try:
+            mols = [mol for mol in Chem.MaeMolSupplier(mae_file) if mol is not None]
+            if not mols:
+                raise ValueError(f"RDKit could not read any structure from {mae_file}")
+            writer = Chem.SDWriter(out_file)
+            for mol in mols:
+                writer.write(mol)
+            writer.close()
+            results[mae_file] = None
+        except Exception as e:
+            results[mae_file] = e
+    return results
+
+
+def convert_mae_files(jobs, run_path=None, backend="schrodinger", rdkit_fallback=False, workdir=None):
+    """Convert a chunk of [(mae_file, out_file), ...] and return {mae_file: error or None}.
+
+    backend "schrodinger" batches the chunk through structconvert.py at
+    run_path. backend "rdkit" converts in-process and only supports .sdf
+    output. With rdkit_fallback, .sdf outputs that structconvert.py failed to
+    produce are retried with RDKit.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown conversion backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "rdkit":
+        unsupported = [out_file for _, out_file in jobs if not out_file.lower().endswith(".sdf")]
+        if unsupported:
+            raise ValueError(f"The rdkit backend only writes .sdf files, not {unsupported[0]}")
+        return rdkit_mae_to_sdf(jobs)
+
+    results = convert_chunk(run_path, jobs, workdir)
+    if rdkit_fallback:
+        retry = [(mae_file, out_file) for mae_file, out_file in jobs
+                 if results[mae_file] is not None and out_file.lower().endswith(".sdf")]
+        for mae_file, error in rdkit_mae_to_sdf(retry).items():
+            if error is None:
+                results[mae_file] = None
+    return results
+
+
+def chunked(items, size):
+    size = max(1, int(size))
+    return [items[i:i + size] for i in range(0, len(items), size)]